@@ -0,0 +1,241 @@
+"""
+Benchmark of the discovery pipeline. One JSON line per (dataset, engine, stage) is appended to --out, e.g.
+    python benchmark.py --datasets relation tax_100 flights --scales 1 10 --engines sqlite numpy --out bench.jsonl
+Rule sets are hashed and compared with --baseline (written with --save-baseline), so results of two commits can be diffed.
+Synthetic datasets: <name>x<k> repeats the rows k times, <name>w<k> adds k shuffled copies of every column,
+zipf<rows>x<cols> draws skewed values.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+import contextlib
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from rule import Rule, new_executor
+from greedy_rule_find import (all_structual_predicates, all_constant_predicates, first_generation, next_generation,
+    CandidateGenerator, CandidatePruner, rule_find)
+from topk_rule_find import topk_rule_find
+
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testdata")
+
+def load_dataset(name:str, seed:int = 0)->pd.DataFrame:
+    if name.startswith("zipf"):
+        rows, cols = (int(v) for v in name[4:].split("x"))
+        return zipf_table(rows, cols, seed=seed)
+    for sep in ("x", "w"):
+        base, _, k = name.rpartition(sep)
+        if base and k.isdigit():
+            data = load_dataset(base, seed)
+            return scale_rows(data, int(k)) if sep == "x" else widen(data, int(k), seed)
+    return pd.read_csv(os.path.join(TESTDATA, name + ".csv"), dtype=str)
+
+def scale_rows(data:pd.DataFrame, k:int)->pd.DataFrame:
+    # same value distribution, k times the rows and k^2 times the tuple pairs
+    return pd.concat([data] * k, ignore_index=True)
+
+def widen(data:pd.DataFrame, k:int, seed:int = 0)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns = {col:data[col] for col in data.columns}
+    for i in range(k):
+        for col in data.columns:
+            columns[f"{col}_w{i}"] = data[col].values[rng.permutation(len(data))]
+    return pd.DataFrame(columns)
+
+def zipf_table(rows:int, cols:int, a:float = 1.5, cardinality:int = 1000, seed:int = 0)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for i in range(cols):
+        values = np.minimum(rng.zipf(a, rows), cardinality)
+        columns[f"c{i}"] = [f"v{v}" for v in values]
+    # a dependent column so that rules exist
+    columns[f"c{cols}"] = [f"d{v}" for v in columns["c0"]]
+    return pd.DataFrame(columns)
+
+def reset_peak_rss()->bool:
+    """
+    make the peak RSS start again from the current RSS, Linux only. False when the peak can not be reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb()->Optional[float]:
+    """
+    peak RSS since the last reset_peak_rss, or of the whole process when it could not be reset
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / (1 << 10)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+def ruleset_hash(rules:List[Rule])->str:
+    lines = sorted(f"{sorted(str(x) for x in rule.Xs)} -> {rule.y} {rule.rowSize} {rule.xSupp} {rule.supp}" for rule in rules)
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+def git_commit()->Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Bench:
+    def __init__(self, out:str, baseline:Dict[str, str], verbose:bool = False) -> None:
+        self.out = out
+        self.baseline = baseline
+        self.verbose = verbose
+        self.commit = git_commit()
+        self.hashes:Dict[str, str] = {}
+
+    @contextlib.contextmanager
+    def silenced(self):
+        # executors and the finders print their progress
+        if self.verbose:
+            yield
+            return
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+    def run(self, dataset:str, data:pd.DataFrame, engine:str, stage:str, func:Callable[[], Tuple[List[Rule], Optional[int]]])->List[Rule]:
+        """
+        func returns the rules to hash and the number of rules evaluated (None when unknown)
+        """
+        # the peak of this stage alone, not of the stages before it
+        scope = "stage" if reset_peak_rss() else "process"
+        with self.silenced():
+            start = time.perf_counter()
+            rules, evaluated = func()
+            seconds = time.perf_counter() - start
+        key = f"{dataset}/{engine}/{stage}"
+        digest = ruleset_hash(rules)
+        self.hashes[key] = digest
+        expected = self.baseline.get(key)
+        record = {"commit":self.commit, "dataset":dataset, "rows":len(data), "columns":len(data.columns), "engine":engine, "stage":stage,
+            "seconds":round(seconds, 6), "rules":len(rules), "evaluated":evaluated, "rules_per_s":round(evaluated / seconds, 3) if evaluated is not None and seconds > 0 else None,
+            "peak_rss_mb":peak_rss_mb(), "peak_rss_scope":scope, "ruleset":digest, "baseline":"missing" if expected is None else ("same" if expected == digest else "changed")}
+        line = json.dumps(record, ensure_ascii=False)
+        print(line)
+        if self.out is not None:
+            with open(self.out, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return rules
+
+def bench_dataset(bench:Bench, dataset:str, data:pd.DataFrame, engine:str, args:argparse.Namespace):
+    cover, confidence = args.cover, args.confidence
+    stages = set(args.stages)
+    state = {}
+    def constants():
+        state["cps_s"] = all_constant_predicates(data, singleLine=True, threshold=args.constant_threshold)
+        state["cps_m"] = all_constant_predicates(data, singleLine=False, threshold=args.constant_threshold)
+        state["sps"] = all_structual_predicates(data)
+        return [], len(state["cps_s"]) + len(state["cps_m"]) + len(state["sps"])
+    def first():
+        state["first"] = first_generation(state["sps"], state["cps_m"]) + first_generation(constant_predicates=state["cps_s"])
+        return [], len(state["first"])
+    bench.run(dataset, data, engine, "all_constant_predicates", constants)
+    bench.run(dataset, data, engine, "first_generation", first)
+    with bench.silenced():
+        state["executor"] = new_executor(data, engine=engine)
+    if "execute" in stages:
+        def execute():
+            rules = [Rule(Xs = r.Xs, y = r.y) for r in state["first"]]
+            state["executor"].execute(rules)
+            state["evaluated"] = rules
+            return [r for r in rules if r.ok(cover, confidence)], len(rules)
+        bench.run(dataset, data, engine, "execute", execute)
+    if "execute_parallel" in stages:
+        def execute_parallel():
+            rules = [Rule(Xs = r.Xs, y = r.y) for r in state["first"]]
+            state["executor"].execute_parallel(rules, workerNum=args.workers)
+            state["evaluated"] = rules
+            return [r for r in rules if r.ok(cover, confidence)], len(rules)
+        bench.run(dataset, data, engine, "execute_parallel", execute_parallel)
+    if "next_generation" in stages and "evaluated" in state:
+        def next_gen():
+            rules = state["evaluated"]
+            found = [r for r in rules if r.ok(cover, confidence)]
+            fathers = [r for r in rules if not r.ok(cover, confidence) and r.reproducible(cover)]
+            if len(fathers) == 0:
+                return [], 0
+            pruner = CandidatePruner(cover, confidence)
+            pruner.record(rules)
+            # single-line and multi-line fathers are extended by their own predicates
+            children:List[Rule] = []
+            for singleLine in (True, False):
+                group = [r for r in fathers if r.singleLine() == singleLine]
+                if len(group) > 0:
+                    generator = CandidateGenerator(constant_predicates=state["cps_s"]) if singleLine else CandidateGenerator(state["sps"], state["cps_m"])
+                    foundOfGroup = [r for r in found if r.singleLine() == singleLine]
+                    children.extend(next_generation(group, state["executor"], foundOfGroup, foundOfGroup, cover=cover, generator=generator, pruner=pruner))
+            return [], len(children)
+        bench.run(dataset, data, engine, "next_generation", next_gen)
+    if "rule_find" in stages:
+        def find():
+            evaluated:List[Rule] = []
+            rules = rule_find({dataset:data}, cover=cover, confidence=confidence, constant_threshold=args.constant_threshold,
+                max_levelwise_depth=args.depth, engine=engine, evaluated=evaluated)
+            return rules, len(evaluated)
+        bench.run(dataset, data, engine, "rule_find", find)
+    if "topk_rule_find" in stages:
+        def topk():
+            rules = topk_rule_find(data, state["sps"], state["cps_m"], topk=args.topk, cover=cover, confidence=confidence, engine=engine, best_first=True)
+            # evaluated by topk_rule_find's own executor, not counted
+            return rules, None
+        bench.run(dataset, data, engine, "topk_rule_find", topk)
+    with bench.silenced():
+        del state["executor"]
+
+STAGES = ["execute", "execute_parallel", "next_generation", "rule_find", "topk_rule_find"]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the rule discovery pipeline, one JSON line per stage")
+    parser.add_argument("--datasets", nargs="+", default=["relation", "tax_100", "flights"])
+    parser.add_argument("--scales", nargs="+", type=int, default=[1], help="row multipliers, the scaled dataset is <name>x<k>")
+    parser.add_argument("--engines", nargs="+", default=["sqlite", "numpy"])
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--cover", type=float, default=0.05)
+    parser.add_argument("--confidence", type=float, default=0.9)
+    parser.add_argument("--constant-threshold", type=float, default=0.05)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--topk", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON lines file the records are appended to")
+    parser.add_argument("--baseline", default=None, help="JSON file of rule set hashes to compare with")
+    parser.add_argument("--save-baseline", default=None, help="write the rule set hashes of this run to this JSON file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    bench = Bench(args.out, baseline, args.verbose)
+    for name in args.datasets:
+        for scale in args.scales:
+            dataset = name if scale == 1 else f"{name}x{scale}"
+            data = load_dataset(dataset, args.seed)
+            for engine in args.engines:
+                bench_dataset(bench, dataset, data, engine, args)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(bench.hashes, f, indent=1, sort_keys=True)
@@ -0,0 +1,61 @@
+"""
+Checkpoints of the level-wise search and a buffered writer of found rules.
+A checkpoint is the pickled state after the last complete level, replaced atomically so a crash leaves the previous one.
+"""
+
+import os
+import pickle
+import threading
+from typing import List, Optional
+from rule import Rule
+
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(path:str, state:dict)->None:
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump({"version":CHECKPOINT_VERSION, **state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(path:str)->Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise Exception(f"Checkpoint {path} has version {state.get('version')}, expected {CHECKPOINT_VERSION}")
+    return state
+
+class RuleWriter:
+    """
+    appends rule.ree() lines to a text file through a large buffer. An instance is a valid on_found callback of rule_find
+    """
+    def __init__(self, path:str, mode:str = "a", buffer_size:int = 1 << 20, statistics:bool = True) -> None:
+        self.file = open(path, mode, buffering=buffer_size, encoding="utf-8")
+        self.statistics = statistics
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, rules:List[Rule])->None:
+        lines = [RuleWriter.line(rule, self.statistics) for rule in rules]
+        with self.lock:
+            self.file.writelines(lines)
+            self.written += len(lines)
+
+    @staticmethod
+    def line(rule:Rule, statistics:bool = True)->str:
+        t0_tab, t1_tab = rule.tables if rule.tables is not None else ("t", None)
+        return rule.ree(t0_tab, t1_tab, statistics=statistics) + "\n"
+
+    def flush(self)->None:
+        with self.lock:
+            self.file.flush()
+
+    def close(self)->None:
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self)->'RuleWriter':
+        return self
+
+    def __exit__(self, *exc)->None:
+        self.close()
@@ -0,0 +1,38 @@
+"""
+Fixtures shared by the test modules
+"""
+
+import os
+import sys
+import subprocess
+import textwrap
+from typing import Callable
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture
+def testdata()->Callable[[str], str]:
+    """
+    absolute path of a file of testdata
+    """
+    return lambda name:os.path.join(HERE, "testdata", name)
+
+@pytest.fixture
+def read_table(testdata)->Callable[[str], pd.DataFrame]:
+    """
+    a csv of testdata read as str, as the finders expect
+    """
+    return lambda name:pd.read_csv(testdata(name), dtype=str)
+
+@pytest.fixture
+def run_python()->Callable[[str], None]:
+    """
+    run code in a fresh interpreter from the repository root, e.g. to get other predicate ids and column bits
+    """
+    def run(code:str)->None:
+        done = subprocess.run([sys.executable, "-c", textwrap.dedent(code)], cwd=HERE, capture_output=True, text=True)
+        if done.returncode != 0:
+            pytest.fail(done.stderr[-4000:])
+    return run
@@ -0,0 +1,125 @@
+"""
+Single-line rules "Xs ^ constants -> t0.col = 'v'" mined by decision trees, see decision_tree in the README pseudocode.
+One tree over one-hot frequent constants replaces the level-wise enumeration of constant Xs of a column,
+every leaf becomes a candidate whose xSupp/supp are counted exactly by the executor.
+"""
+
+import math
+from typing import Callable, Dict, List, Tuple, Union
+import numpy as np
+import pandas as pd
+from rule import Predicate, Rule
+from encoded_table import EncodedTable, NULL_CODE
+from pair_counter import COMPARE
+
+def _mask(table:EncodedTable, xs:List[Predicate])->np.ndarray:
+    mask = np.ones(len(table), dtype=bool)
+    for x in xs:
+        if x.isRange():
+            mask &= COMPARE[x.operator](table.values(x.t0_col), float(x.constant))
+            continue
+        codes = table.codes[x.t0_col]
+        code = table.code_of(x.t0_col, x.constant)
+        if x.operator == '=':
+            mask &= codes == code
+        elif x.operator == '<>':
+            mask &= (codes != code) & (codes != NULL_CODE)
+        else:
+            raise Exception('NoImpl ' + x.operator)
+    return mask
+
+def _path_rules(clf, features:List[Predicate], labels:np.ndarray, xs:List[Predicate], y_col:str)->Dict[int, Rule]:
+    """
+    leaf id -> xs ^ (predicates on the way to the leaf) -> t0.y_col = majority of the leaf.
+    Feature <= 0.5 is col <> v, feature > 0.5 is col = v. The rows where col is NULL go left with the feature 0
+    but col <> v does not hold on them, so a leaf may hold rows its rule does not cover
+    """
+    tree = clf.tree_
+    rules:Dict[int, Rule] = {}
+    stack:List[Tuple[int, List[Predicate]]] = [(0, [])]
+    while len(stack) > 0:
+        node, path = stack.pop()
+        left, right = tree.children_left[node], tree.children_right[node]
+        if left == right: # leaf
+            label = clf.classes_[int(np.argmax(tree.value[node][0]))]
+            if label == NULL_CODE or len(xs) + len(path) == 0:
+                continue
+            # col = v makes every col <> w on the same path redundant
+            equal = {p.t0_col for p in path if p.operator == '='}
+            path = [p for p in path if p.operator == '=' or p.t0_col not in equal]
+            rules[node] = Rule(Xs = xs + path, y = Predicate.newConst0(y_col, str(labels[label])))
+            continue
+        feature = features[tree.feature[node]]
+        stack.append((right, path + [feature]))
+        stack.append((left, path + [Predicate.newConst0(feature.t0_col, feature.constant, '<>')]))
+    return rules
+
+def tree_rules(table:Union[pd.DataFrame, EncodedTable], y_col:str, constant_predicates:List[Tuple[Predicate]],
+        evaluate:Callable[[List[Rule]], List[Rule]], cover:float, confidence:float, xs:List[Predicate] = [],
+        rows:np.ndarray = None, x_column:Callable[[str], bool] = lambda c:True, max_depth:int = 8)->Tuple[List[Rule], np.ndarray]:
+    """
+    fit one tree on the rows satisfying xs (and the bool mask rows when given) labelled by y_col.
+    Returns the ok rules among the leaves and the mask of those rows covered by no ok rule, for the next fit.
+    The rows are those on which the Xs of the rules hold, not those of the leaves, which also hold the NULL rows of a col <> v split
+    """
+    from sklearn.tree import DecisionTreeClassifier
+
+    if not isinstance(table, EncodedTable):
+        table = EncodedTable.encode(table)
+    mask = _mask(table, xs)
+    if rows is not None:
+        mask &= rows
+    features = [cp[-1] for cp in constant_predicates if cp[-1].t0_col != y_col and x_column(cp[-1].t0_col)
+        and cp[-1].operator == '=' and all(cp[-1].compatible(x) for x in xs)]
+    # a leaf holds all the rows its rule is true on, so it needs cover * len(table) of them
+    min_leaf = max(1, math.ceil(cover * len(table)))
+    selected = np.flatnonzero(mask)
+    counts = table.value_counts(y_col)
+    if len(features) == 0 or len(selected) < min_leaf or len(counts) == 0 or counts.max() < min_leaf:
+        return [], mask
+
+    indicators = np.empty((len(selected), len(features)), dtype=np.uint8)
+    for j, f in enumerate(features):
+        indicators[:, j] = table.codes[f.t0_col][selected] == table.code_of(f.t0_col, f.constant)
+    target = table.codes[y_col][selected]
+    clf = DecisionTreeClassifier(max_depth=max_depth, min_samples_leaf=min_leaf, random_state=0)
+    clf.fit(indicators, target)
+
+    leaves = _path_rules(clf, features, table.dictionaries[y_col], xs, y_col)
+    evaluate(list(leaves.values()))
+    found = [rule for rule in leaves.values() if rule.ok(cover, confidence)]
+    uncovered = mask.copy()
+    for rule in found:
+        uncovered &= ~_mask(table, rule.Xs)
+    return found, uncovered
+
+def tree_rule_find(table:Union[pd.DataFrame, EncodedTable], constant_predicates:List[Tuple[Predicate]],
+        evaluate:Callable[[List[Rule]], List[Rule]], cover:float, confidence:float,
+        x_column:Callable[[str], bool] = lambda c:True, y_column:Callable[[str], bool] = lambda c:True,
+        max_depth:int = 8, rounds:int = 2, xs:List[Predicate] = [])->List[Rule]:
+    """
+    single-line rules "xs ^ constants -> y" of every y column. Each round fits a new tree on the rows left uncovered by the previous one
+    """
+    if not isinstance(table, EncodedTable):
+        table = EncodedTable.encode(table)
+    found:Dict[tuple, Rule] = {}
+    for y_col in table.columns:
+        if not y_column(y_col) or any(y_col in x.columns for x in xs):
+            continue
+        rows = None
+        for _ in range(rounds):
+            rules, rows = tree_rules(table, y_col, constant_predicates, evaluate, cover, confidence, xs, rows, x_column, max_depth)
+            for rule in rules:
+                found.setdefault((frozenset(rule.Xs), rule.y), rule)
+            if len(rules) == 0:
+                break
+    return list(found.values())
+
+if __name__ == '__main__':
+    from rule import new_executor
+    from greedy_rule_find import all_constant_predicates
+    data = pd.read_csv("testdata/relation.csv", dtype=str)
+    cps = all_constant_predicates(data, singleLine=True, threshold=0.1)
+    re = new_executor(data)
+    for rule in tree_rule_find(data, cps, re.execute, cover=0.1, confidence=0.8):
+        print(rule)
@@ -0,0 +1,363 @@
+"""
+Dictionary-encoded, column-oriented copy of a table.
+Every column is turned into int32 codes once (-1 stands for NULL) so that predicates can be evaluated with numpy masks.
+"""
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+from concurrent.futures import ThreadPoolExecutor
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+NULL_CODE = -1
+# code of a constant which never appears in the column
+ABSENT_CODE = -2
+# leading number of a string, the part sqlite's CAST(... AS REAL) reads
+REAL_PREFIX = r"^\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+
+class EncodedTable:
+    def __init__(self, columns:List[str], codes:Dict[str, np.ndarray], dictionaries:Dict[str, np.ndarray], rowSize:int) -> None:
+        self.columns = columns
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.rowSize = rowSize
+        # packed row bitmaps of (column, code), shared by everyone evaluating t0.col = 'v' on this table
+        self.bitmaps:Dict[Tuple[str, int], np.ndarray] = {}
+        self._lookups:Dict[str, Dict[str, int]] = {}
+        self._translations:Dict[tuple, np.ndarray] = {}
+        # column -> number of rows per code, NULL excluded
+        self._counts:Dict[str, np.ndarray] = {}
+        # column -> float value of every row (NaN for NULL), None when the column is not numeric
+        self._values:Dict[str, Optional[np.ndarray]] = {}
+        # column -> float value of every row as sqlite casts it (NaN for NULL)
+        self._reals:Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def encode(table:pd.DataFrame, workerNum:int = 1)->'EncodedTable':
+        def encode_column(col:str)->Tuple[np.ndarray, np.ndarray]:
+            cs, uniques = pd.factorize(table[col], sort=False)
+            return cs.astype(np.int32), np.asarray(uniques, dtype=object)
+        columns = list(table.columns)
+        encoded = _map(encode_column, columns, workerNum)
+        codes = {col:cs for col, (cs, _) in zip(columns, encoded)}
+        dictionaries = {col:uniques for col, (_, uniques) in zip(columns, encoded)}
+        return EncodedTable(columns, codes, dictionaries, len(table))
+
+    @staticmethod
+    def from_file(path:str, store_dir:str = None, chunksize:int = 1 << 20, columns:List[str] = None)->'EncodedTable':
+        """
+        encode a CSV (read as str) or Parquet file chunk by chunk. Codes are appended to files in store_dir and memory-mapped,
+        so peak memory is one chunk plus the dictionaries of distinct values instead of the whole string table
+        """
+        if store_dir is None:
+            store_dir = tempfile.mkdtemp(prefix="grf_enc_")
+        os.makedirs(store_dir, exist_ok=True)
+        lookups:Dict[str, Dict[str, int]] = {}
+        files = {}
+        rowSize = 0
+        try:
+            for chunk in _read_chunks(path, chunksize, columns):
+                if columns is None:
+                    columns = list(chunk.columns)
+                for i, col in enumerate(columns):
+                    if col not in files:
+                        lookups[col] = {}
+                        files[col] = open(os.path.join(store_dir, f"{i}.codes"), "wb")
+                    cs, uniques = pd.factorize(chunk[col], sort=False)
+                    lookup = lookups[col]
+                    # chunk-local codes -> global codes, new values get the next code. The tail maps NULL (-1) to itself
+                    mapping = np.array([lookup.setdefault(v, len(lookup)) for v in uniques] + [NULL_CODE], dtype=np.int32)
+                    files[col].write(mapping[cs].tobytes())
+                rowSize += len(chunk)
+        finally:
+            for f in files.values():
+                f.close()
+        if columns is None:
+            raise Exception(f"Cannot read columns of {path}")
+        for i, col in enumerate(columns):
+            if col not in files:
+                # no chunk at all
+                open(os.path.join(store_dir, f"{i}.codes"), "wb").close()
+            with open(os.path.join(store_dir, f"{i}.dict.json"), "w", encoding="utf-8") as f:
+                json.dump(list(lookups.get(col, {})), f, ensure_ascii=False)
+        with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"columns":columns, "rowSize":rowSize}, f, ensure_ascii=False)
+        return EncodedTable.open(store_dir)
+
+    # bumped whenever the store layout changes, so that old cache entries are not read
+    STORE_VERSION = 1
+
+    @staticmethod
+    def cached(source:Union[str, pd.DataFrame], cache_dir:str, columns:List[str] = None, chunksize:int = 1 << 20)->'EncodedTable':
+        """
+        open the store of source in cache_dir, building it on the first call.
+        Entries are keyed by a content hash of source and the column selection, the hash of a file is remembered by its path, size and mtime
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        key = _content_key(source, columns, cache_dir)
+        store_dir = os.path.join(cache_dir, key)
+        if os.path.exists(os.path.join(store_dir, "meta.json")):
+            return EncodedTable.open(store_dir)
+        building = tempfile.mkdtemp(prefix=f"{key}.", dir=cache_dir)
+        try:
+            if isinstance(source, str):
+                table = EncodedTable.from_file(source, building, chunksize, columns)
+            else:
+                table = EncodedTable.encode(source if columns is None else source[columns])
+                table.save(building)
+            for i, col in enumerate(table.columns):
+                np.save(os.path.join(building, f"{i}.counts.npy"), table.value_counts(col))
+            del table # release the memory maps before moving the files
+            try:
+                os.replace(building, store_dir)
+            except OSError:
+                # built concurrently by someone else
+                if not os.path.exists(os.path.join(store_dir, "meta.json")):
+                    raise
+        finally:
+            shutil.rmtree(building, ignore_errors=True)
+        return EncodedTable.open(store_dir)
+
+    def save(self, store_dir:str)->None:
+        """
+        write the layout read by open
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        for i, col in enumerate(self.columns):
+            np.asarray(self.codes[col], dtype=np.int32).tofile(os.path.join(store_dir, f"{i}.codes"))
+            with open(os.path.join(store_dir, f"{i}.dict.json"), "w", encoding="utf-8") as f:
+                json.dump([str(v) for v in self.dictionaries[col]], f, ensure_ascii=False)
+        with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"columns":self.columns, "rowSize":self.rowSize}, f, ensure_ascii=False)
+
+    @staticmethod
+    def open(store_dir:str)->'EncodedTable':
+        """
+        memory-map a table written by from_file or save, value counts saved by cached are memory-mapped too
+        """
+        with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        columns:List[str] = meta["columns"]
+        rowSize:int = meta["rowSize"]
+        codes = {}
+        dictionaries = {}
+        for i, col in enumerate(columns):
+            if rowSize > 0:
+                codes[col] = np.memmap(os.path.join(store_dir, f"{i}.codes"), dtype=np.int32, mode='r', shape=(rowSize,))
+            else:
+                codes[col] = np.zeros(0, dtype=np.int32)
+            with open(os.path.join(store_dir, f"{i}.dict.json"), encoding="utf-8") as f:
+                values = json.load(f)
+            dictionaries[col] = np.empty(len(values), dtype=object)
+            dictionaries[col][:] = values
+        table = EncodedTable(columns, codes, dictionaries, rowSize)
+        for i, col in enumerate(columns):
+            counts = os.path.join(store_dir, f"{i}.counts.npy")
+            if os.path.exists(counts):
+                table._counts[col] = np.load(counts, mmap_mode='r')
+        return table
+
+    def __len__(self) -> int:
+        return self.rowSize
+
+    def value_counts(self, col:str)->np.ndarray:
+        """
+        number of rows holding each code of col
+        """
+        counts = self._counts.get(col)
+        if counts is None:
+            codes = self.codes[col]
+            counts = np.bincount(codes[codes != NULL_CODE], minlength=len(self.dictionaries[col]))
+            self._counts[col] = counts
+        return counts
+
+    def numeric(self, col:str)->bool:
+        """
+        every value of col is a number (and there is at least one)
+        """
+        return self.values(col) is not None
+
+    def values(self, col:str)->Optional[np.ndarray]:
+        """
+        float value of every row of col, NaN for NULL. None when a value of col is not a finite number, as 'inf' which sqlite reads as 0.0
+        """
+        if col not in self._values:
+            dictionary = pd.to_numeric(pd.Series(self.dictionaries[col], dtype=object).astype(str), errors='coerce').to_numpy(dtype=np.float64)
+            if len(dictionary) == 0 or not np.isfinite(dictionary).all():
+                self._values[col] = None
+            else:
+                codes = self.codes[col]
+                self._values[col] = np.where(codes >= 0, dictionary[np.maximum(codes, 0)], np.nan)
+        return self._values[col]
+
+    def reals(self, col:str)->np.ndarray:
+        """
+        float value of every row of col as sqlite's CAST(col AS REAL), the leading number of the string or 0.0 without one. NaN for NULL
+        """
+        if col not in self._reals:
+            codes = self.codes[col]
+            prefixes = pd.Series(self.dictionaries[col], dtype=object).astype(str).str.extract(REAL_PREFIX, expand=False)
+            dictionary = np.append(prefixes.map(float, na_action='ignore').fillna(0.).to_numpy(dtype=np.float64), np.nan)
+            # NULL_CODE indexes the appended NaN
+            self._reals[col] = dictionary[codes]
+        return self._reals[col]
+
+    def code_of(self, col:str, constant:str)->int:
+        lookup = self._lookups.get(col)
+        if lookup is None:
+            lookup = {str(v):i for i, v in enumerate(self.dictionaries[col])}
+            self._lookups[col] = lookup
+        return lookup.get(constant, ABSENT_CODE)
+
+    def translate(self, col:str, other:'EncodedTable', other_col:str)->np.ndarray:
+        """
+        codes of other[other_col] expressed in the code space of self[col]
+        values missing in self[col] become ABSENT_CODE, NULL stays NULL_CODE
+        """
+        if other is self and col == other_col:
+            return self.codes[col]
+        key = (id(other), col, other_col)
+        translated = self._translations.get(key)
+        if translated is None:
+            mine = pd.Index([str(v) for v in self.dictionaries[col]])
+            mapping = mine.get_indexer([str(v) for v in other.dictionaries[other_col]])
+            mapping[mapping < 0] = ABSENT_CODE
+            # the appended tail maps NULL_CODE (index -1) to itself
+            mapping = np.append(mapping, NULL_CODE).astype(np.int32)
+            translated = mapping[other.codes[other_col]]
+            self._translations[key] = translated
+        return translated
+
+    def to_dataframe(self, start:int = 0, end:int = None)->pd.DataFrame:
+        """
+        decoded rows [start, end), the index holds the row numbers
+        """
+        end = self.rowSize if end is None else min(end, self.rowSize)
+        data = {}
+        for col in self.columns:
+            values = np.append(self.dictionaries[col], None)
+            data[col] = values[self.codes[col][start:end]]
+        return pd.DataFrame(data, columns=self.columns, index=pd.RangeIndex(start, end))
+
+    def take(self, rows:np.ndarray)->'EncodedTable':
+        """
+        the given rows in the same code space
+        """
+        return EncodedTable(self.columns, {col:np.asarray(self.codes[col][rows]) for col in self.columns}, self.dictionaries, len(rows))
+
+    def iter_dataframes(self, chunksize:int = 1 << 16)->Iterator[pd.DataFrame]:
+        for start in range(0, self.rowSize, chunksize):
+            yield self.to_dataframe(start, start + chunksize)
+
+class FrequentConstants:
+    """
+    values of one column appearing at least threshold times, in order of first appearance
+    """
+    def __init__(self, table:EncodedTable, column:str, codes:np.ndarray, counts:np.ndarray) -> None:
+        self.table = table
+        self.column = column
+        self.codes = codes
+        self.values = table.dictionaries[column][codes]
+        self.counts = counts
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def bitmap(self, i:int)->np.ndarray:
+        """
+        rows holding values[i], packed 8 rows per byte and registered in table.bitmaps
+        """
+        key = (self.column, int(self.codes[i]))
+        bitmap = self.table.bitmaps.get(key)
+        if bitmap is None:
+            bitmap = np.packbits(self.table.codes[self.column] == self.codes[i])
+            self.table.bitmaps[key] = bitmap
+        return bitmap
+
+    def mask(self, i:int)->np.ndarray:
+        return unpack(self.bitmap(i), len(self.table))
+
+def unpack(bitmap:np.ndarray, rowSize:int)->np.ndarray:
+    return np.unpackbits(bitmap, count=rowSize).view(bool)
+
+def frequent_constants(table:Union[pd.DataFrame, EncodedTable], threshold:float = 0.1, 
+        ignore_column:Callable[[str], bool] = lambda c:False, workerNum:int = 1, bitmaps:bool = False)->Dict[str, FrequentConstants]:
+    """
+    one bincount per column, threshold is a ratio of the table length. NULL is never a frequent constant.
+    bitmaps are built lazily by FrequentConstants.bitmap unless bitmaps is True
+    """
+    columns = [col for col in table.columns if not ignore_column(col)]
+    if not isinstance(table, EncodedTable):
+        table = EncodedTable.encode(table[columns], workerNum)
+    minCount = len(table) * threshold
+    def find(col:str)->FrequentConstants:
+        counts = table.value_counts(col)
+        codes = np.flatnonzero(counts >= minCount)
+        constants = FrequentConstants(table, col, codes, counts[codes])
+        if bitmaps:
+            for i in range(len(constants)):
+                constants.bitmap(i)
+        return constants
+    return dict(zip(columns, _map(find, columns, workerNum)))
+
+def _read_chunks(path:str, chunksize:int, columns:List[str] = None)->Iterator[pd.DataFrame]:
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Reading parquet needs pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            # same values as a CSV read with dtype=str
+            yield pd.DataFrame({col:chunk[col].map(str, na_action='ignore') for col in chunk.columns})
+    else:
+        yield from pd.read_csv(path, dtype=str, chunksize=chunksize, usecols=columns)
+
+def _content_key(source:Union[str, pd.DataFrame], columns:List[str], cache_dir:str)->str:
+    sha1 = hashlib.sha1(json.dumps([EncodedTable.STORE_VERSION, columns]).encode("utf-8"))
+    if isinstance(source, str):
+        sha1.update(_file_hash(source, cache_dir).encode("utf-8"))
+        return sha1.hexdigest()
+    sha1.update(json.dumps([str(c) for c in source.columns]).encode("utf-8"))
+    sha1.update(pd.util.hash_pandas_object(source, index=False).values.tobytes())
+    return sha1.hexdigest()
+
+def _file_hash(path:str, cache_dir:str)->str:
+    stat = os.stat(path)
+    # hashing tens of GB takes a while, the hash of an unchanged file is looked up by its stat
+    statKey = hashlib.sha1(json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns]).encode("utf-8")).hexdigest()
+    statFile = os.path.join(cache_dir, f"stat_{statKey}")
+    sha1 = hashlib.sha1()
+    if os.path.exists(statFile):
+        with open(statFile, encoding="utf-8") as f:
+            digest = f.read().strip()
+        if len(digest) == sha1.digest_size * 2:
+            return digest
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            sha1.update(block)
+    digest = sha1.hexdigest()
+    # written aside and moved, an interrupted or concurrent run never leaves a truncated hash
+    fd, tmp = tempfile.mkstemp(prefix=f"stat_{statKey}.", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(digest)
+        os.replace(tmp, statFile)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return digest
+
+def _map(func:Callable[[T], R], items:List[T], workerNum:int)->List[R]:
+    if workerNum <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(workerNum) as pool:
+        return list(pool.map(func, items))
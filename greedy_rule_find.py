@@ -3,35 +3,76 @@
 采用 level-wise，挖掘第一层，然后所有 X 谓词作为下一层的 excluding
 """
 
+import os
 import time
-from typing import Callable, Dict, List, Set, Tuple
-from rule import Predicate, Rule, RuleExecutor, Y, NegPred
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, FrozenSet, Iterator, List, Set, Tuple, Union
+from rule import Predicate, Rule, RuleExecutor, Y, NegPred, new_executor
+import numpy as np
 import pandas as pd
-from utils import countByValue, foreach, groupByKey, collect
+from utils import collect
+from encoded_table import EncodedTable, frequent_constants
+from sample_screen import SampleScreen
+from instrument import Instrument
+from decision_tree import tree_rule_find
+from checkpoint import save_checkpoint, load_checkpoint, RuleWriter
 
 def all_structual_predicates(table:pd.DataFrame, ignore_column:Callable[[str], bool] = lambda c:False)->List[Predicate]:
     return [Predicate.newStruct(c) for c in table.columns if not ignore_column(c)]
 
-def all_constant_predicates(table:pd.DataFrame, singleLine:bool, threshold:float = 0.1, 
-        ignore_column:Callable[[str], bool] = lambda c:False)->List[Tuple[Predicate]]:
+def all_constant_predicates(table:Union[pd.DataFrame, EncodedTable], singleLine:bool, threshold:float = 0.1, 
+        ignore_column:Callable[[str], bool] = lambda c:False, workerNum:int = 1, bitmaps:bool = False)->List[Tuple[Predicate]]:
+    """
+    a DataFrame is encoded on every call, pass the EncodedTable when calling more than once.
+    With bitmaps the rows of every constant are registered on the table for the numpy executor
+    """
+    cps:List[Tuple[Predicate]] = []
+    for col, constants in frequent_constants(table, threshold, ignore_column, workerNum, bitmaps).items():
+        for val in constants.values:
+            const = str(val)
+            if singleLine:
+                cps.append((Predicate.newConst0(col, const), ))
+            else:
+                cps.append((Predicate.newConst0(col, const), Predicate.newConst1(col, const)))
+    return cps
+
+def all_range_predicates(table:Union[pd.DataFrame, EncodedTable], singleLine:bool, quantiles:int = 3, 
+        ignore_column:Callable[[str], bool] = lambda c:False)->Tuple[List[Predicate], List[Tuple[Predicate]]]:
+    """
+    structural t0.a < t1.a and t0.a >= t1.a (multi-line only) and constant t0.a <= v and t0.a > v of every numeric column,
+    v taken from the values at quantiles evenly spaced quantiles so the number of predicates stays bounded
+    """
+    if not isinstance(table, EncodedTable):
+        table = EncodedTable.encode(table[[c for c in table.columns if not ignore_column(c)]])
+    sps:List[Predicate] = []
     cps:List[Tuple[Predicate]] = []
-    threshold = len(table) * threshold
     for col in table.columns:
-        if ignore_column(col):
+        if ignore_column(col) or not table.numeric(col):
             continue
-        cnt_map = countByValue(table[col])
-        for val, cnt in cnt_map.items():
-            if cnt >= threshold:
-                const = str(val)
+        values = table.values(col)
+        values = values[~np.isnan(values)]
+        if not singleLine:
+            sps.extend((Predicate.newStruct(col, '<'), Predicate.newStruct(col, '>=')))
+        thresholds = np.unique(np.quantile(values, np.arange(1, quantiles + 1) / (quantiles + 1), method='lower'))
+        # the maximum splits nothing
+        for v in thresholds[thresholds < values.max()]:
+            const = str(int(v)) if float(v).is_integer() else repr(float(v))
+            for operator in ('<=', '>'):
                 if singleLine:
-                    cps.append((Predicate.newConst0(col, const), ))
+                    cps.append((Predicate.newConst0(col, const, operator), ))
                 else:
-                    cps.append((Predicate.newConst0(col, const), Predicate.newConst1(col, const)))
-    return cps
+                    cps.append((Predicate.newConst0(col, const, operator), Predicate.newConst1(col, const, operator)))
+    return sps, cps
 
 def first_generation(structual_predicates:List[Predicate] = [], constant_predicates:List[Tuple[Predicate]] = [], 
         x_column:Callable[[str], bool] = lambda c:True, y_column:Callable[[str], bool] = lambda c:True, 
-        constant_y_in_multi_rule:bool=False)->List[Rule]:
+        constant_y_in_multi_rule:bool=False, x_predicates:List[Tuple[Predicate]] = [])->List[Rule]:
+    """
+    x_predicates (tuples as constant_predicates) are only used as Xs of the Ys above, e.g. range predicates
+    """
     rules:List[Rule] = []
     for y in structual_predicates:
         if not all((y_column(col) for col in y.columns)):
@@ -57,31 +98,136 @@ def first_generation(structual_predicates:List[Predicate] = [], constant_predica
                     continue
                 if x.compatible(y):
                     rules.append(Rule(Xs = [x], y = y))
+    for y in list(dict.fromkeys((rule.y for rule in rules))):
+        for xp in x_predicates:
+            if all((x_column(col) for p in xp for col in p.columns)) and all((p.compatible(y) for p in xp)):
+                rules.append(Rule(Xs = list(xp), y = y))
     return rules
 
+class CandidateGenerator:
+    """
+    x_column filters and column masks of the predicates are computed once.
+    Fathers using the same columns share one list of compatible predicates
+    """
+    def __init__(self, structual_predicates:List[Predicate] = [], constant_predicates:List[Tuple[Predicate]] = [], 
+            x_column:Callable[[str], bool] = lambda c:True) -> None:
+        self.structual_predicates = [sp for sp in structual_predicates if all((x_column(c) for c in sp.columns))]
+        self.constant_predicates = [cp for cp in constant_predicates if all((x_column(c) for c in cp[0].columns))]
+        self._compatibles:Dict[int, Tuple[List[Predicate], List[Tuple[Predicate]]]] = {}
+
+    def compatibles(self, mask:int)->Tuple[List[Predicate], List[Tuple[Predicate]]]:
+        """
+        structual and constant predicates using none of the columns in mask
+        """
+        found = self._compatibles.get(mask)
+        if found is None:
+            found = ([sp for sp in self.structual_predicates if sp.columnMask & mask == 0], 
+                [cp for cp in self.constant_predicates if cp[0].columnMask & mask == 0])
+            self._compatibles[mask] = found
+        return found
+
+    def children(self, father:Rule, generation:int)->List[Rule]:
+        sps, cps = self.compatibles(father.columnMask())
+        children = [father.extend([sp], generation) for sp in sps]
+        children.extend((father.extend(list(cp), generation) for cp in cps))
+        return children
+
+class CandidatePruner:
+    """
+    Order-independent keys (Xs as a set, y) of evaluated candidates. Support never grows when Xs grows,
+    so a candidate is pruned when its Xs minus one predicate is known to fall below cover,
+    or when its Xs contains the Xs of an ok rule of the same y
+    """
+    def __init__(self, cover:float = 0.01, confidence:float = 0.8) -> None:
+        self.cover = cover
+        self.confidence = confidence
+        self.infrequent:Set[Tuple[FrozenSet[Predicate], Y]] = set()
+        self.ok_Xs:Dict[Y, List[FrozenSet[Predicate]]] = {}
+        self.deduplicated = 0
+        self.pruned = 0
+        self._level:Set[Tuple[FrozenSet[Predicate], Y]] = set()
+
+    def record(self, rules:List[Rule])->None:
+        for rule in rules:
+            if rule.ok(self.cover, self.confidence):
+                self.ok_Xs.setdefault(rule.y, []).append(frozenset(rule.Xs))
+            elif not rule.reproducible(self.cover):
+                self.infrequent.add((frozenset(rule.Xs), rule.y))
+
+    def filter(self, children:List[Rule])->List[Rule]:
+        """
+        children of one level without duplicates and pruned candidates
+        """
+        self._level = set()
+        return [child for child in children if self._accept(child)]
+
+    def _accept(self, child:Rule)->bool:
+        xs = frozenset(child.Xs)
+        y = child.y
+        if (xs, y) in self._level:
+            self.deduplicated += 1
+            return False
+        self._level.add((xs, y))
+        for p in xs:
+            if (xs - {p}, y) in self.infrequent:
+                self.pruned += 1
+                return False
+        for ok_xs in self.ok_Xs.get(y, []):
+            if ok_xs <= xs:
+                self.pruned += 1
+                return False
+        return True
+
+class NegativeCoverage:
+    """
+    For every Y, the rows left when the negation of every X of its found rules holds (the rule proxy). 
+    Found rules are consumed incrementally and all changed proxies are executed in one batch.
+    Negative predicates keep the order they were found in, so a proxy extends the proxy of the last level
+    """
+    def __init__(self, sameTable:bool = True) -> None:
+        self.sameTable = sameTable
+        self.negatives:Dict[Y, Dict[NegPred, None]] = {}
+        self.proxies:Dict[Y, Rule] = {}
+        self._consumed = 0
+
+    def update(self, all_found_rules:List[Rule], ruleExecutor:RuleExecutor)->None:
+        changed:Dict[Y, None] = {}
+        for rule in all_found_rules[self._consumed:]:
+            negatives = self.negatives.setdefault(rule.y, {})
+            for x in rule.Xs:
+                neg = x if x.negative else x.negate()
+                if neg not in negatives:
+                    negatives[neg] = None
+                    changed[rule.y] = None
+        self._consumed = len(all_found_rules)
+        proxies = [Rule(Xs = list(self.negatives[y]), y = y, sameTable = self.sameTable) for y in changed]
+        if len(proxies) > 0:
+            ruleExecutor.execute(proxies, progressBar=False)
+        for proxy in proxies:
+            self.proxies[proxy.y] = proxy
+
 def next_generation(fathers:List[Rule], ruleExecutor:RuleExecutor, new_found_rules:List[Rule], all_found_rules:List[Rule], 
         structual_predicates:List[Predicate] = [], constant_predicates:List[Tuple[Predicate]] = [], cover:float = 0.01, 
-        x_column:Callable[[str], bool] = lambda c:True, greedy:bool = True)->List[Rule]:
+        x_column:Callable[[str], bool] = lambda c:True, greedy:bool = True, generator:CandidateGenerator = None, 
+        pruner:CandidatePruner = None, coverage:'NegativeCoverage' = None)->List[Rule]:
+    """
+    a given coverage must already be updated with all_found_rules, as levelwise does before every level
+    """
+    if generator is None:
+        generator = CandidateGenerator(structual_predicates, constant_predicates, x_column)
     if not greedy:
         new_found_rules = []
+    if coverage is None:
+        coverage = NegativeCoverage()
+        coverage.update(all_found_rules, ruleExecutor)
     # The data of Y has changed ? Bacause Y appears in the new found rules.
     changed_Ys:Set[Y] = {rule.y for rule in new_found_rules}
     # all negetive predicates of Y
-    negetive_predicates_map:Dict[Y, Set[NegPred]] = {}
-    for y, rules in groupByKey(all_found_rules, lambda rule:rule.y).items():
-        negetive_predicates_map[y] = set()
-        foreach(rules, lambda rule:foreach(rule.Xs, lambda x:negetive_predicates_map[y].add(x if x.negative else x.negate())))
-    # all columns of all negetive predicates of Y
-    negetive_columns_map:Dict[Y, Set[str]] = {y:set() for y in negetive_predicates_map.keys()}
-    for y, ps in negetive_predicates_map.items():
-        foreach(ps, lambda p:negetive_columns_map[y].update(p.columns))
-
-    no_create_children_Ys:Set[Y] = set()
-    for y, neg_preds in negetive_predicates_map.items():
-        rule_proxy = Rule(Xs = list(neg_preds)[:900], y = y)
-        ruleExecutor.execute([rule_proxy], progressBar=False)
-        if rule_proxy.cover() < cover:
-            no_create_children_Ys.add(y)
+    negetive_predicates_map = coverage.negatives
+    # column mask of all negetive predicates of Y
+    negetive_mask_map:Dict[Y, int] = {y:Predicate.maskOf((c for p in ps for c in p.columns)) for y, ps in negetive_predicates_map.items()}
+
+    no_create_children_Ys:Set[Y] = {y for y, proxy in coverage.proxies.items() if proxy.cover() < cover}
     
     generation = fathers[0].generation + 1
     children:List[Rule] = []
@@ -90,19 +236,21 @@ def next_generation(fathers:List[Rule], ruleExecutor:RuleExecutor, new_found_rul
     for y in changed_Ys:
         if y in no_create_children_Ys:
             continue
+        negetive_Xs = list(negetive_predicates_map[y])
+        negetive_mask = negetive_mask_map.get(y, 0)
         if y.isConst():
             if y.t1_col is not None: # t0.a=1
-                for cp in constant_predicates:
-                    if all((x_column(c) for c in cp[0].columns)) and cp[0].compatible(y) and len(cp[0].columns & negetive_columns_map.get(y, set())) == 0:
-                        children.append(Rule(Xs = list(negetive_predicates_map[y]) + [cp[0]], y = y, generation = generation))
+                for cp in generator.constant_predicates:
+                    if cp[0].columnMask & (y.columnMask | negetive_mask) == 0:
+                        children.append(Rule(Xs = negetive_Xs + [cp[0]], y = y, sameTable = coverage.sameTable, generation = generation))
             else: # t1.a=1
-                for cp in constant_predicates:
-                    if all((x_column(c) for c in cp[0].columns)) and cp[0] == y and len(cp[0].columns & negetive_columns_map.get(y, set())) == 0: # x only t0.a=1
-                        children.append(Rule(Xs = list(negetive_predicates_map[y]) + [cp[0]], y = y, generation = generation))
+                for cp in generator.constant_predicates:
+                    if cp[0] == y and cp[0].columnMask & negetive_mask == 0: # x only t0.a=1
+                        children.append(Rule(Xs = negetive_Xs + [cp[0]], y = y, sameTable = coverage.sameTable, generation = generation))
         else:
-            for sp in structual_predicates:
-                if all((x_column(c) for c in sp.columns)) and sp.compatible(y) and len(sp.columns & negetive_columns_map.get(y, set())) == 0:
-                    children.append(Rule(Xs = list(negetive_predicates_map[y]) + [sp], y = y, generation = generation))
+            for sp in generator.structual_predicates:
+                if sp.columnMask & (y.columnMask | negetive_mask) == 0:
+                    children.append(Rule(Xs = negetive_Xs + [sp], y = y, sameTable = coverage.sameTable, generation = generation))
 
     # Rules about fathers' children
     for father in fathers:
@@ -111,51 +259,266 @@ def next_generation(fathers:List[Rule], ruleExecutor:RuleExecutor, new_found_rul
             continue
         if y in changed_Ys:
             continue
-        for sp in structual_predicates:
-            if all((x_column(c) for c in sp.columns)) and father.compatible(sp):
-                children.append(Rule(Xs = father.Xs + [sp], y = y, generation = generation))
-        for cp in constant_predicates:
-            if all((x_column(c) for c in cp[0].columns)) and father.compatible(cp[0]):
-                children.append(Rule(Xs = father.Xs + list(cp), y = y, generation = generation))
+        children.extend(generator.children(father, generation))
         
+    if pruner is not None:
+        children = pruner.filter(children)
     return children
 
-def rule_find(tables:Dict[str, pd.DataFrame], cover:float = 0.01, confidence:float = 0.8, constant_threshold:float = 0.1,
+def cross_table_predicates(t0:Union[pd.DataFrame, EncodedTable], t1:Union[pd.DataFrame, EncodedTable], threshold:float = 0.1, 
+        ignore_column:Callable[[str], bool] = lambda c:False, bitmaps:bool = False)->Tuple[List[Predicate], List[Tuple[Predicate]]]:
+    """
+    t0.a = t1.a on the columns both tables have (the join keys), and the frequent constants of each side on its own
+    """
+    t1_columns = set(t1.columns)
+    sps = [Predicate.newStruct(c) for c in t0.columns if c in t1_columns and not ignore_column(c)]
+    cps:List[Tuple[Predicate]] = [(Predicate.newConst0(col, str(v)), ) for col, constants in frequent_constants(t0, threshold, ignore_column, bitmaps=bitmaps).items() for v in constants.values]
+    cps.extend(((Predicate.newConst1(col, str(v)), ) for col, constants in frequent_constants(t1, threshold, ignore_column, bitmaps=bitmaps).items() for v in constants.values))
+    return sps, cps
+
+def levelwise(rules:List[Rule], evaluate:Callable[[List[Rule]], List[Rule]], ruleExecutor:RuleExecutor, generator:CandidateGenerator, 
+        cover:float, confidence:float, greedy:bool = True, max_levelwise_depth:int = 20, instrument:Instrument = None, table:str = "", phase:str = "",
+        checkpoint:str = None, resume:bool = False, on_found:Callable[[List[Rule]], None] = None, stop:threading.Event = None)->List[Rule]:
+    """
+    level-wise search from the first generation rules, returns the found rules.
+    An enabled instrument gets a level event per level, tagged with table and phase.
+    With checkpoint, the state after every level is saved to that file and resume restarts from it.
+    on_found is called with the rules found by every level before its checkpoint is saved. A resumed search first calls it with all the rules
+    of the checkpoint, so a consumer restarting from scratch (e.g. a RuleWriter with mode="w") gets every rule once.
+    Once stop is set the search ends before the next level, its checkpoint stays resumable
+    """
+    state = load_checkpoint(checkpoint) if checkpoint is not None and resume else None
+    if state is not None:
+        if (state["cover"], state["confidence"], state["greedy"]) != (cover, confidence, greedy):
+            raise Exception(f"Checkpoint {checkpoint} was made with cover={state['cover']} confidence={state['confidence']} greedy={state['greedy']}")
+        if on_found is not None and len(state["all_found_rules"]) > 0:
+            on_found(list(state["all_found_rules"]))
+        if state["done"]:
+            return state["all_found_rules"]
+        level, fathers, new_found_rules, all_found_rules = state["level"], state["fathers"], state["new_found_rules"], state["all_found_rules"]
+        pruner, coverage, evaluated_number = state["pruner"], state["coverage"], state["evaluated_number"]
+        print(f"Resume {table} {phase} from level {level} with {len(fathers)} fathers and {len(all_found_rules)} found rules")
+    else:
+        level, fathers, new_found_rules, all_found_rules = 0, None, [], []
+        pruner = CandidatePruner(cover, confidence)
+        coverage = NegativeCoverage(sameTable = len(rules) == 0 or rules[0].sameTable)
+        evaluated_number = 0
+    measured = instrument is not None and instrument.enabled
+    generated, deduplicated, pruned, generation_s, coverage_s = len(rules), 0, 0, 0.0, 0.0
+    while True:
+        if stop is not None and stop.is_set():
+            return all_found_rules
+        if fathers is not None:
+            if len(fathers) == 0 or level >= max_levelwise_depth:
+                break
+            # the proxies of NegativeCoverage are evaluated by SQL, timed apart from the generation and not again by next_generation
+            start = time.perf_counter()
+            coverage.update(all_found_rules, ruleExecutor)
+            coverage_s = time.perf_counter() - start
+            start = time.perf_counter()
+            deduplicated, pruned = pruner.deduplicated, pruner.pruned
+            rules = next_generation(fathers, ruleExecutor, new_found_rules, all_found_rules, cover=cover, greedy=greedy, generator=generator, pruner=pruner, coverage=coverage)
+            deduplicated, pruned = pruner.deduplicated - deduplicated, pruner.pruned - pruned
+            generated = len(rules) + deduplicated + pruned
+            generation_s = time.perf_counter() - start
+        level += 1
+        start = time.perf_counter()
+        rules = evaluate(rules)
+        evaluation_s = time.perf_counter() - start
+        evaluated_number += len(rules)
+        pruner.record(rules)
+        new_found_rules = collect(rules, lambda r:r.ok(cover, confidence))
+        fathers = collect(rules, lambda r:(not r.ok(cover, confidence)) and r.reproducible(cover))
+        all_found_rules.extend(new_found_rules)
+        if measured:
+            instrument.level(table, phase, level, rules, generated, deduplicated, pruned, generation_s, coverage_s, evaluation_s, cover, confidence)
+        if on_found is not None and len(new_found_rules) > 0:
+            on_found(new_found_rules)
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, {"cover":cover, "confidence":confidence, "greedy":greedy, "done":False, "level":level, "fathers":fathers,
+                "new_found_rules":new_found_rules, "all_found_rules":all_found_rules, "pruner":pruner, "coverage":coverage, "evaluated_number":evaluated_number})
+    if checkpoint is not None:
+        save_checkpoint(checkpoint, {"cover":cover, "confidence":confidence, "greedy":greedy, "done":True, "level":level,
+            "all_found_rules":all_found_rules, "evaluated_number":evaluated_number})
+    return all_found_rules
+
+def rule_find(tables:Dict[str, Union[pd.DataFrame, EncodedTable, str]], cover:float = 0.01, confidence:float = 0.8, constant_threshold:float = 0.1,
         ignore_column:Callable[[str], bool] = lambda c:False, x_column:Callable[[str], bool] = lambda c:True,
         y_column:Callable[[str], bool] = lambda c:True, max_levelwise_depth:int = 20, sql_thread_num:int = 1, 
-        single_line:bool = True, multi_line:bool = True, cross_table:bool = False, greedy:bool = True)->List[Rule]:
-    result:List[Rule] = []
-    for tabName, data in tables.items():
+        single_line:bool = True, multi_line:bool = True, cross_table:bool = False, greedy:bool = True, engine:str = "sqlite",
+        cache_dir:str = None, sample_size:int = 0, sample_delta:float = 0.01, evaluated:List[Rule] = None, 
+        table_worker_num:int = 1, instrument:Instrument = None, decision_tree:bool = False, checkpoint_dir:str = None, resume:bool = False,
+        on_found:Callable[[List[Rule]], None] = None, range_quantiles:int = 0, stop:threading.Event = None, tree_depth:int = 8)->List[Rule]:
+    """
+    a table is a DataFrame, an EncodedTable or a path of a CSV/Parquet file which is encoded chunk by chunk into a memory-mapped store,
+    a temporary one removed when rule_find returns unless cache_dir is given.
+    With cache_dir the encoded tables are kept there and reused by later runs on the same content.
+    With sample_size > 0 candidates whose cover is below cover on a sample of that many rows (with probability 1 - sample_delta) are not counted exactly.
+    Every evaluated candidate is appended to evaluated when given.
+    With cross_table, rules t0 from one table and t1 from another are searched for every ordered pair of tables, joined on their common columns.
+    Tables and pairs of tables are searched by table_worker_num threads, rule.tables tells where a returned rule comes from.
+    With decision_tree, single-line rules come from decision trees of at most tree_depth levels over the constant predicates
+    (decision_tree.tree_rule_find, needs sklearn) instead of the level-wise search.
+    An enabled instrument gets the metrics of every level and the latency of every evaluation, see instrument.Instrument.
+    With checkpoint_dir every search saves its state after each level there, resume restarts the searches from those checkpoints.
+    on_found is called (one call at a time) with the rules of every level as soon as they are found, e.g. checkpoint.RuleWriter.
+    With range_quantiles > 0 numeric columns also get range predicates as Xs, see all_range_predicates.
+    Setting stop ends every search before its next level, the rules found so far are returned
+    """
+    if instrument is not None and not instrument.enabled:
+        instrument = None
+    loaded:Dict[str, Union[pd.DataFrame, EncodedTable]] = {}
+
+    def new_evaluate(re, t0, t1 = None)->Callable[[List[Rule]], List[Rule]]:
+        screen = SampleScreen(re, t0, t1, engine=engine, sample_size=sample_size, delta=sample_delta) if sample_size > 0 else None
+        def evaluate(rules:List[Rule])->List[Rule]:
+            if screen is not None:
+                # fathers are extended while not ok, so only cover can reject early
+                screen.execute(rules, cover, workerNum=sql_thread_num)
+            elif sql_thread_num > 1:
+                re.execute_parallel(rules, workerNum=sql_thread_num)
+            else:
+                re.execute(rules)
+            if evaluated is not None:
+                evaluated.extend(rules)
+            return rules
+        return evaluate
+
+    stream_lock = threading.Lock()
+    def search(rules:List[Rule], evaluate:Callable[[List[Rule]], List[Rule]], re, generator:CandidateGenerator, names:Tuple[str, str], phase:str)->List[Rule]:
+        label = names[0] if names[0] == names[1] else f"{names[0]},{names[1]}"
+        checkpoint = None if checkpoint_dir is None else os.path.join(checkpoint_dir, f"{label}.{phase}.ckpt")
+        return levelwise(rules, evaluate, re, generator, cover, confidence, greedy, max_levelwise_depth, instrument, label, phase,
+            checkpoint, resume, stream(names), stop)
+
+    def stream(names:Tuple[str, str])->Callable[[List[Rule]], None]:
+        def found(rules:List[Rule])->None:
+            for rule in rules:
+                rule.tables = names
+            if on_found is not None:
+                with stream_lock:
+                    on_found(rules)
+        return found
+
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def one_table(tabName:str)->List[Rule]:
+        data = loaded[tabName]
         print(f"Start rule-find on table {tabName}. Length {len(data)} with {len(data.columns)} columns {list(data.columns)}")
-        re = RuleExecutor(data)
+        re = new_executor(data, engine=engine)
+        re.instrument = instrument
+        evaluate = new_evaluate(re, data)
+        found:List[Rule] = []
         if single_line:
-            cps = all_constant_predicates(data, singleLine=True, ignore_column=ignore_column, threshold=constant_threshold)
-            rules = first_generation(constant_predicates=cps, x_column=x_column, y_column=y_column)
-            all_found_rules:List[Rule] = []
-            for _ in range(max_levelwise_depth):
-                rules = re.execute_parallel(rules, workerNum=sql_thread_num) if sql_thread_num > 1 else re.execute(rules)
-                new_found_rules = collect(rules, lambda r:r.ok(cover, confidence))
-                fathers = collect(rules, lambda r:(not r.ok(cover, confidence)) and r.reproducible(cover))
-                all_found_rules.extend(new_found_rules)
-                if len(fathers) == 0:
-                    break
-                rules = next_generation(fathers, re, new_found_rules, all_found_rules, constant_predicates=cps, cover=cover, x_column=x_column, greedy=greedy)
-            result.extend(all_found_rules)
+            cps = all_constant_predicates(data, singleLine=True, ignore_column=ignore_column, threshold=constant_threshold, bitmaps=bitmaps)
+            rangeCps = all_range_predicates(data, True, range_quantiles, ignore_column)[1] if range_quantiles > 0 else []
+            if decision_tree:
+                rules = tree_rule_find(data, cps, evaluate, cover, confidence, x_column, y_column, max_depth=tree_depth)
+                stream((tabName, tabName))(rules)
+                found.extend(rules)
+            else:
+                rules = first_generation(constant_predicates=cps, x_column=x_column, y_column=y_column, x_predicates=rangeCps)
+                generator = CandidateGenerator(constant_predicates=cps + rangeCps, x_column=x_column)
+                found.extend(search(rules, evaluate, re, generator, (tabName, tabName), "single-line"))
         if multi_line:
             sps = all_structual_predicates(data, ignore_column=ignore_column)
-            cps = all_constant_predicates(data, singleLine=False, ignore_column=ignore_column, threshold=constant_threshold)
-            rules = first_generation(sps, cps, x_column=x_column, y_column=y_column)
-            all_found_rules:List[Rule] = []
-            for _ in range(max_levelwise_depth):
-                rules = re.execute_parallel(rules, workerNum=sql_thread_num) if sql_thread_num > 1 else re.execute(rules)
-                new_found_rules = collect(rules, lambda r:r.ok(cover, confidence))
-                fathers = collect(rules, lambda r:(not r.ok(cover, confidence)) and r.reproducible(cover))
-                all_found_rules.extend(new_found_rules)
-                if len(fathers) == 0:
-                    break
-                rules = next_generation(fathers, re, new_found_rules, all_found_rules, structual_predicates=sps, constant_predicates=cps, cover=cover, x_column=x_column, greedy=greedy)
-            result.extend(all_found_rules)
-    return result
+            cps = all_constant_predicates(data, singleLine=False, ignore_column=ignore_column, threshold=constant_threshold, bitmaps=bitmaps)
+            rangeSps, rangeCps = all_range_predicates(data, False, range_quantiles, ignore_column) if range_quantiles > 0 else ([], [])
+            rules = first_generation(sps, cps, x_column=x_column, y_column=y_column, x_predicates=[(sp, ) for sp in rangeSps] + rangeCps)
+            generator = CandidateGenerator(sps + rangeSps, cps + rangeCps, x_column=x_column)
+            found.extend(search(rules, evaluate, re, generator, (tabName, tabName), "multi-line"))
+        for rule in found:
+            rule.tables = (tabName, tabName)
+        return found
+
+    def two_tables(names:Tuple[str, str])->List[Rule]:
+        t0, t1 = loaded[names[0]], loaded[names[1]]
+        print(f"Start cross-table rule-find on tables {names[0]} (t0) and {names[1]} (t1). Length {len(t0)} and {len(t1)}")
+        sps, cps = cross_table_predicates(t0, t1, constant_threshold, ignore_column, bitmaps)
+        # every candidate holds a join key t0.a = t1.a, so pairs are counted through the join instead of the Cartesian product
+        rules = [Rule(Xs = [x], y = y, sameTable = False) for y in sps if all((y_column(c) for c in y.columns)) 
+            for x in sps if all((x_column(c) for c in x.columns)) and x.compatible(y)]
+        if len(rules) == 0:
+            return []
+        re = new_executor(t0, t1, engine=engine)
+        re.instrument = instrument
+        found = search(rules, new_evaluate(re, t0, t1), re, CandidateGenerator(sps, cps, x_column=x_column), names, "cross-table")
+        for rule in found:
+            rule.tables = names
+        return found
+
+    # only the numpy executor reads the bitmaps of the frequent constants
+    bitmaps = engine == "numpy"
+    # stores of files encoded without cache_dir, removed when the search ends
+    stores:List[tempfile.TemporaryDirectory] = []
+    try:
+        for tabName, data in tables.items():
+            if cache_dir is not None and not isinstance(data, EncodedTable):
+                data = EncodedTable.cached(data, cache_dir)
+            elif isinstance(data, str):
+                stores.append(tempfile.TemporaryDirectory(prefix="grf_enc_", ignore_cleanup_errors=True))
+                data = EncodedTable.from_file(data, stores[-1].name)
+            if not isinstance(data, EncodedTable):
+                # encode once for the constant, range and tree finders, the numpy executor shares codes and bitmaps too
+                data = EncodedTable.encode(data)
+            loaded[tabName] = data
+
+        jobs:List[Tuple[Callable, object]] = [(one_table, tabName) for tabName in loaded]
+        if cross_table:
+            jobs.extend(((two_tables, (a, b)) for a in loaded for b in loaded if a != b))
+        if table_worker_num > 1 and len(jobs) > 1:
+            # sqlite and numpy release the GIL while counting
+            with ThreadPoolExecutor(table_worker_num) as pool:
+                founds = list(pool.map(lambda job:job[0](job[1]), jobs))
+        else:
+            founds = [job[0](job[1]) for job in jobs]
+        return [rule for found in founds for rule in found]
+    finally:
+        loaded.clear()
+        for store in stores:
+            store.cleanup()
+
+def rule_stream(tables:Dict[str, Union[pd.DataFrame, EncodedTable, str]], max_pending:int = 64, **options)->Iterator[Rule]:
+    """
+    rule_find(tables, **options) in a background thread, yields the found rules level by level while the search goes on.
+    An on_found in options is still called with every level. At most max_pending levels wait for the consumer, the search pauses meanwhile.
+    Closing the generator (or leaving a for loop over it) stops the search before its next level
+    """
+    on_found = options.pop("on_found", None)
+    stop = threading.Event()
+    results:queue.Queue = queue.Queue(max_pending)
+    end = object()
+    def put(item)->None:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+    def found(rules:List[Rule])->None:
+        if on_found is not None:
+            on_found(rules)
+        put(rules)
+    def run():
+        try:
+            rule_find(tables, on_found=found, stop=stop, **options)
+            put(end)
+        except BaseException as e:
+            put(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is end:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield from item
+        thread.join()
+    finally:
+        stop.set()
 
 if __name__ == '__main__':
     start = time.time()
@@ -163,12 +526,16 @@ if __name__ == '__main__':
     ignore_columns = ['id', 'aic', '_aic', 'index', '_index', 'row_id', 'source_data_id', 'last_update_time', 'batch_id', 'uuid', 'tuple_id']
 
 
-    all_found_rules = rule_find({"flights":data}, cover = 1e-10, confidence=1.0, constant_threshold=1e-10, 
-        ignore_column=lambda c:c in ignore_columns, sql_thread_num=1, 
-        single_line=True, multi_line=True, greedy=True,
-        x_column = lambda c:not c.startswith('_'),
-        y_column = lambda c:c.startswith('_'),
-    )
+    # rules.txt grows while the search goes on, a crashed run continues from its checkpoints and rewrites rules.txt,
+    # the rules found before the crash are sent again on resume
+    with RuleWriter("rules.txt", mode = "w") as writer:
+        all_found_rules = rule_find({"flights":data}, cover = 1e-10, confidence=1.0, constant_threshold=1e-10, 
+            ignore_column=lambda c:c in ignore_columns, sql_thread_num=1, 
+            single_line=True, multi_line=True, greedy=True,
+            x_column = lambda c:not c.startswith('_'),
+            y_column = lambda c:c.startswith('_'),
+            checkpoint_dir = "checkpoints", resume = True, on_found = writer,
+        )
 
     # for rules in groupByKey(all_found_rules, lambda rule:rule.y).values():
     #     if len(rules) > 0:
@@ -176,7 +543,4 @@ if __name__ == '__main__':
     #     for rule in sorted(rules, key = lambda rule:rule.generation):
     #         print("|---" * (rule.generation -1) + str(rule))
 
-    with open("rules.txt", mode = "bw") as f:
-        foreach(all_found_rules, lambda r:f.write((r.ree("flights")+'\r\n').encode('utf-8')))
-
     print(f"Rules number {len(all_found_rules)} duration {time.time() - start}s")
\ No newline at end of file
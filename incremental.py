@@ -0,0 +1,253 @@
+"""
+Incremental maintenance of discovered rules when rows are inserted into or deleted from the table.
+Every evaluated candidate is kept with its counters. A delta D changes the counters of a single-line rule by the rows of D
+and those of a multi-line rule by the pairs (T, D), (D, T) and (D, D). T is an indexed sqlite table, so the cost follows |D|.
+The search is re-opened only below rules whose ok/reproducible status flipped.
+"""
+
+import os
+import pickle
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+import pandas as pd
+from rule import Predicate, Rule, RuleExecutor, SQL_TAB0, SQL_TAB1, SQL_ID_COL, group_by_lhs, row_size, _query
+from greedy_rule_find import CandidateGenerator, CandidatePruner, rule_find
+
+BASE_TAB = "base"
+DELTA_TAB = "delta"
+
+OK = "ok"
+FATHER = "father"
+INFREQUENT = "infrequent"
+
+def status(rule:Rule, cover:float, confidence:float)->str:
+    if rule.ok(cover, confidence):
+        return OK
+    return FATHER if rule.reproducible(cover) else INFREQUENT
+
+def rule_key(rule:Rule)->tuple:
+    return (frozenset(rule.Xs), rule.y, rule.sameTable)
+
+def _pools(rules:Iterable[Rule], singleLine:bool)->Tuple[List[Predicate], List[Tuple[Predicate]]]:
+    """
+    the structual and constant predicates the evaluated candidates were built from
+    """
+    ps = {p for rule in rules if rule.singleLine() == singleLine for p in rule.Xs if not p.negative}
+    ps = sorted(ps, key=lambda p:p.id)
+    if singleLine:
+        return [], [(p, ) for p in ps]
+    sps = [p for p in ps if not p.isConst()]
+    cps = [(p, Predicate.newConst1(p.t0_col, p.constant)) for p in ps if p.isConst() and p.t1_col is None]
+    return sps, [cp for cp in cps if cp[1] in ps]
+
+class RuleMaintainer:
+    """
+    rules and counters live in store_dir: the rows in a sqlite table, the rules pickled.
+    Rows are identified by SQL_ID_COL, the rows of the initial table get 0..n-1 and inserted rows get the next ids
+    """
+    STATE_FILE = "rules.pkl"
+    DB_FILE = "rules.db"
+
+    def __init__(self, store_dir:str, cover:float, confidence:float, max_depth:int = 20) -> None:
+        self.store_dir = store_dir
+        self.cover = cover
+        self.confidence = confidence
+        self.max_depth = max_depth
+        self.rules:Dict[tuple, Rule] = {}
+        self.rowSize = 0
+        self.next_id = 0
+        self.columns:List[str] = []
+        os.makedirs(store_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(store_dir, RuleMaintainer.DB_FILE))
+        for pragma in RuleExecutor.WRITE_PRAGMAS:
+            self.conn.execute(pragma)
+
+    @staticmethod
+    def create(store_dir:str, table:pd.DataFrame, rules:List[Rule], cover:float, confidence:float, max_depth:int = 20)->'RuleMaintainer':
+        """
+        rules must hold exact counters on table
+        """
+        maintainer = RuleMaintainer(store_dir, cover, confidence, max_depth)
+        maintainer.columns = list(table.columns)
+        maintainer.conn.execute(f"DROP TABLE IF EXISTS {BASE_TAB}")
+        maintainer._write(BASE_TAB, table)
+        for i, col in enumerate(maintainer.columns):
+            maintainer.conn.execute(f'CREATE INDEX "{BASE_TAB}_idx{i}" ON {BASE_TAB}("{col}")')
+        maintainer.conn.execute(f'CREATE UNIQUE INDEX "{BASE_TAB}_id" ON {BASE_TAB}({SQL_ID_COL})')
+        maintainer.conn.commit()
+        maintainer.rowSize = len(table)
+        for rule in rules:
+            maintainer.rules[rule_key(rule)] = rule
+        maintainer.save()
+        return maintainer
+
+    @staticmethod
+    def discover(store_dir:str, table:pd.DataFrame, cover:float = 0.01, confidence:float = 0.8, **options)->'RuleMaintainer':
+        """
+        rule_find on table keeping every evaluated candidate, options go to rule_find
+        """
+        if options.get("sample_size", 0) > 0:
+            raise Exception("Maintained counters must be exact, sample_size is not supported")
+        evaluated:List[Rule] = []
+        rule_find({"table":table}, cover, confidence, evaluated=evaluated, **options)
+        return RuleMaintainer.create(store_dir, table, evaluated, cover, confidence, options.get("max_levelwise_depth", 20))
+
+    @staticmethod
+    def open(store_dir:str)->'RuleMaintainer':
+        with open(os.path.join(store_dir, RuleMaintainer.STATE_FILE), "rb") as f:
+            state = pickle.load(f)
+        maintainer = RuleMaintainer(store_dir, state["cover"], state["confidence"], state["max_depth"])
+        maintainer.rules = {rule_key(rule):rule for rule in state["rules"]}
+        maintainer.rowSize = state["rowSize"]
+        maintainer.next_id = state["next_id"]
+        maintainer.columns = state["columns"]
+        return maintainer
+
+    def save(self)->None:
+        state = {"cover":self.cover, "confidence":self.confidence, "max_depth":self.max_depth, "rules":list(self.rules.values()),
+            "rowSize":self.rowSize, "next_id":self.next_id, "columns":self.columns}
+        path = os.path.join(self.store_dir, RuleMaintainer.STATE_FILE)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self)->None:
+        self.conn.close()
+
+    def found(self)->List[Rule]:
+        return [rule for rule in self.rules.values() if rule.ok(self.cover, self.confidence)]
+
+    def _write(self, tab:str, rows:pd.DataFrame)->List[int]:
+        ids = list(range(self.next_id, self.next_id + len(rows)))
+        self.next_id += len(rows)
+        rows = rows[self.columns].set_axis(pd.Index(ids, name=SQL_ID_COL), axis=0)
+        rows.to_sql(tab, self.conn, index=True, if_exists='append')
+        return ids
+
+    def _bind(self, tab0:str, tab1:str)->None:
+        # rule SQL reads tab0 and tab1
+        for view, tab in [(SQL_TAB0, tab0), (SQL_TAB1, tab1)]:
+            self.conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+            self.conn.execute(f"CREATE TEMP VIEW {view} AS SELECT * FROM {tab}")
+
+    def _counts(self, rules:List[Rule], tab0:str, tab1:str, sameTable:bool)->List[Tuple[int, int]]:
+        self._bind(tab0, tab1)
+        probes = [Rule(Xs = r.Xs, y = r.y, sameTable = sameTable) for r in rules]
+        for group in group_by_lhs(probes):
+            RuleExecutor._execute_group(self.conn, group, 0, 0)
+        return [(p.xSupp, p.supp) for p in probes]
+
+    def _apply(self, sign:int)->None:
+        """
+        add (sign = 1) or subtract (sign = -1) the counts contributed by the rows in DELTA_TAB, BASE_TAB holds the other rows
+        """
+        singles = [r for r in self.rules.values() if r.singleLine()]
+        multis = [r for r in self.rules.values() if not r.singleLine()]
+        deltas:List[Tuple[List[Rule], List[Tuple[int, int]]]] = [(singles, self._counts(singles, DELTA_TAB, DELTA_TAB, True))]
+        for tab0, tab1, sameTable in [(BASE_TAB, DELTA_TAB, False), (DELTA_TAB, BASE_TAB, False), (DELTA_TAB, DELTA_TAB, True)]:
+            deltas.append((multis, self._counts(multis, tab0, tab1, sameTable)))
+        for rules, counts in deltas:
+            for rule, (xSupp, supp) in zip(rules, counts):
+                rule.xSupp += sign * xSupp
+                rule.supp += sign * supp
+        for rule in self.rules.values():
+            rule.rowSize = row_size(rule, self.rowSize, self.rowSize)
+
+    def insert(self, rows:pd.DataFrame)->Tuple[List[int], List[Rule]]:
+        """
+        ids of the inserted rows and the rules which became or stopped being ok
+        """
+        self.conn.execute(f"DROP TABLE IF EXISTS {DELTA_TAB}")
+        ids = self._write(DELTA_TAB, rows)
+        self.rowSize += len(rows)
+        return ids, self._maintain(1, lambda:self.conn.execute(f"INSERT INTO {BASE_TAB} SELECT * FROM {DELTA_TAB}"))
+
+    def delete(self, ids:Iterable[int])->List[Rule]:
+        """
+        the rules which became or stopped being ok
+        """
+        self.conn.execute(f"DROP TABLE IF EXISTS {DELTA_TAB}")
+        self.conn.execute(f"CREATE TABLE {DELTA_TAB} AS SELECT * FROM {BASE_TAB} WHERE 0")
+        self.conn.executemany(f"INSERT INTO {DELTA_TAB} SELECT * FROM {BASE_TAB} WHERE {SQL_ID_COL} = ?", ((int(i), ) for i in ids))
+        self.conn.execute(f"DELETE FROM {BASE_TAB} WHERE {SQL_ID_COL} IN (SELECT {SQL_ID_COL} FROM {DELTA_TAB})")
+        self.rowSize -= _query(self.conn, f"SELECT count(*) FROM {DELTA_TAB}")[0]
+        return self._maintain(-1, lambda:None)
+
+    def update(self, ids:Iterable[int], rows:pd.DataFrame)->Tuple[List[int], List[Rule]]:
+        """
+        rows replace the rows of ids, they get new ids
+        """
+        flipped = {rule_key(r):r for r in self.delete(ids)}
+        ids, inserted = self.insert(rows)
+        for r in inserted:
+            key = rule_key(r)
+            if key in flipped:
+                del flipped[key] # flipped back
+            else:
+                flipped[key] = r
+        return ids, list(flipped.values())
+
+    def _maintain(self, sign:int, merge)->List[Rule]:
+        before = {key:status(rule, self.cover, self.confidence) for key, rule in self.rules.items()}
+        self._apply(sign)
+        merge()
+        self.conn.execute(f"DROP TABLE {DELTA_TAB}")
+        self.conn.commit()
+        changed = [rule for key, rule in self.rules.items() if status(rule, self.cover, self.confidence) != before[key]]
+        fathers = {rule_key(rule):rule for rule in changed if status(rule, self.cover, self.confidence) == FATHER}
+        # the children of a superset of a rule which stopped being ok were pruned, the superset is re-opened too
+        lost = [rule for rule in changed if before[rule_key(rule)] == OK]
+        if len(lost) > 0:
+            byY:Dict[Predicate, List[Rule]] = {}
+            for rule in self.rules.values():
+                if status(rule, self.cover, self.confidence) == FATHER:
+                    byY.setdefault(rule.y, []).append(rule)
+            for rule in lost:
+                xs = frozenset(rule.Xs)
+                for other in byY.get(rule.y, []):
+                    if other.sameTable == rule.sameTable and xs <= frozenset(other.Xs):
+                        fathers[rule_key(other)] = other
+        found = self._reopen(list(fathers.values()))
+        self.save()
+        return [rule for rule in changed if OK in (before[rule_key(rule)], status(rule, self.cover, self.confidence))] + found
+
+    def _reopen(self, fathers:List[Rule])->List[Rule]:
+        """
+        level-wise search below fathers on the current rows, new ok rules are returned
+        """
+        found:List[Rule] = []
+        if len(fathers) == 0:
+            return found
+        pruner = CandidatePruner(self.cover, self.confidence)
+        pruner.record(list(self.rules.values()))
+        generators = {singleLine:CandidateGenerator(*_pools(self.rules.values(), singleLine)) for singleLine in (True, False)}
+        self._bind(BASE_TAB, BASE_TAB)
+        while len(fathers) > 0:
+            children:List[Rule] = []
+            for father in fathers:
+                if father.generation < self.max_depth:
+                    children.extend(generators[father.singleLine()].children(father, father.generation + 1))
+            children = [child for child in pruner.filter(children) if rule_key(child) not in self.rules]
+            for group in group_by_lhs(children):
+                RuleExecutor._execute_group(self.conn, group, self.rowSize, self.rowSize)
+            pruner.record(children)
+            fathers = []
+            for child in children:
+                self.rules[rule_key(child)] = child
+                s = status(child, self.cover, self.confidence)
+                if s == OK:
+                    found.append(child)
+                elif s == FATHER:
+                    fathers.append(child)
+        return found
+
+if __name__ == '__main__':
+    import shutil, tempfile
+    data = pd.read_csv("testdata/tax_100.csv", dtype=str)
+    store = tempfile.mkdtemp(prefix="grf_inc_")
+    maintainer = RuleMaintainer.discover(store, data.iloc[:80], cover=0.05, confidence=0.9, multi_line=False)
+    print(f"{len(maintainer.found())} rules on 80 rows")
+    ids, flipped = maintainer.insert(data.iloc[80:])
+    print(f"{len(flipped)} rules flipped after inserting 20 rows, {len(maintainer.found())} rules")
+    maintainer.close()
+    shutil.rmtree(store)
@@ -0,0 +1,104 @@
+"""
+Metrics of a discovery run. Producers call Instrument methods, consumers are hooks called with (event, record)
+and an optional JSON-lines file. Without hooks and sink the instrument is disabled and producers skip all bookkeeping.
+"""
+
+import json
+import math
+import heapq
+import threading
+from typing import Callable, Dict, List, Tuple
+
+Hook = Callable[[str, dict], None]
+
+class JsonLinesSink:
+    def __init__(self, path:str) -> None:
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def __call__(self, event:str, record:dict) -> None:
+        line = json.dumps({"event":event, **record}, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self)->None:
+        self.file.close()
+
+class Instrument:
+    """
+    events:
+        level  - one level of a level-wise search: candidates generated, deduplicated, pruned, evaluated, found, fathers and the seconds spent generating/evaluating
+        y      - the same counts per Y, when per_y
+        summary - latency histogram (log2 buckets of ms) of evaluated LHS groups and the slowest of them with their SQL or plan, on close()
+    """
+    def __init__(self, hooks:List[Hook] = [], sink:str = None, per_y:bool = True, slowest:int = 20) -> None:
+        self.hooks:List[Hook] = list(hooks)
+        self.sink = JsonLinesSink(sink) if sink is not None else None
+        if self.sink is not None:
+            self.hooks.append(self.sink)
+        self.per_y = per_y
+        self.slowest = slowest
+        self.histogram:Dict[int, int] = {}
+        # min-heap of (seconds, n, record), the slowest groups seen so far
+        self._slow:List[Tuple[float, int, dict]] = []
+        self._n = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self)->bool:
+        return len(self.hooks) > 0
+
+    def emit(self, event:str, record:dict)->None:
+        for hook in self.hooks:
+            hook(event, record)
+
+    def level(self, table:str, phase:str, level:int, rules:list, generated:int, deduplicated:int, pruned:int,
+            generation_s:float, coverage_s:float, evaluation_s:float, cover:float, confidence:float)->None:
+        found = fathers = 0
+        perY:Dict[object, List[int]] = {}
+        for rule in rules:
+            ok = rule.ok(cover, confidence)
+            father = not ok and rule.reproducible(cover)
+            found += ok
+            fathers += father
+            if self.per_y:
+                counts = perY.setdefault(rule.y, [0, 0, 0])
+                counts[0] += 1
+                counts[1] += ok
+                counts[2] += father
+        self.emit("level", {"table":table, "phase":phase, "level":level, "generated":generated, "deduplicated":deduplicated,
+            "pruned":pruned, "evaluated":len(rules), "found":found, "fathers":fathers,
+            "generation_s":round(generation_s, 6), "coverage_s":round(coverage_s, 6), "evaluation_s":round(evaluation_s, 6)})
+        for y, (evaluated, yFound, yFathers) in perY.items():
+            self.emit("y", {"table":table, "phase":phase, "level":level, "y":str(y), "evaluated":evaluated, "found":yFound, "fathers":yFathers})
+
+    def latency(self, seconds:float, rules:list, plan:Callable[[], str])->None:
+        """
+        one evaluation of rules sharing their LHS, plan is only called for the slowest ones
+        """
+        bucket = max(0, math.ceil(math.log2(seconds * 1000))) if seconds > 0.001 else 0
+        with self._lock:
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+            if len(self._slow) >= self.slowest and seconds <= self._slow[0][0]:
+                return
+            self._n += 1
+            head = rules[0]
+            record = {"seconds":round(seconds, 6), "rules":len(rules), "xs":" ^ ".join(str(x) for x in head.Xs), "plan":plan()}
+            if len(self._slow) < self.slowest:
+                heapq.heappush(self._slow, (seconds, self._n, record))
+            else:
+                heapq.heapreplace(self._slow, (seconds, self._n, record))
+
+    def summary(self)->dict:
+        with self._lock:
+            return {"histogram_ms":{f"<={1 << b}":c for b, c in sorted(self.histogram.items())},
+                "slowest":[r for _, _, r in sorted(self._slow, key=lambda s:s[0], reverse=True)]}
+
+    def close(self)->None:
+        if self.enabled:
+            self.emit("summary", self.summary())
+        if self.sink is not None:
+            self.sink.close()
+            self.hooks.remove(self.sink)
+            self.sink = None
@@ -0,0 +1,263 @@
+"""
+In-memory evaluation engine. Same contract as RuleExecutor but counts xSupp/supp with numpy masks over dictionary-encoded columns instead of SQL.
+"""
+
+import time
+from itertools import combinations
+from typing import Dict, List, Union
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from rule import Predicate, Rule, row_size, group_by_lhs
+from encoded_table import EncodedTable, NULL_CODE, unpack
+from pair_counter import refine, count_pairs, count_range_pairs, not_null, NO_GROUP, COMPARE
+from partition_cache import PartitionCache, prefix_keys
+
+class _Conjunction:
+    """
+    an evaluated conjunction of predicates: row masks of t0/t1, the partition made by its equality structural predicates
+    and the structural predicates which can not be folded into the partition
+    """
+    __slots__ = ('m0', 'm1', 'g0', 'g1', 'others')
+    def __init__(self, m0:np.ndarray, m1:np.ndarray, g0:np.ndarray, g1:np.ndarray, others:List[Predicate]) -> None:
+        self.m0 = m0
+        self.m1 = m1
+        self.g0 = g0
+        self.g1 = g1
+        self.others = others
+
+    def copy(self)->'_Conjunction':
+        return _Conjunction(self.m0, self.m1, self.g0, self.g1, self.others)
+
+    def arrays(self, root:'_Conjunction')->List[np.ndarray]:
+        """
+        the arrays not shared with root, those of root live as long as the executor
+        """
+        held = (root.m0, root.m1, root.g0, root.g1)
+        return [a for a in (self.m0, self.m1, self.g0, self.g1) if not any(a is b for b in held)]
+
+class NumpyRuleExecutor:
+    # max number of (t0, t1) cells compared at once when enumerating pairs
+    PAIR_BLOCK_CELLS = 1 << 22
+    # t0.a <> t1.a predicates are counted by inclusion-exclusion over 2^k partitions up to this k
+    MAX_INCLUSION_EXCLUSION = 4
+
+    def __init__(self, t0:Union[pd.DataFrame, EncodedTable], t1:Union[pd.DataFrame, EncodedTable] = None, cache_bytes:int = 1 << 28) -> None:
+        self.tab0 = t0 if isinstance(t0, EncodedTable) else EncodedTable.encode(t0)
+        if t1 is None:
+            self.tab1 = self.tab0
+        else:
+            self.tab1 = t1 if isinstance(t1, EncodedTable) else EncodedTable.encode(t1)
+        self.t0_len = len(self.tab0)
+        self.t1_len = len(self.tab1)
+        self.cache:PartitionCache[_Conjunction] = PartitionCache(cache_bytes)
+        self._root = _Conjunction(np.ones(self.t0_len, dtype=bool), np.ones(self.t1_len, dtype=bool),
+            np.zeros(self.t0_len, dtype=np.int64), np.zeros(self.t1_len, dtype=np.int64), [])
+        self.execute_time = 0.0
+        self.rule_number = 0
+        # xSupp/supp evaluations answered by a computation shared with other rules
+        self.dedup_number = 0
+        # an Instrument receiving the latency of every LHS group, None when disabled
+        self.instrument = None
+
+        print("Numpy rule executor launched")
+
+    @staticmethod
+    def _values(tab:EncodedTable, col:str)->np.ndarray:
+        # compared as sqlite compares CAST(col AS REAL), a string which is not a number counts as its leading number or 0.0
+        return tab.reals(col)
+
+    def _row_mask(self, tab:EncodedTable, col:str, p:Predicate)->np.ndarray:
+        if p.isRange():
+            return COMPARE[p.operator](NumpyRuleExecutor._values(tab, col), float(p.constant))
+        codes = tab.codes[col]
+        code = tab.code_of(col, p.constant)
+        if p.operator == '=':
+            bitmap = tab.bitmaps.get((col, code))
+            return codes == code if bitmap is None else unpack(bitmap, len(tab))
+        elif p.operator == '<>':
+            return (codes != code) & (codes != NULL_CODE)
+        else:
+            raise Exception('NoImpl ' + p.operator)
+
+    def _extend(self, state:'_Conjunction', p:Predicate)->'_Conjunction':
+        """
+        evaluate state ^ p from the evaluated state, arrays not touched by p are shared with state
+        """
+        child = state.copy()
+        if p.isConst():
+            if p.t1_col is None:
+                child.m0 = state.m0 & self._row_mask(self.tab0, p.t0_col, p)
+            else:
+                child.m1 = state.m1 & self._row_mask(self.tab1, p.t1_col, p)
+        elif p.operator == '=':
+            child.g0, child.g1 = refine(state.g0, state.g1, self.tab0.codes[p.t0_col], self.tab0.translate(p.t0_col, self.tab1, p.t1_col))
+        else:
+            if p.operator == '<>':
+                # t0.a <> t1.b holds iff both are not NULL and t0.a = t1.b does not hold
+                child.m0 = state.m0 & not_null(self.tab0.codes[p.t0_col])
+                child.m1 = state.m1 & not_null(self.tab1.codes[p.t1_col])
+            elif p.isRange():
+                child.m0 = state.m0 & ~np.isnan(NumpyRuleExecutor._values(self.tab0, p.t0_col))
+                child.m1 = state.m1 & ~np.isnan(NumpyRuleExecutor._values(self.tab1, p.t1_col))
+            child.others = state.others + [p]
+        return child
+
+    def _state(self, ps:List[Predicate])->'_Conjunction':
+        """
+        evaluate the conjunction ps starting from its longest cached prefix, every longer prefix is cached on the way
+        """
+        ps = list(dict.fromkeys(ps))
+        if len(ps) == 0:
+            return self._root
+        keys = prefix_keys(ps)
+        state = self.cache.get(keys[-1])
+        if state is not None:
+            return state
+        k = len(ps) - 1
+        while k > 0 and keys[k-1] not in self.cache:
+            k -= 1
+        state = self.cache.get(keys[k-1]) if k > 0 else self._root
+        for i in range(k, len(ps)):
+            child = self._extend(state, ps[i])
+            self.cache.put(keys[i], child, child.arrays(self._root))
+            state = child
+        return state
+
+    @staticmethod
+    def _countable(others:List[Predicate])->bool:
+        # <> by inclusion-exclusion, on top of at most one range predicate counted by sorting
+        ranges = [p for p in others if p.isRange()]
+        neqs = [p for p in others if not p.isRange()]
+        return len(ranges) <= 1 and all(p.operator == '<>' for p in neqs) and len(neqs) <= NumpyRuleExecutor.MAX_INCLUSION_EXCLUSION
+
+    def _count_pairs(self, state:'_Conjunction', sameTable:bool)->int:
+        if not NumpyRuleExecutor._countable(state.others):
+            return self._enumerate_pairs(state, sameTable)
+        neqs = [p for p in state.others if not p.isRange()]
+        ranges = [p for p in state.others if p.isRange()]
+        if len(ranges) > 0:
+            r = ranges[0]
+            v0, v1 = NumpyRuleExecutor._values(self.tab0, r.t0_col), NumpyRuleExecutor._values(self.tab1, r.t1_col)
+            count = lambda g0, g1:count_range_pairs(g0, g1, state.m0, state.m1, v0, v1, r.operator, sameTable)
+        else:
+            count = lambda g0, g1:count_pairs(g0, g1, state.m0, state.m1, sameTable)
+        total = 0
+        for k in range(len(neqs) + 1):
+            for subset in combinations(neqs, k):
+                g0, g1 = state.g0, state.g1
+                for p in subset:
+                    g0, g1 = refine(g0, g1, self.tab0.codes[p.t0_col], self.tab0.translate(p.t0_col, self.tab1, p.t1_col))
+                total += (-1) ** k * count(g0, g1)
+        return total
+
+    def _enumerate_pairs(self, state:'_Conjunction', sameTable:bool)->int:
+        rows0 = np.flatnonzero(state.m0 & (state.g0 != NO_GROUP))
+        rows1 = np.flatnonzero(state.m1 & (state.g1 != NO_GROUP))
+        if len(rows0) == 0 or len(rows1) == 0:
+            return 0
+        structs = state.others
+        lefts = [NumpyRuleExecutor._values(self.tab0, p.t0_col) if p.isRange() else self.tab0.codes[p.t0_col] for p in structs]
+        rights = [NumpyRuleExecutor._values(self.tab1, p.t1_col) if p.isRange() else self.tab0.translate(p.t0_col, self.tab1, p.t1_col) for p in structs]
+        block = max(1, NumpyRuleExecutor.PAIR_BLOCK_CELLS // len(rows1))
+        total = 0
+        for start in range(0, len(rows0), block):
+            r0 = rows0[start:start+block]
+            ok = state.g0[r0][:, None] == state.g1[rows1][None, :]
+            for p, left, right in zip(structs, lefts, rights):
+                a = left[r0][:, None]
+                b = right[rows1][None, :]
+                if p.operator == '=':
+                    ok &= (a == b) & (a != NULL_CODE)
+                elif p.operator == '<>':
+                    ok &= (a != b) & (a != NULL_CODE) & (b != NULL_CODE)
+                elif p.isRange():
+                    ok &= COMPARE[p.operator](a, b)
+                else:
+                    raise Exception('NoImpl ' + p.operator)
+            if sameTable:
+                ok &= r0[:, None] != rows1[None, :]
+            total += int(np.count_nonzero(ok))
+        return total
+
+    def _count(self, state:'_Conjunction', singleLine:bool, sameTable:bool)->int:
+        if singleLine:
+            return int(np.count_nonzero(state.m0))
+        return self._count_pairs(state, sameTable)
+
+    def _execute_group(self, rules:List[Rule]):
+        # all rules have the same lhs_key
+        head = rules[0]
+        singleLine = head.singleLine()
+        xState = self._state(head.Xs)
+        xSupp = self._count(xState, singleLine, head.sameTable)
+        # column -> number of rows satisfying Xs per code, shared by the single-line ys t0.col = 'v'
+        valueCounts:Dict[str, np.ndarray] = {}
+        for rule in rules:
+            y = rule.y
+            if singleLine and y.operator == '=':
+                counts = valueCounts.get(y.t0_col)
+                if counts is None:
+                    codes = self.tab0.codes[y.t0_col]
+                    counts = np.bincount(codes[xState.m0 & (codes != NULL_CODE)], minlength=len(self.tab0.dictionaries[y.t0_col]))
+                    valueCounts[y.t0_col] = counts
+                else:
+                    self.dedup_number += 1
+                code = self.tab0.code_of(y.t0_col, y.constant)
+                rule.supp = int(counts[code]) if code >= 0 else 0
+            else:
+                rule.supp = self._count(self._extend(xState, y), singleLine, rule.sameTable)
+            rule.xSupp = xSupp
+            rule.rowSize = row_size(rule, self.t0_len, self.t1_len)
+        self.dedup_number += len(rules) - 1
+
+    def plan(self, rule:Rule)->str:
+        """
+        how the xSupp of rule is counted, read from the predicates alone so the cache is left as it is
+        """
+        if rule.singleLine():
+            return "row mask"
+        # the structural predicates _extend can not fold into the partition
+        others = [p for p in dict.fromkeys(rule.Xs) if not p.isConst() and p.operator != '=']
+        if not NumpyRuleExecutor._countable(others):
+            return f"pair enumeration over {len(others)} unfolded predicates"
+        ranges = sum(p.isRange() for p in others)
+        return f"partition, inclusion-exclusion over {len(others) - ranges} <> predicates" + (", range pairs by sorting" if ranges > 0 else "")
+
+    # 返回值就是入参 rules，可以不接收
+    def execute(self, rules:List[Rule], progressBar:bool=True)->List[Rule]:
+        self.execute_time -= time.time()
+        bar = tqdm(total = len(rules), desc = "Executing") if progressBar else None
+        instrument = self.instrument
+        for group in group_by_lhs(rules):
+            if instrument is None:
+                self._execute_group(group)
+            else:
+                start = time.perf_counter()
+                self._execute_group(group)
+                instrument.latency(time.perf_counter() - start, group, lambda: self.plan(group[0]))
+            if bar is not None:
+                bar.update(len(group))
+        if bar is not None:
+            bar.close()
+        self.execute_time += time.time()
+        self.rule_number += len(rules)
+        return rules
+
+    # numpy already vectorizes every rule, workerNum is accepted for compatibility with RuleExecutor
+    def execute_parallel(self, rules:List[Rule], workerNum:int=None)->List[Rule]:
+        return self.execute(rules)
+
+    def __del__(self):
+        if self.rule_number > 0:
+            print(f"NumpyRuleExecutor closed. Executing {self.rule_number} rules in {self.execute_time}s. {self.execute_time*1000/self.rule_number}ms/rule. "
+                f"{self.dedup_number} evaluations deduplicated. Partition cache hits {self.cache.hits}, misses {self.cache.misses}, evictions {self.cache.evictions}")
+
+if __name__ == '__main__':
+    data = pd.read_csv("testdata/relation.csv", dtype=str)
+    rule1 = Rule(Xs = [Predicate.newConst0("pn", "2222222"), Predicate.newConst0("ac", "908", "<>"), Predicate.newConst0("ct", "EDI", "<>")],
+        y = Predicate.newConst0("cc", "01"))
+    rule2 = Rule(Xs = [Predicate.newStruct("cc")], y = Predicate.newStruct("ac"))
+    NumpyRuleExecutor(data).execute([rule1, rule2])
+    print(rule1)
+    print(rule2)
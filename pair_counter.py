@@ -0,0 +1,77 @@
+"""
+Counting (t0, t1) tuple pairs without enumerating them.
+Pairs agreeing on the equality structural predicates share a group id, so the number of pairs is a sum of per-group products.
+"""
+
+from typing import Tuple
+import numpy as np
+from encoded_table import NULL_CODE
+
+# marks rows which can not take part in any pair (NULL or value absent on the other side)
+NO_GROUP = -1
+
+def refine(g0:np.ndarray, g1:np.ndarray, left:np.ndarray, right:np.ndarray)->Tuple[np.ndarray, np.ndarray]:
+    """
+    intersect the partitions g0/g1 with one more equality predicate left = right.
+    left holds t0 codes, right holds t1 codes already translated into the code space of left.
+    """
+    n0 = len(g0)
+    g = np.concatenate((g0, g1)).astype(np.int64)
+    c = np.concatenate((left, right)).astype(np.int64)
+    valid = (g != NO_GROUP) & (c >= 0)
+    combined = g[valid] * (int(c.max(initial=0)) + 1) + c[valid]
+    _, dense = np.unique(combined, return_inverse=True)
+    out = np.full(len(g), NO_GROUP, dtype=np.int64)
+    out[valid] = dense.reshape(-1)
+    return out[:n0], out[n0:]
+
+def count_pairs(g0:np.ndarray, g1:np.ndarray, m0:np.ndarray, m1:np.ndarray, sameTable:bool)->int:
+    """
+    number of pairs (i, j) with m0[i], m1[j], g0[i] = g1[j] != NO_GROUP, and i != j when sameTable
+    """
+    in0 = m0 & (g0 != NO_GROUP)
+    in1 = m1 & (g1 != NO_GROUP)
+    size = int(max(g0.max(initial=-1), g1.max(initial=-1))) + 1
+    c0 = np.bincount(g0[in0], minlength=size)
+    c1 = np.bincount(g1[in1], minlength=size)
+    total = int(np.dot(c0.astype(np.int64), c1.astype(np.int64)))
+    if sameTable:
+        # t0.id <> t1.id removes a row paired with itself
+        n = min(len(g0), len(g1))
+        total -= int(np.count_nonzero(in0[:n] & in1[:n] & (g0[:n] == g1[:n])))
+    return total
+
+COMPARE = {'<':np.less, '<=':np.less_equal, '>':np.greater, '>=':np.greater_equal}
+
+def count_range_pairs(g0:np.ndarray, g1:np.ndarray, m0:np.ndarray, m1:np.ndarray, v0:np.ndarray, v1:np.ndarray, operator:str, sameTable:bool)->int:
+    """
+    number of pairs counted by count_pairs on which v0[i] operator v1[j] also holds (NaN never does).
+    t1 rows are sorted by (group, rank of value) and every t0 row binary searches its group, O(n log n) instead of the n^2 pairs
+    """
+    in0 = m0 & (g0 != NO_GROUP) & ~np.isnan(v0)
+    in1 = m1 & (g1 != NO_GROUP) & ~np.isnan(v1)
+    a0, a1 = v0[in0], v1[in1]
+    if len(a0) == 0 or len(a1) == 0:
+        return 0
+    _, ranks = np.unique(np.concatenate((a0, a1)), return_inverse=True)
+    ranks = ranks.reshape(-1).astype(np.int64)
+    size = int(ranks.max()) + 1
+    h0 = g0[in0].astype(np.int64)
+    key0 = h0 * size + ranks[:len(a0)]
+    keys1 = np.sort(g1[in1].astype(np.int64) * size + ranks[len(a0):])
+    if operator == '<' or operator == '<=':
+        # t1 rows of the group above the value of the t0 row
+        end = np.searchsorted(keys1, (h0 + 1) * size, 'left')
+        total = int((end - np.searchsorted(keys1, key0, 'right' if operator == '<' else 'left')).sum())
+    elif operator == '>' or operator == '>=':
+        start = np.searchsorted(keys1, h0 * size, 'left')
+        total = int((np.searchsorted(keys1, key0, 'left' if operator == '>' else 'right') - start).sum())
+    else:
+        raise Exception('NoImpl ' + operator)
+    if sameTable:
+        n = min(len(g0), len(g1))
+        total -= int(np.count_nonzero(in0[:n] & in1[:n] & (g0[:n] == g1[:n]) & COMPARE[operator](v0[:n], v1[:n])))
+    return total
+
+def not_null(codes:np.ndarray)->np.ndarray:
+    return codes != NULL_CODE
@@ -0,0 +1,113 @@
+"""
+Size-bounded LRU cache of evaluated predicate sets.
+Entries are found by order-independent hashes of predicate sets so that the same Xs reached in a different order hit the same entry,
+the sorted predicate ids kept with an entry tell a hash collision from a hit.
+An entry often shares arrays with the entry it was extended from, every distinct array is charged once while an entry holds it.
+"""
+
+import bisect
+from collections import OrderedDict
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+import numpy as np
+from rule import Predicate
+
+V = TypeVar('V')
+# (number of predicates, sum of mixed predicate ids mod 2^64)
+SetKey = Tuple[int, int]
+# a SetKey and the sorted predicate ids it was made of
+PrefixKey = Tuple[SetKey, Tuple[int, ...]]
+
+_MASK64 = (1 << 64) - 1
+
+def _mix(x:int)->int:
+    # splitmix64 finalizer
+    z = (x + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+def prefix_keys(ps:List[Predicate])->List[PrefixKey]:
+    """
+    keys of ps[:1], ps[:2] ... ps[:len(ps)]. ps must not contain duplicates
+    """
+    keys:List[PrefixKey] = []
+    h = 0
+    ids:List[int] = []
+    for i, p in enumerate(ps):
+        h = (h + _mix(p.id)) & _MASK64
+        bisect.insort(ids, p.id)
+        keys.append(((i + 1, h), tuple(ids)))
+    return keys
+
+class PartitionCache(Generic[V]):
+    def __init__(self, max_bytes:int = 1 << 28) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.collisions = 0
+        # set key -> (value, distinct arrays of value, sorted predicate ids)
+        self._entries:'OrderedDict[SetKey, tuple]' = OrderedDict()
+        # id of a charged array -> [array, number of entries holding it]
+        self._arrays:Dict[int, list] = {}
+
+    def _entry(self, key:PrefixKey)->Optional[tuple]:
+        entry = self._entries.get(key[0])
+        if entry is not None and entry[2] != key[1]:
+            # another predicate set with the same hash
+            self.collisions += 1
+            return None
+        return entry
+
+    def get(self, key:PrefixKey)->Optional[V]:
+        entry = self._entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key[0])
+        return entry[0]
+
+    def put(self, key:PrefixKey, value:V, arrays:Iterable[np.ndarray])->None:
+        """
+        arrays are those of value which the cache pays for, arrays living anyway (e.g. of the whole table) are left out
+        """
+        arrays = list({id(a):a for a in arrays}.values())
+        if sum(a.nbytes for a in arrays) > self.max_bytes:
+            return
+        # replaces the entry of the same set, or of a colliding one
+        old = self._entries.pop(key[0], None)
+        if old is not None:
+            self._release(old[1])
+        for a in arrays:
+            held = self._arrays.get(id(a))
+            if held is None:
+                self._arrays[id(a)] = [a, 1]
+                self.bytes += a.nbytes
+            else:
+                held[1] += 1
+        self._entries[key[0]] = (value, arrays, key[1])
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self._release(evicted)
+            self.evictions += 1
+
+    def _release(self, arrays:List[np.ndarray])->None:
+        for a in arrays:
+            held = self._arrays[id(a)]
+            held[1] -= 1
+            if held[1] == 0:
+                del self._arrays[id(a)]
+                self.bytes -= a.nbytes
+
+    def clear(self)->None:
+        self._entries.clear()
+        self._arrays.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key:PrefixKey) -> bool:
+        return self._entry(key) is not None
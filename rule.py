@@ -1,24 +1,115 @@
-from typing import List, Optional, Set, Callable, Optional
+from typing import Dict, Iterable, List, Optional, Set, Callable, Optional, Tuple, Union
 import pandas as pd
 from tqdm import tqdm
 import sqlite3
 import os 
 import time
 import copy
+import shutil
+import threading
+import tempfile
+import uuid
+from urllib.request import pathname2url
+from utils import groupByKey
+from encoded_table import EncodedTable
 
 SQL_TAB0 = "tab0"
 SQL_TAB1 = "tab1"
 SQL_ID_COL = "id1213"
 
+# ordered comparisons of numeric columns, evaluated on the values cast to real numbers
+RANGE_OPERATORS = ('<', '<=', '>', '>=')
+NEGATED_OPERATORS = {'=':'<>', '<':'>=', '<=':'>', '>':'<=', '>=':'<'}
+
 class Predicate:
-    def __init__(self, t0_col:str, t1_col:str, operator:str, constant:str) -> None:
-        self.t0_col = t0_col
-        self.t1_col = t1_col
-        self.operator = operator
-        self.constant = constant
-        self.columns = set([col for col in [t0_col, t1_col] if col is not None])
+    """
+    Predicates are interned and immutable. Equal predicates share one integer id, so hashing,
+    equality and compatible() are integer operations.
+    The registry keeps every distinct predicate created by the process, a long-lived process searching many unrelated tables
+    calls Predicate.clear() between them
+    """
+    __slots__ = ('t0_col', 't1_col', 'operator', 'constant', 'columns', 'negative', 'id', 'columnMask', '_str', '_sql', '_negation')
+
+    # (t0_col, t1_col, operator, constant, negative) -> predicate
+    _registry:Dict[tuple, 'Predicate'] = {}
+    # (t0_col, t1_col, operator, constant) -> id. A negated predicate equals the same predicate created directly
+    _ids:Dict[tuple, int] = {}
+    # ids are never reused, even after clear()
+    _nextId = 0
+    # column name -> bit of columnMask
+    _columnBits:Dict[str, int] = {}
+    # tables may be searched by several threads
+    _lock = threading.RLock()
+
+    def __new__(cls, t0_col:str, t1_col:str, operator:str, constant:str, negative:bool = False) -> 'Predicate':
+        key = (t0_col, t1_col, operator, constant, negative)
+        p = Predicate._registry.get(key)
+        if p is not None:
+            return p
+        with Predicate._lock:
+            p = Predicate._registry.get(key)
+            if p is None:
+                p = cls._intern(key)
+            return p
+
+    @classmethod
+    def _intern(cls, key:tuple)->'Predicate':
+        t0_col, t1_col, operator, constant, negative = key
+        p = object.__new__(cls)
+        init = lambda name, value:object.__setattr__(p, name, value)
+        init('t0_col', t0_col)
+        init('t1_col', t1_col)
+        init('operator', operator)
+        init('constant', constant)
+        init('columns', frozenset([col for col in [t0_col, t1_col] if col is not None]))
         # new creating predicates are not negative
-        self.negative = False
+        init('negative', negative)
+        id = Predicate._ids.get(key[:4])
+        if id is None:
+            id = Predicate._nextId
+            Predicate._nextId += 1
+            Predicate._ids[key[:4]] = id
+        init('id', id)
+        init('columnMask', Predicate.maskOf(p.columns))
+        init('_str', p.__repr__())
+        init('_sql', p.__repr__(escape=True))
+        init('_negation', None)
+        Predicate._registry[key] = p
+        return p
+
+    def __setattr__(self, name:str, value) -> None:
+        raise AttributeError(f"Predicate {self} is immutable")
+
+    def __reduce__(self):
+        # re-intern on unpickling, ids are local to a process
+        return (Predicate, (self.t0_col, self.t1_col, self.operator, self.constant, self.negative))
+
+    def __copy__(self)->'Predicate':
+        return self
+
+    def __deepcopy__(self, memo)->'Predicate':
+        return self
+
+    @staticmethod
+    def clear()->None:
+        """
+        forget the interned predicates. Predicates and rules made before no longer equal those made after,
+        so none of them may be mixed with the next search. Column bits are kept, masks stay comparable
+        """
+        with Predicate._lock:
+            Predicate._registry.clear()
+            Predicate._ids.clear()
+
+    @staticmethod
+    def maskOf(columns:Iterable[str])->int:
+        mask = 0
+        for col in columns:
+            bit = Predicate._columnBits.get(col)
+            if bit is None:
+                with Predicate._lock:
+                    bit = Predicate._columnBits.setdefault(col, len(Predicate._columnBits))
+            mask |= 1 << bit
+        return mask
     
     @staticmethod
     def newConst0(col:str, constant:str, operator:str = '=')->'Predicate':
@@ -38,54 +129,97 @@ class Predicate:
         return self.constant is not None
     
     def copy(self)->'Predicate':
-        return copy.deepcopy(self)
+        return self
     
     def negate(self)->'NegPred':
         if self.negative:
             raise Exception("Double negation on " + str(self))
-
-        def negateOp(op:str)->str:
-            if op == '=':
-                return '<>'
-            else:
-                raise Exception('NoImpl ' + op)
-
-        p = self.copy()
-        p.operator = negateOp(p.operator)
-        p.negative = True
-        return p
+        if self._negation is None:
+            def negateOp(op:str)->str:
+                if op in NEGATED_OPERATORS:
+                    return NEGATED_OPERATORS[op]
+                else:
+                    raise Exception('NoImpl ' + op)
+
+            negation = Predicate(self.t0_col, self.t1_col, negateOp(self.operator), self.constant, negative=True)
+            object.__setattr__(self, '_negation', negation)
+        return self._negation
     
     def __eq__(self, __o: object) -> bool:
-        return str(self) == str(__o)
+        return isinstance(__o, Predicate) and self.id == __o.id
     
     def __hash__(self) -> int:
-        return hash(str(self))
+        return self.id
 
 
     def compatible(self, *anothers:'Predicate')->bool:
         for another in anothers:
-            if len(self.columns & another.columns) != 0:
+            if self.columnMask & another.columnMask != 0:
                 return False
         return True
     
     def __str__(self, right_tuple_id:int = 1, escape:bool = False) -> str:
+        if right_tuple_id == 1 and not escape:
+            return self._str
         return self.__repr__(right_tuple_id, escape)
     
     def __repr__(self, right_tuple_id:int = 1, escape:bool = False) -> str:
+        if self.operator in RANGE_OPERATORS:
+            return self._rangeRepr(right_tuple_id, escape)
         if self.constant is None:
             return f"t0.{self.t0_col} {self.operator} t{right_tuple_id}.{self.t1_col}"
         else:
-            const_str = self.constant
-            if escape:
-                const_str = const_str.replace("\'", "\'\'")
-                const_str = const_str.replace("\"", "\"\"")
+            const_str = Predicate._escape(self.constant) if escape else self.constant
             if self.t1_col is None:
                 return f"t0.{self.t0_col} {self.operator} '{const_str}'"
             else:
                 return f"t{right_tuple_id}.{self.t1_col} {self.operator} '{const_str}'"
 
+    def _rangeRepr(self, right_tuple_id:int, escape:bool)->str:
+        # numbers are stored as text, the SQL compares them as REAL
+        operand = (lambda o:f"CAST({o} AS REAL)") if escape else (lambda o:o)
+        left = operand(f"t0.{self.t0_col}") if self.t0_col is not None else operand(f"t{right_tuple_id}.{self.t1_col}")
+        if self.constant is None:
+            return f"{left} {self.operator} {operand(f't{right_tuple_id}.{self.t1_col}')}"
+        return f"{left} {self.operator} {float(self.constant)!r}" if escape else f"{left} {self.operator} {self.constant}"
+
+    def isRange(self)->bool:
+        return self.operator in RANGE_OPERATORS
+
     def sql(self)->str:
-        return self.__repr__(escape=True)
+        return self._sql
+
+    @staticmethod
+    def _escape(constant:str)->str:
+        constant = constant.replace("\'", "\'\'")
+        return constant.replace("\"", "\"\"")
+
+    @staticmethod
+    def whereSQL(ps:List['Predicate'])->List[str]:
+        """
+        SQL conditions of the conjunction ps. Negative constants on one column, t0.a <> 'x' AND t0.a <> 'y', 
+        become t0.a NOT IN ('x', 'y') (same NULL semantics), so long conjunctions stay below SQLite's expression depth limit
+        """
+        notIns:Dict[str, List[str]] = {}
+        wheres:List[str] = []
+        for p in ps:
+            if p.isConst() and p.operator == '<>':
+                operand = f"t0.{p.t0_col}" if p.t1_col is None else f"t1.{p.t1_col}"
+                if operand not in notIns:
+                    notIns[operand] = []
+                    wheres.append(operand)
+                notIns[operand].append(p)
+            else:
+                wheres.append(p.sql())
+        for i, where in enumerate(wheres):
+            group = notIns.get(where)
+            if group is not None:
+                if len(group) == 1:
+                    wheres[i] = group[0].sql()
+                else:
+                    literals = ", ".join((f"'{Predicate._escape(p.constant)}'" for p in group))
+                    wheres[i] = f"{where} NOT IN ({literals})"
+        return wheres
 
 Y = Predicate
 NegPred = Predicate
@@ -99,10 +233,47 @@ class Rule:
         self.xSupp = xSupp
         self.supp = supp
         self.generation = generation
+        # statistics scaled from a sample by a SampleScreen which rejected the rule, not exact counts
+        self.estimated = False
+        self._columnMask:Optional[int] = None
+        # (t0 table, t1 table) names, set on the rules returned by rule_find
+        self.tables:Optional[Tuple[str, str]] = None
+
+    def __getstate__(self)->dict:
+        # column bits are numbered per process, the mask is recomputed after unpickling
+        state = self.__dict__.copy()
+        state['_columnMask'] = None
+        return state
+
+    def __setstate__(self, state:dict)->None:
+        self.__dict__.setdefault('estimated', False)
+        self.__dict__.update(state)
+        # pickles made before the mask was dropped
+        self._columnMask = None
 
     def copy(self)->'Rule':
         return copy.deepcopy(self)
 
+    def extend(self, ps:List[Predicate], generation:int)->'Rule':
+        """
+        child rule Xs + ps -> y, its column mask derives from this rule's
+        """
+        child = Rule(Xs = self.Xs + ps, y = self.y, sameTable = self.sameTable, generation = generation)
+        mask = self.columnMask()
+        for p in ps:
+            mask |= p.columnMask
+        child._columnMask = mask
+        return child
+
+    def columnMask(self)->int:
+        # Xs and y are not changed once the rule is created
+        if self._columnMask is None:
+            mask = self.y.columnMask if self.y is not None else 0
+            for p in self.Xs:
+                mask |= p.columnMask
+            self._columnMask = mask
+        return self._columnMask
+
     def allPredicates(self)->List[Predicate]:
         ps = []
         ps.extend(self.Xs)
@@ -117,7 +288,7 @@ class Rule:
         return s
     
     def compatible(self, predicate:Predicate)->bool:
-        return len(self.columns() & predicate.columns) == 0
+        return self.columnMask() & predicate.columnMask == 0
 
     def singleLine(self)->bool:
         for p in self.allPredicates():
@@ -126,8 +297,11 @@ class Rule:
         return True
     
     def xSuppSQL(self)->str:
-        sql = f"SELECT count(*) FROM {SQL_TAB0} AS t0"
-        wheres = [p.sql() for p in self.Xs]
+        return "SELECT count(*)" + self._fromWhereSQL()
+
+    def _fromWhereSQL(self)->str:
+        sql = f" FROM {SQL_TAB0} AS t0"
+        wheres = Predicate.whereSQL(self.Xs)
 
         if not self.singleLine():
             sql += f", {SQL_TAB1} AS t1"
@@ -136,6 +310,11 @@ class Rule:
 
         where = " AND ".join(wheres)
         return sql + " WHERE " + where
+
+    # xSupp and the supp of every y in one scan. Rules sharing self.Xs share this SQL
+    def suppsSQL(self, ys:List[Predicate])->str:
+        sums = "".join((f", SUM({y.sql()})" for y in ys))
+        return "SELECT count(*)" + sums + self._fromWhereSQL()
     
     def cover(self)->float:
         return 0. if self.rowSize == 0 else self.supp/self.rowSize
@@ -177,108 +356,259 @@ class Rule:
             right_tuple_id = 1 if t0_tab == t1_tab else 2
             return f"{t0_tab}(t0) ^ {t1_tab}(t{right_tuple_id}) ^ {self.__str__(right_tuple_id, statistics=statistics)}"
 
+def lhs_key(rule:Rule)->tuple:
+    # rules with the same key have the same xSupp
+    return (frozenset(rule.Xs), rule.sameTable, rule.singleLine())
+
+def group_by_lhs(rules:List[Rule])->List[List[Rule]]:
+    return list(groupByKey(rules, lhs_key).values())
+
+def row_size(rule:Rule, t0_len:int, t1_len:int)->int:
+    if rule.singleLine():
+        return t0_len
+    elif rule.sameTable:
+        return t0_len * (t0_len - 1)
+    else:
+        return t0_len * t1_len
+
 class RuleExecutor:
     SQLITE3_TEMP_FILE = 'sqlite3.db'
-    SQLITE3_URI_RW = 'file:' + SQLITE3_TEMP_FILE + "?mode=rwc"
-    SQLITE3_URI_RO = 'file:' + SQLITE3_TEMP_FILE + "?mode=ro"
-    def __init__(self, t0:pd.DataFrame, t1:pd.DataFrame = None) -> None:
-        t0 = copy.deepcopy(t0)
-        t0[SQL_ID_COL] = range(len(t0))
-
+    # storage option of a shared-cache in-memory database
+    MEMORY = ':memory:'
+    WRITE_PRAGMAS = ["PRAGMA journal_mode = OFF", "PRAGMA synchronous = OFF", "PRAGMA temp_store = MEMORY"]
+    # the database is never modified after loading
+    READ_PRAGMAS = ["PRAGMA query_only = 1", "PRAGMA journal_mode = OFF", "PRAGMA mmap_size = 1073741824",
+        "PRAGMA cache_size = -262144", "PRAGMA temp_store = MEMORY"]
+
+    # storage: None for a private temp directory, MEMORY for a shared-cache in-memory database, 
+    # or a directory (e.g. a tmpfs like /dev/shm) in which the private temp directory is created
+    def __init__(self, t0:Union[pd.DataFrame, EncodedTable], t1:Union[pd.DataFrame, EncodedTable] = None, storage:str = None, index:bool = True) -> None:
         sameTable = t1 is None
         if sameTable:
             t1 = t0
+        self.tempdir:Optional[str] = None
+        self.writer:Optional[sqlite3.Connection] = None
+        if storage == RuleExecutor.MEMORY:
+            name = f"grf_{uuid.uuid4().hex}"
+            self.uri_rw = f"file:{name}?mode=memory&cache=shared"
+            self.uri_ro = self.uri_rw
         else:
-            t1 = copy.deepcopy(t1)
-            t1[SQL_ID_COL] = range(len(t1))
-
-        RuleExecutor._rm(RuleExecutor.SQLITE3_TEMP_FILE)
-        conn:sqlite3.Connection = sqlite3.connect(RuleExecutor.SQLITE3_URI_RW, uri=True)
-        t0.to_sql(SQL_TAB0, conn)
-        t1.to_sql(SQL_TAB1, conn)
-        conn.close() # flush
-        conn = sqlite3.connect(RuleExecutor.SQLITE3_URI_RO, uri=True)
+            self.tempdir = tempfile.mkdtemp(prefix="grf_", dir=storage)
+            path = pathname2url(os.path.join(self.tempdir, RuleExecutor.SQLITE3_TEMP_FILE))
+            self.uri_rw = f"file:{path}?mode=rwc"
+            self.uri_ro = f"file:{path}?mode=ro"
+        self.in_memory = self.tempdir is None
+
+        conn:sqlite3.Connection = sqlite3.connect(self.uri_rw, uri=True)
+        for pragma in RuleExecutor.WRITE_PRAGMAS:
+            conn.execute(pragma)
+        for tab, t in [(SQL_TAB0, t0), (SQL_TAB1, t1)]:
+            # the row number is written as the id column, no copy of the table is made
+            for frame in RuleExecutor._frames(t):
+                frame.to_sql(tab, conn, index=True, index_label=SQL_ID_COL, if_exists='append')
+        if index:
+            for tab, cols in [(SQL_TAB0, t0.columns), (SQL_TAB1, t1.columns)]:
+                for i, col in enumerate(cols):
+                    conn.execute(f'CREATE INDEX "{tab}_idx{i}" ON {tab}("{col}")')
+        conn.commit()
+        if self.in_memory:
+            # an in-memory database lives as long as one connection to it
+            self.writer = conn
+        else:
+            conn.close() # flush
 
-        self.conn = conn
+        self.conn = RuleExecutor._connect_ro(self.uri_ro)
+        self.pool = None
+        self.pool_size = 0
         self.t0_len = len(t0)
         self.t1_len = len(t1)
         self.execute_time = 0.0
         self.sql_number = 0
+        # xSupp/supp evaluations answered by a SQL shared with other rules
+        self.dedup_number = 0
+        # an Instrument receiving the latency of every SQL, None when disabled
+        self.instrument = None
 
         print("Rule executor launched")
+
+    @staticmethod
+    def _frames(t:Union[pd.DataFrame, EncodedTable])->Iterable[pd.DataFrame]:
+        if isinstance(t, EncodedTable):
+            return t.iter_dataframes()
+        if not t.index.equals(pd.RangeIndex(len(t))):
+            t = t.reset_index(drop=True)
+        return [t]
+
+    @staticmethod
+    def _connect_ro(uri:str)->sqlite3.Connection:
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        for pragma in RuleExecutor.READ_PRAGMAS:
+            conn.execute(pragma)
+        return conn
     
+    # at most this many supp sums share one SQL
+    MAX_Y_PER_SQL = 500
+    # execute_parallel hands SQLs to the workers in chunks, about this many chunks per worker
+    CHUNKS_PER_WORKER = 8
+
     @staticmethod
-    def _execute0(conn:sqlite3.Connection, rule:Rule, t0_len:int, t1_len:int):
-        try:
-            rule.xSupp = conn.execute(rule.xSuppSQL()).fetchone()[0]
-            rule.supp = conn.execute(rule.suppSQL()).fetchone()[0]
-        except BaseException as e:
-            print(e, f"\nerror on execute {rule}\n {rule.xSuppSQL()}\n or {rule.suppSQL()}\n")
-            raise e
-        if rule.singleLine():
-            rule.rowSize = t0_len
-        else:
-            if rule.sameTable:
-                rule.rowSize = t0_len * (t0_len - 1)
-            else:
-                rule.rowSize = t0_len * t1_len
+    def _tasks(rules:List[Rule])->List[Tuple[List[Rule], str]]:
+        # all rules have the same lhs_key. One SQL per MAX_Y_PER_SQL rules
+        head = rules[0]
+        tasks = []
+        for i in range(0, len(rules), RuleExecutor.MAX_Y_PER_SQL):
+            part = rules[i:i+RuleExecutor.MAX_Y_PER_SQL]
+            tasks.append((part, head.suppsSQL([r.y for r in part])))
+        return tasks
 
+    @staticmethod
+    def _fill(rules:List[Rule], row:tuple, t0_len:int, t1_len:int):
+        for rule, supp in zip(rules, row[1:]):
+            rule.xSupp = row[0]
+            rule.supp = 0 if supp is None else supp
+            rule.rowSize = row_size(rule, t0_len, t1_len)
+
+    @staticmethod
+    def _execute_group(conn:sqlite3.Connection, rules:List[Rule], t0_len:int, t1_len:int):
+        for part, sql in RuleExecutor._tasks(rules):
+            RuleExecutor._fill(part, _query(conn, sql), t0_len, t1_len)
+
+    @staticmethod
+    def _query_number(groups:List[List[Rule]])->int:
+        return sum(((len(g) - 1) // RuleExecutor.MAX_Y_PER_SQL + 1 for g in groups))
+
+    def _count(self, rules:List[Rule], groups:List[List[Rule]]):
+        queries = RuleExecutor._query_number(groups)
+        self.sql_number += queries
+        # a rule costs 2 SQLs (xSupp and supp) when executed alone
+        self.dedup_number += len(rules) * 2 - queries
 
     # 返回值就是入参 rules，可以不接收
     def execute(self, rules:List[Rule], progressBar:bool=True)->List[Rule]:
         self.execute_time -= time.time()
-        for rule in (tqdm(rules, desc = "Executing") if progressBar else rules):
-            RuleExecutor._execute0(self.conn, rule, self.t0_len, self.t1_len)
+        groups = group_by_lhs(rules)
+        bar = tqdm(total = len(rules), desc = "Executing") if progressBar else None
+        instrument = self.instrument
+        for group in groups:
+            if instrument is None:
+                RuleExecutor._execute_group(self.conn, group, self.t0_len, self.t1_len)
+            else:
+                for part, sql in RuleExecutor._tasks(group):
+                    start = time.perf_counter()
+                    row = _query(self.conn, sql)
+                    instrument.latency(time.perf_counter() - start, part, lambda: self.plan(sql))
+                    RuleExecutor._fill(part, row, self.t0_len, self.t1_len)
+            if bar is not None:
+                bar.update(len(group))
+        if bar is not None:
+            bar.close()
         self.execute_time += time.time()
-        self.sql_number += len(rules) * 2
+        self._count(rules, groups)
         return rules
     
+    # rules are evaluated in place, as execute does
     def execute_parallel(self, rules:List[Rule], workerNum:int=None)->List[Rule]:
         self.execute_time -= time.time()
-        from multiprocessing import Pool
         workerNum = (os.cpu_count() + 1) if workerNum is None else workerNum
-        batchSize = int(len(rules)/workerNum) + 1
-        pool = Pool(workerNum)
-
-        futures:List = []
-        for i in range(10000000):
-            subRules = rules[batchSize*i:batchSize*(i+1)]
-            if len(subRules) == 0:
-                break
-            future = pool.apply_async(_parallel_execute, (subRules, i, self.t0_len, self.t1_len))
-            futures.append(future)
-        pool.close()
-
-        results:List[Rule] = []
-        for future in tqdm(futures, desc = "Parallel-Fetching"):
-            results.extend(future.get())
-        pool.terminate()
+        groups = group_by_lhs(rules)
+        tasks:List[Tuple[List[Rule], str]] = []
+        for group in groups:
+            tasks.extend(RuleExecutor._tasks(group))
+        # only SQL goes to the workers and only (xSupp, supp...) comes back
+        sqls = list(enumerate((sql for _, sql in tasks)))
+        chunksize = max(1, len(sqls) // (workerNum * RuleExecutor.CHUNKS_PER_WORKER))
+        results = self._pool(workerNum).imap_unordered(_pool_execute, sqls, chunksize)
+        instrument = self.instrument
+        for taskId, row, seconds in tqdm(results, total = len(sqls), desc = "Parallel-Executing"):
+            RuleExecutor._fill(tasks[taskId][0], row, self.t0_len, self.t1_len)
+            if instrument is not None:
+                instrument.latency(seconds, tasks[taskId][0], lambda: self.plan(tasks[taskId][1]))
 
         self.execute_time += time.time()
-        self.sql_number += len(rules) * 2
-        return results
-    
-    def __del__(self):
-        self.conn.close()
-        RuleExecutor._rm(RuleExecutor.SQLITE3_TEMP_FILE)
-        if self.sql_number > 0:
-            print(f"RuleExecutor closed. Executing {self.sql_number} SQLs in {self.execute_time}s. {self.execute_time*1000/self.sql_number}ms/SQL")
-
-    @staticmethod
-    def _rm(file:str):
-        if os.path.exists(file):
-            time.sleep(1e-10)
-            os.remove(file)
-
-# For parallel rule-execute
-def _parallel_execute(subRules:List[Rule], workerId:int, t0_len:int, t1_len:int)->List[Rule]:
-    conn = sqlite3.connect(RuleExecutor.SQLITE3_URI_RO, uri=True)
+        self._count(rules, groups)
+        return rules
 
-    for rule in (tqdm(subRules, desc = "Parallel-Executing-part_0") if workerId == 0 else subRules):
-        RuleExecutor._execute0(conn, rule, t0_len, t1_len)
+    def plan(self, sql:str)->str:
+        """
+        sql followed by its EXPLAIN QUERY PLAN
+        """
+        steps = self.conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+        return sql + "\n" + "\n".join(str(step[-1]) for step in steps)
+
+    def _pool(self, workerNum:int):
+        # workers live as long as the executor, each with its own read-only connection
+        if self.pool is not None and self.pool_size != workerNum:
+            self.pool.terminate()
+            self.pool = None
+        if self.pool is None:
+            from multiprocessing import Pool
+            from multiprocessing.pool import ThreadPool
+            # other processes can not attach to an in-memory database, sqlite releases the GIL while querying
+            poolType = ThreadPool if self.in_memory else Pool
+            self.pool = poolType(workerNum, initializer=_init_worker, initargs=(self.uri_ro, ))
+            self.pool_size = workerNum
+        return self.pool
+    
+    def reconnect(self):
+        """
+        called in a forked process: a connection must not cross fork, and the database files stay owned by the parent
+        """
+        if self.in_memory:
+            raise Exception("An in-memory database can not be shared with other processes, use file storage")
+        self.conn = RuleExecutor._connect_ro(self.uri_ro)
+        self.pool = None
+        self.tempdir = None
+
+    def close(self):
+        if getattr(self, 'pool', None) is not None:
+            self.pool.terminate()
+            self.pool = None
+        for conn in (getattr(self, 'conn', None), getattr(self, 'writer', None)):
+            if conn is not None:
+                conn.close()
+        self.conn = self.writer = None
+        if getattr(self, 'tempdir', None) is not None:
+            shutil.rmtree(self.tempdir, ignore_errors=True)
+            self.tempdir = None
 
-    conn.close()
-    return subRules
+    def __del__(self):
+        self.close()
+        if getattr(self, 'sql_number', 0) > 0:
+            print(f"RuleExecutor closed. Executing {self.sql_number} SQLs in {self.execute_time}s. {self.execute_time*1000/self.sql_number}ms/SQL. {self.dedup_number} evaluations deduplicated")
+
+ENGINES = ["sqlite", "numpy", "spark"]
+
+# options are passed to the constructor of the engine, e.g. storage of RuleExecutor
+def new_executor(t0:pd.DataFrame, t1:pd.DataFrame = None, engine:str = "sqlite", **options):
+    if engine == "sqlite":
+        return RuleExecutor(t0, t1, **options)
+    elif engine == "numpy":
+        from numpy_executor import NumpyRuleExecutor
+        return NumpyRuleExecutor(t0, t1, **options)
+    elif engine == "spark":
+        from spark_executor import SparkRuleExecutor
+        return SparkRuleExecutor(t0, t1, **options)
+    else:
+        raise Exception(f"Unknown engine {engine}, choose one of {ENGINES}")
+
+def _query(conn:sqlite3.Connection, sql:str)->tuple:
+    try:
+        return conn.execute(sql).fetchone()
+    except BaseException as e:
+        print(e, f"\nerror on execute {sql}\n")
+        raise e
+
+# For parallel rule-execute. Connections are per worker thread/process
+_worker = threading.local()
+
+def _init_worker(uri:str):
+    _worker.conn = RuleExecutor._connect_ro(uri)
+
+def _pool_execute(task:Tuple[int, str])->Tuple[int, tuple, float]:
+    taskId, sql = task
+    start = time.perf_counter()
+    row = _query(_worker.conn, sql)
+    return taskId, row, time.perf_counter() - start
 
 if __name__ == '__main__':
     data = pd.read_csv("testdata/relation.csv", dtype=str)
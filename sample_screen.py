@@ -0,0 +1,101 @@
+"""
+Early rejection of candidates on a uniform sample.
+Candidates whose upper confidence bound of cover (and of confidence when asked) is below the thresholds are not counted exactly,
+everything else is counted by the exact executor so that reported rules keep exact statistics.
+"""
+
+from statistics import NormalDist
+from typing import List, Optional, Union
+import math
+import numpy as np
+import pandas as pd
+from rule import Rule, new_executor, row_size
+from encoded_table import EncodedTable
+
+def wilson_upper(p:float, n:float, z:float)->float:
+    """
+    upper bound of the Wilson score interval of a proportion p observed on n samples
+    """
+    if n <= 0:
+        return 1.
+    z2 = z * z
+    return min(1., (p + z2/(2*n) + z * math.sqrt(max(p*(1-p), 0.)/n + z2/(4*n*n))) / (1 + z2/n))
+
+def _take(t:Union[pd.DataFrame, EncodedTable], rows:np.ndarray)->Union[pd.DataFrame, EncodedTable]:
+    return t.take(rows) if isinstance(t, EncodedTable) else t.iloc[rows].reset_index(drop=True)
+
+class SampleScreen:
+    """
+    Wraps an exact executor. Rules are first counted on sample_size rows of each table. 
+    A multi-line rule is estimated on the pairs of sampled rows, which are not independent, 
+    so its bound uses sample_size/2 samples (Hoeffding's bound for U-statistics).
+    Rejected rules get their statistics scaled from the sample, which keeps them failing ok/reproducible, and are marked estimated
+    """
+    def __init__(self, executor, t0:Union[pd.DataFrame, EncodedTable], t1:Union[pd.DataFrame, EncodedTable] = None, 
+            engine:str = "sqlite", sample_size:int = 2000, delta:float = 0.01, seed:int = 0) -> None:
+        self.executor = executor
+        self.z = NormalDist().inv_cdf(1 - delta)
+        self.rejected = 0
+        self.confirmed = 0
+        rng = np.random.default_rng(seed)
+        def sample(t):
+            n = len(t)
+            return t if n <= sample_size else _take(t, np.sort(rng.choice(n, sample_size, replace=False)))
+        s0 = sample(t0)
+        s1 = None if t1 is None else sample(t1)
+        # nothing to gain when the sample is the whole table
+        self.sampler = None if s0 is t0 and (t1 is None or s1 is t1) else new_executor(s0, s1, engine=engine)
+
+    def reconnect(self):
+        """
+        called in a forked process, as the executors' reconnect
+        """
+        for executor in (self.executor, self.sampler):
+            if executor is not None and hasattr(executor, "reconnect"):
+                executor.reconnect()
+
+    def _n(self, rule:Rule)->float:
+        # number of independent samples behind the estimate of a proportion over rule.rowSize units
+        if rule.singleLine():
+            return self.sampler.t0_len
+        return min(self.sampler.t0_len, self.sampler.t1_len) // 2
+
+    def rejected_by(self, sample:Rule, cover:float, confidence:Optional[float])->bool:
+        if sample.rowSize == 0:
+            return False
+        n = self._n(sample)
+        if wilson_upper(sample.cover(), n, self.z) < cover:
+            return True
+        if confidence is not None and sample.xSupp > 0:
+            # samples satisfying Xs
+            nx = n * sample.xSupp / sample.rowSize
+            return nx >= 1 and wilson_upper(sample.confidence(), nx, self.z) < confidence
+        return False
+
+    # 返回值就是入参 rules，可以不接收
+    def execute(self, rules:List[Rule], cover:float, confidence:float = None, workerNum:int = 1)->List[Rule]:
+        """
+        confidence None screens on cover only, for candidates which are extended while not ok
+        """
+        if self.sampler is None:
+            exact = rules
+        else:
+            samples = [Rule(Xs = r.Xs, y = r.y, sameTable = r.sameTable) for r in rules]
+            self.sampler.execute(samples, progressBar=False)
+            exact:List[Rule] = []
+            for rule, sample in zip(rules, samples):
+                if self.rejected_by(sample, cover, confidence):
+                    rule.rowSize = row_size(rule, self.executor.t0_len, self.executor.t1_len)
+                    rule.supp = int(sample.supp / sample.rowSize * rule.rowSize)
+                    rule.xSupp = int(sample.xSupp / sample.rowSize * rule.rowSize)
+                    rule.estimated = True
+                    self.rejected += 1
+                else:
+                    rule.estimated = False
+                    exact.append(rule)
+            self.confirmed += len(exact)
+        if workerNum > 1:
+            self.executor.execute_parallel(exact, workerNum=workerNum)
+        else:
+            self.executor.execute(exact)
+        return rules
@@ -0,0 +1,204 @@
+"""
+Spark evaluation engine. Same contract as RuleExecutor, the tables are cached once in Spark and a batch of rules is counted
+by a few aggregation jobs: every xSupp/supp is a F.sum(F.when(condition, 1)) column, single-line rules of all LHS share one scan
+and multi-line rules share one join per set of equality structural predicates (the join keys).
+Runs on one machine with master="local[*]".
+Tables never pass through Python rows: a path is read by Spark itself, a DataFrame goes through Arrow when pyarrow is installed.
+"""
+
+import time
+from typing import Dict, List, Tuple, Union
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from rule import Predicate, Rule, row_size, group_by_lhs, SQL_ID_COL
+from encoded_table import EncodedTable
+
+class SparkRuleExecutor:
+    # max number of aggregated columns of one job
+    MAX_AGGREGATES_PER_JOB = 1000
+
+    # rows of an EncodedTable decoded at once
+    LOAD_CHUNK = 1 << 20
+
+    def __init__(self, t0:Union[pd.DataFrame, EncodedTable, str], t1:Union[pd.DataFrame, EncodedTable, str] = None, spark = None,
+            master:str = "local[*]") -> None:
+        from pyspark.sql import SparkSession, functions as F
+        self.F = F
+        if spark is None and SparkSession.getActiveSession() is None:
+            self.spark = SparkSession.builder.master(master).appName("GreedyRuleFinder").getOrCreate()
+            # falls back to the slow path by itself without pyarrow. The session of the caller is left as configured
+            self.spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+        else:
+            self.spark = spark if spark is not None else SparkSession.getActiveSession()
+        self.tab0 = self._load(t0)
+        self.tab1 = self.tab0 if t1 is None else self._load(t1)
+        self.t0_len = self.tab0.count() # materializes the cache
+        self.t1_len = self.t0_len if t1 is None else self.tab1.count()
+        self.execute_time = 0.0
+        self.rule_number = 0
+        self.job_number = 0
+        # an Instrument receiving the latency of every job, None when disabled
+        self.instrument = None
+
+        print("Spark rule executor launched")
+
+    def _load(self, t:Union[pd.DataFrame, EncodedTable, str]):
+        F = self.F
+        if isinstance(t, str):
+            # values are compared as strings, as in sqlite
+            if t.endswith(".parquet"):
+                df = self.spark.read.parquet(t)
+                df = df.select(*(F.col(f"`{c}`").cast("string").alias(c) for c in df.columns))
+            else:
+                df = self.spark.read.csv(t, header=True, inferSchema=False)
+            # the id only tells rows apart, as the row number does in sqlite
+            return df.withColumn(SQL_ID_COL, F.monotonically_increasing_id()).cache()
+        if isinstance(t, EncodedTable):
+            frames = [self._frame(t.to_dataframe(start, start + SparkRuleExecutor.LOAD_CHUNK), start)
+                for start in range(0, max(len(t), 1), SparkRuleExecutor.LOAD_CHUNK)]
+        else:
+            frames = [self._frame(t)]
+        df = frames[0]
+        for frame in frames[1:]:
+            df = df.unionByName(frame)
+        return df.cache()
+
+    def _frame(self, data:pd.DataFrame, first:int = 0):
+        """
+        data with the row numbers from first as id column, converted by Arrow
+        """
+        from pyspark.sql.types import StructType, StructField, StringType, LongType
+        columns = {SQL_ID_COL:np.arange(first, first + len(data), dtype=np.int64)}
+        for col in data.columns:
+            # strings and None, by position whatever the index of data
+            values = data[col].to_numpy(dtype=object)
+            # object dtype, pandas would infer a string dtype whose NaN the non-Arrow path sends as "NaN"
+            columns[str(col)] = pd.Series(np.where(pd.isna(values), None, values.astype(str)), dtype=object)
+        schema = StructType([StructField(SQL_ID_COL, LongType(), False)] + [StructField(str(col), StringType(), True) for col in data.columns])
+        return self.spark.createDataFrame(pd.DataFrame(columns), schema)
+
+    def _col(self, alias:str, col:str):
+        return self.F.col(f"{alias}.`{col}`") if alias is not None else self.F.col(f"`{col}`")
+
+    def _real(self, col):
+        """
+        col as sqlite's CAST(col AS REAL): the longest leading number, 0.0 when there is none ('abc', 'inf', '0x10'), NULL stays NULL
+        """
+        F = self.F
+        number = F.regexp_extract(col, r"^\s*([+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?)", 1)
+        return F.when(col.isNull(), F.lit(None)).otherwise(F.coalesce(number.cast("double"), F.lit(0.0)))
+
+    def _condition(self, p:Predicate, alias0:str, alias1:str):
+        if p.isConst():
+            left = self._col(alias0, p.t0_col) if p.t1_col is None else self._col(alias1, p.t1_col)
+            right = self.F.lit(float(p.constant) if p.isRange() else p.constant)
+        else:
+            left, right = self._col(alias0, p.t0_col), self._col(alias1, p.t1_col)
+        if p.isRange():
+            # numbers are stored as strings, as in sqlite
+            left = self._real(left)
+            right = right if p.isConst() else self._real(right)
+        if p.operator == '=':
+            return left == right
+        elif p.operator == '<>':
+            return left != right
+        elif p.operator == '<':
+            return left < right
+        elif p.operator == '<=':
+            return left <= right
+        elif p.operator == '>':
+            return left > right
+        elif p.operator == '>=':
+            return left >= right
+        else:
+            raise Exception('NoImpl ' + p.operator)
+
+    def _conjunction(self, ps:List[Predicate], alias0:str, alias1:str):
+        cond = self.F.lit(True)
+        for p in ps:
+            cond = cond & self._condition(p, alias0, alias1)
+        return cond
+
+    def _aggregate(self, df, rules:List[List[Rule]], keys:List[Predicate], alias0:str, alias1:str, desc:str, bar)->None:
+        """
+        fill the groups of rules (each sharing its Xs) with sums over df, the predicates in keys already hold on df
+        """
+        columns:List[Tuple[List[Rule], int]] = [] # (rules filled, index of the y or -1 for xSupp)
+        aggregates = []
+        for group in rules:
+            xs = self._conjunction([x for x in group[0].Xs if x not in keys], alias0, alias1)
+            aggregates.append(self.F.sum(self.F.when(xs, 1)))
+            columns.append((group, -1))
+            for i, rule in enumerate(group):
+                aggregates.append(self.F.sum(self.F.when(xs & self._condition(rule.y, alias0, alias1), 1)))
+                columns.append((group, i))
+        for start in range(0, len(aggregates), SparkRuleExecutor.MAX_AGGREGATES_PER_JOB):
+            end = min(start + SparkRuleExecutor.MAX_AGGREGATES_PER_JOB, len(aggregates))
+            begin = time.perf_counter()
+            row = df.agg(*aggregates[start:end]).collect()[0]
+            self.job_number += 1
+            filled = [group[i] for group, i in columns[start:end] if i >= 0]
+            if self.instrument is not None and len(filled) > 0:
+                self.instrument.latency(time.perf_counter() - begin, filled, lambda: f"{desc}, {end - start} aggregates")
+            for (group, i), value in zip(columns[start:end], row):
+                value = 0 if value is None else int(value)
+                if i < 0:
+                    for rule in group:
+                        rule.xSupp = value
+                else:
+                    group[i].supp = value
+                    group[i].rowSize = row_size(group[i], self.t0_len, self.t1_len)
+                    if bar is not None:
+                        bar.update(1)
+
+    # 返回值就是入参 rules，可以不接收
+    def execute(self, rules:List[Rule], progressBar:bool=True)->List[Rule]:
+        self.execute_time -= time.time()
+        bar = tqdm(total = len(rules), desc = "Executing") if progressBar else None
+        singles:List[List[Rule]] = []
+        joins:Dict[Tuple[Tuple[Predicate, ...], bool], List[List[Rule]]] = {}
+        for group in group_by_lhs(rules):
+            head = group[0]
+            if head.singleLine():
+                singles.append(group)
+            else:
+                keys = tuple(sorted((x for x in dict.fromkeys(head.Xs) if not x.isConst() and x.operator == '='), key=lambda x:x.id))
+                joins.setdefault((keys, head.sameTable), []).append(group)
+        if len(singles) > 0:
+            self._aggregate(self.tab0, singles, [], None, None, "scan", bar)
+        for (keys, sameTable), groups in joins.items():
+            t0, t1 = self.tab0.alias("t0"), self.tab1.alias("t1")
+            if len(keys) > 0:
+                df = t0.join(t1, on=self._conjunction(list(keys), "t0", "t1"), how="inner")
+            else:
+                df = t0.crossJoin(t1)
+            if sameTable:
+                df = df.where(self._col("t0", SQL_ID_COL) != self._col("t1", SQL_ID_COL))
+            self._aggregate(df, groups, list(keys), "t0", "t1", "join on " + (" ^ ".join(str(k) for k in keys) if len(keys) > 0 else "nothing"), bar)
+        if bar is not None:
+            bar.close()
+        self.execute_time += time.time()
+        self.rule_number += len(rules)
+        return rules
+
+    # Spark already distributes every job, workerNum is accepted for compatibility with RuleExecutor
+    def execute_parallel(self, rules:List[Rule], workerNum:int=None)->List[Rule]:
+        return self.execute(rules)
+
+    def reconnect(self):
+        raise Exception("A SparkRuleExecutor can not be used by forked workers, Spark parallelizes every job itself. Use workerNum=1")
+
+    def __del__(self):
+        if self.rule_number > 0:
+            print(f"SparkRuleExecutor closed. Executing {self.rule_number} rules in {self.execute_time}s by {self.job_number} jobs. "
+                f"{self.execute_time*1000/self.rule_number}ms/rule")
+
+if __name__ == '__main__':
+    data = pd.read_csv("testdata/relation.csv", dtype=str)
+    rule1 = Rule(Xs = [Predicate.newConst0("pn", "2222222"), Predicate.newConst0("ac", "908", "<>"), Predicate.newConst0("ct", "EDI", "<>")],
+        y = Predicate.newConst0("cc", "01"))
+    rule2 = Rule(Xs = [Predicate.newStruct("cc")], y = Predicate.newStruct("ac"))
+    SparkRuleExecutor(data).execute([rule1, rule2])
+    print(rule1)
+    print(rule2)
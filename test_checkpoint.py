@@ -0,0 +1,67 @@
+import time
+import threading
+from greedy_rule_find import rule_find, rule_stream
+
+SEARCH = """
+    import pandas as pd
+    from rule import Rule, Predicate
+    from greedy_rule_find import rule_find
+    data = pd.read_csv("testdata/tax_100.csv", dtype=str)
+    def search(**options):
+        return rule_find({"tax":data}, cover=0.05, confidence=0.9, multi_line=False, **options)
+"""
+
+def test_resume_in_fresh_process(tmp_path, run_python):
+    checkpoints = str(tmp_path / "checkpoints")
+    # the first run crashes in the second level, after the checkpoint of the first one
+    run_python(SEARCH + f"""
+    levels = []
+    def crash(rules):
+        levels.append(rules)
+        if len(levels) == 2:
+            raise KeyboardInterrupt()
+    try:
+        search(checkpoint_dir={checkpoints!r}, on_found=crash)
+        raise Exception("no crash")
+    except KeyboardInterrupt:
+        pass
+    """)
+    # columns get other bits in the new process, the resumed rules must not keep the masks of the first one
+    run_python(SEARCH + f"""
+    Predicate.maskOf(reversed(list(data.columns)))
+    streamed = []
+    resumed = search(checkpoint_dir={checkpoints!r}, resume=True, on_found=streamed.extend)
+    for rule in resumed:
+        assert rule.columnMask() == Rule(Xs = rule.Xs, y = rule.y).columnMask(), rule
+    expected = sorted(str(r) for r in search())
+    assert sorted(str(r) for r in resumed) == expected
+    assert sorted(str(r) for r in streamed) == expected
+
+    # a finished search only sends its rules again
+    streamed = []
+    search(checkpoint_dir={checkpoints!r}, resume=True, on_found=streamed.extend)
+    assert sorted(str(r) for r in streamed) == expected
+    """)
+
+def test_rule_stream(read_table):
+    data = read_table("tax_100.csv")
+    options = dict(cover=0.05, confidence=0.9, multi_line=False)
+    evaluated = []
+    expected = sorted(str(r) for r in rule_find({"tax":data}, evaluated=evaluated, **options))
+    total = len(evaluated)
+    levels = []
+    assert sorted(str(r) for r in rule_stream({"tax":data}, on_found=levels.append, max_pending=1, **options)) == expected
+    assert sorted(str(r) for level in levels for r in level) == expected
+
+    threads = threading.active_count()
+    evaluated = []
+    stream = rule_stream({"tax":data}, evaluated=evaluated, **options)
+    next(stream)
+    stream.close()
+    for _ in range(100):
+        if threading.active_count() == threads:
+            break
+        time.sleep(0.1)
+    assert threading.active_count() == threads
+    # the search stopped before its next level
+    assert len(evaluated) < total
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rule import Predicate, Rule, RuleExecutor
+from numpy_executor import NumpyRuleExecutor
+from encoded_table import EncodedTable
+from greedy_rule_find import all_constant_predicates
+from decision_tree import tree_rules, tree_rule_find
+
+pytest.importorskip("sklearn")
+
+@pytest.fixture
+def data(read_table)->pd.DataFrame:
+    data = read_table("tax_100.csv").drop(columns=["row_id"])
+    # NULLs go down the col <> v branches
+    data.loc[0:19, "maritalstatus"] = None
+    data.loc[10:29, "haschild"] = None
+    return data
+
+def holds(data:pd.DataFrame, xs)->np.ndarray:
+    rows = np.ones(len(data), dtype=bool)
+    for x in xs:
+        column = data[x.t0_col]
+        rows &= (column == x.constant).to_numpy() if x.operator == '=' else (column.notna() & (column != x.constant)).to_numpy()
+    return rows
+
+def recount(data:pd.DataFrame, rules):
+    exact = [Rule(Xs = r.Xs, y = r.y) for r in rules]
+    RuleExecutor(data).execute(exact, progressBar=False)
+    for r, e in zip(rules, exact):
+        assert (r.xSupp, r.supp, r.rowSize) == (e.xSupp, e.supp, e.rowSize), r
+
+@pytest.mark.parametrize("xs", [[], [Predicate.newConst0("gender", "M")]])
+def test_tree_rules_match_sqlite(data, xs):
+    table = EncodedTable.encode(data)
+    cps = all_constant_predicates(table, singleLine=True, threshold=0.05)
+    executor = NumpyRuleExecutor(table)
+    rules = tree_rule_find(table, cps, executor.execute, cover=0.05, confidence=0.8, xs=xs)
+    assert len(rules) > 0
+    assert all(set(xs) <= set(r.Xs) for r in rules)
+    assert any(x.operator == '<>' and x.t0_col in ("maritalstatus", "haschild") for r in rules for x in r.Xs)
+    recount(data, rules)
+
+def test_uncovered_rows_are_those_of_no_rule(data):
+    table = EncodedTable.encode(data)
+    cps = all_constant_predicates(table, singleLine=True, threshold=0.05)
+    executor = NumpyRuleExecutor(table)
+    for y_col in ("maritalstatus", "haschild", "singleexemp", "state"):
+        rules, uncovered = tree_rules(table, y_col, cps, executor.execute, cover=0.05, confidence=0.8)
+        expected = np.ones(len(data), dtype=bool)
+        for rule in rules:
+            expected &= ~holds(data, rule.Xs)
+        assert np.array_equal(uncovered, expected), y_col
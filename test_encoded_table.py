@@ -0,0 +1,51 @@
+import os
+import shutil
+import pandas as pd
+from encoded_table import EncodedTable
+
+def stores(cache_dir:str):
+    return sorted(name for name in os.listdir(cache_dir) if os.path.exists(os.path.join(cache_dir, name, "meta.json")))
+
+def test_cache_hits_and_misses(tmp_path, testdata, monkeypatch):
+    path = str(tmp_path / "relation.csv")
+    shutil.copy(testdata("relation.csv"), path)
+    cache_dir = str(tmp_path / "cache")
+    built = []
+    from_file = EncodedTable.from_file
+    monkeypatch.setattr(EncodedTable, "from_file", staticmethod(lambda *args, **kwargs:built.append(args[0]) or from_file(*args, **kwargs)))
+
+    first = EncodedTable.cached(path, cache_dir)
+    again = EncodedTable.cached(path, cache_dir)
+    assert len(built) == 1 and len(stores(cache_dir)) == 1
+    assert again.to_dataframe().equals(first.to_dataframe())
+    # another column selection is another entry
+    EncodedTable.cached(path, cache_dir, columns=["cc", "ac"])
+    assert len(built) == 2 and len(stores(cache_dir)) == 2
+
+    # a changed file misses, its new content is encoded
+    data = pd.read_csv(path, dtype=str)
+    data.loc[len(data)] = ["02", "999", "3333333", "Ann", "Main St", "LA", "90001"]
+    data.to_csv(path, index=False)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    changed = EncodedTable.cached(path, cache_dir)
+    assert len(built) == 3 and len(changed) == len(first) + 1
+    assert changed.to_dataframe().equals(pd.read_csv(path, dtype=str))
+
+    # the same content in a DataFrame hits its own entry on the second call
+    EncodedTable.cached(data, cache_dir)
+    entries = stores(cache_dir)
+    EncodedTable.cached(data.copy(), cache_dir)
+    assert stores(cache_dir) == entries
+
+def test_truncated_stat_file_is_rehashed(tmp_path, testdata):
+    cache_dir = str(tmp_path / "cache")
+    table = EncodedTable.cached(testdata("relation.csv"), cache_dir)
+    statFiles = [name for name in os.listdir(cache_dir) if name.startswith("stat_")]
+    assert len(statFiles) == 1
+    # as left by a run killed while writing
+    with open(os.path.join(cache_dir, statFiles[0]), "w", encoding="utf-8") as f:
+        f.write("3f2a")
+    again = EncodedTable.cached(testdata("relation.csv"), cache_dir)
+    assert again.to_dataframe().equals(table.to_dataframe())
+    assert len(stores(cache_dir)) == 1
+    assert [name for name in os.listdir(cache_dir) if name.startswith("stat_")] == statFiles
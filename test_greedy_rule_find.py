@@ -0,0 +1,136 @@
+import pytest
+import os
+import tempfile
+from greedy_rule_find import rule_find
+
+def test_path_store_is_removed(tmp_path, monkeypatch, testdata, read_table):
+    path = testdata("tax_100.csv")
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    options = dict(cover=0.05, confidence=0.9, multi_line=False, engine="numpy")
+    found = rule_find({"tax":path}, **options)
+    assert sorted(str(r) for r in found) == sorted(str(r) for r in rule_find({"tax":read_table("tax_100.csv")}, **options))
+    assert os.listdir(tmp_path) == []
+
+def test_tree_depth_is_not_the_levelwise_depth(read_table):
+    data = read_table("tax_100.csv")
+    options = dict(cover=0.05, confidence=0.9, multi_line=False, decision_tree=True)
+    shallow = rule_find({"tax":data}, tree_depth=2, max_levelwise_depth=20, **options)
+    assert len(shallow) > 0 and all(len(r.Xs) <= 2 for r in shallow)
+    deep = rule_find({"tax":data}, tree_depth=8, max_levelwise_depth=2, **options)
+    assert any(len(r.Xs) > 2 for r in deep)
+
+def test_tables_are_encoded_once(monkeypatch, read_table):
+    from encoded_table import EncodedTable
+    data = read_table("tax_100.csv")
+    encoded = []
+    encode = EncodedTable.encode
+    monkeypatch.setattr(EncodedTable, "encode", staticmethod(lambda *args, **kwargs:encoded.append(1) or encode(*args, **kwargs)))
+    rule_find({"tax":data}, cover=0.05, confidence=0.9, max_levelwise_depth=2, range_quantiles=2)
+    assert len(encoded) == 1
+
+def test_numpy_reuses_constant_bitmaps(read_table):
+    from encoded_table import EncodedTable
+    table = EncodedTable.encode(read_table("tax_100.csv"))
+    rule_find({"tax":table}, cover=0.05, confidence=0.9, multi_line=False, engine="numpy")
+    assert len(table.bitmaps) > 0
+
+def test_proxies_are_evaluated_once_per_level(read_table, monkeypatch):
+    import greedy_rule_find
+    from rule import RuleExecutor
+    data = read_table("tax_100.csv")
+    calls = {"update":0, "next_generation":0}
+    def counted(name, func):
+        def call(*args, **kwargs):
+            calls[name] += 1
+            return func(*args, **kwargs)
+        return call
+    monkeypatch.setattr(greedy_rule_find.NegativeCoverage, "update", counted("update", greedy_rule_find.NegativeCoverage.update))
+    monkeypatch.setattr(greedy_rule_find, "next_generation", counted("next_generation", greedy_rule_find.next_generation))
+    executor = RuleExecutor(data)
+    cps = greedy_rule_find.all_constant_predicates(data, singleLine=True, threshold=0.1)
+    found = greedy_rule_find.levelwise(greedy_rule_find.first_generation(constant_predicates=cps), executor.execute, executor,
+        greedy_rule_find.CandidateGenerator(constant_predicates=cps), 0.05, 0.9)
+    assert len(found) > 0 and calls["next_generation"] > 1
+    assert calls["update"] == calls["next_generation"]
+
+def test_range_predicates_of_numeric_columns_only():
+    import pandas as pd
+    from greedy_rule_find import all_range_predicates
+    data = pd.DataFrame({
+        "num":["1", "2.5", None, "4", "-3", "1e2", "7", "8"],
+        "text":["a", "b", "c", "d", "e", "f", "g", "h"],
+        "mixed":["1", "2", "3", "x", "5", "6", "7", "8"],
+        "infinite":["1", "2", "3", "inf", "5", "6", "7", "8"],
+        "empty":["1", "2", "", "4", "5", "6", "7", "8"],
+        "null":[None] * 8,
+    })
+    for singleLine in (True, False):
+        sps, cps = all_range_predicates(data, singleLine=singleLine)
+        assert {c for p in sps for c in p.columns} <= {"num"}
+        assert {c for ps in cps for p in ps for c in p.columns} == {"num"}
+        assert all(float(ps[0].constant) < 100 for ps in cps)
+    sps, _ = all_range_predicates(data, singleLine=False)
+    assert [str(p) for p in sps] == ["t0.num < t1.num", "t0.num >= t1.num"]
+
+def test_pruner_keeps_the_minimal_rules(read_table, monkeypatch):
+    from greedy_rule_find import CandidatePruner
+    data = read_table("tax_100.csv").drop(columns=["row_id"])
+    options = dict(cover=0.05, confidence=0.9, max_levelwise_depth=3)
+    key = lambda r:(frozenset(r.Xs), r.y)
+    removed = []
+    filter = CandidatePruner.filter
+    def counted(self, children):
+        kept = filter(self, children)
+        removed.append(len(children) - len(kept))
+        return kept
+    monkeypatch.setattr(CandidatePruner, "filter", counted)
+    pruned = rule_find({"tax":data}, **options)
+    monkeypatch.setattr(CandidatePruner, "filter", lambda self, children:children)
+    unpruned = rule_find({"tax":data}, **options)
+    assert sum(removed) > 0
+    # a rule found without pruning may extend the Xs of another rule of its y
+    minimal = {key(r) for r in unpruned if not any(o.y == r.y and set(o.Xs) < set(r.Xs) for o in unpruned)}
+    assert {key(r) for r in pruned} == minimal
+    assert len(pruned) == len(minimal)
+
+def test_pruner_rules():
+    from rule import Predicate, Rule
+    from greedy_rule_find import CandidatePruner
+    a, b, c, y = (Predicate.newConst0(col, "1") for col in ("test_pruner_a", "test_pruner_b", "test_pruner_c", "test_pruner_y"))
+    pruner = CandidatePruner(cover=0.1, confidence=0.9)
+    pruner.record([
+        Rule(Xs = [a], y = y, rowSize = 100, xSupp = 20, supp = 19), # ok
+        Rule(Xs = [b], y = y, rowSize = 100, xSupp = 5, supp = 1), # infrequent
+        Rule(Xs = [c], y = y, rowSize = 100, xSupp = 50, supp = 20), # frequent, not confident
+    ])
+    children = [Rule(Xs = [c, a], y = y), Rule(Xs = [c, b], y = y), Rule(Xs = [b, c], y = y), Rule(Xs = [c, c], y = y), Rule(Xs = [c, c], y = y)]
+    assert [r.Xs for r in pruner.filter(children)] == [[c, c]]
+    assert (pruner.pruned, pruner.deduplicated) == (2, 2)
+    # the Xs of other ys bound nothing
+    other = Predicate.newConst0("test_pruner_z", "1")
+    assert len(pruner.filter([Rule(Xs = [c, a], y = other), Rule(Xs = [c, b], y = other)])) == 2
+
+@pytest.mark.parametrize("engine", ["sqlite", "numpy"])
+def test_cross_table_rules_count_pairs_of_both_tables(read_table, engine):
+    import numpy as np
+    import pandas as pd
+    data = read_table("tax_100.csv").drop(columns=["row_id", "fname", "lname", "phone", "rate"])
+    tables = {"a":data.iloc[:60].reset_index(drop=True), "b":data.iloc[40:].reset_index(drop=True)}
+    found = rule_find(tables, cover=0.005, confidence=0.9, single_line=False, cross_table=True, max_levelwise_depth=2, engine=engine)
+    crossed = [r for r in found if r.tables[0] != r.tables[1]]
+    assert {r.tables for r in crossed} == {("a", "b"), ("b", "a")}
+    def holds(p, pairs):
+        left = pairs[p.t0_col + "_0"] if p.t0_col is not None else None
+        right = pairs[p.t1_col + "_1"] if p.t1_col is not None else None
+        if p.isConst():
+            value = left if left is not None else right
+            return value.notna() & ((value == p.constant) if p.operator == '=' else (value != p.constant))
+        both = left.notna() & right.notna()
+        return both & ((left == right) if p.operator == '=' else (left != right))
+    for rule in crossed:
+        t0, t1 = tables[rule.tables[0]], tables[rule.tables[1]]
+        # every (t0, t1) pair, a row is never excluded from its pair with itself
+        pairs = t0.add_suffix("_0").merge(t1.add_suffix("_1"), how="cross")
+        xs = np.logical_and.reduce([holds(p, pairs).to_numpy() for p in rule.Xs])
+        assert not rule.sameTable and rule.rowSize == len(t0) * len(t1)
+        assert (rule.xSupp, rule.supp) == (int(xs.sum()), int((xs & holds(rule.y, pairs).to_numpy()).sum())), rule
@@ -0,0 +1,55 @@
+def test_reopen_in_fresh_process(tmp_path, run_python):
+    store = str(tmp_path / "store")
+    run_python(f"""
+        import pandas as pd
+        from incremental import RuleMaintainer
+        data = pd.read_csv("testdata/tax_100.csv", dtype=str)
+        RuleMaintainer.discover({store!r}, data.iloc[:80], cover=0.05, confidence=0.9, multi_line=False).close()
+    """)
+    # columns get other bits in the new process, the stored rules must not keep the masks of the first one
+    run_python(f"""
+        import pandas as pd
+        from rule import Rule, Predicate, RuleExecutor
+        from incremental import RuleMaintainer
+        data = pd.read_csv("testdata/tax_100.csv", dtype=str)
+        Predicate.maskOf(reversed(list(data.columns)))
+        maintainer = RuleMaintainer.open({store!r})
+        for rule in maintainer.rules.values():
+            assert rule.columnMask() == Rule(Xs = rule.Xs, y = rule.y).columnMask(), rule
+        maintainer.insert(data.iloc[80:])
+        rules = list(maintainer.rules.values())
+        exact = [Rule(Xs = r.Xs, y = r.y, sameTable = r.sameTable) for r in rules]
+        RuleExecutor(data).execute(exact, progressBar=False)
+        for r, e in zip(rules, exact):
+            assert (r.xSupp, r.supp, r.rowSize) == (e.xSupp, e.supp, e.rowSize), r
+        maintainer.close()
+    """)
+
+def test_counters_match_an_exact_recount(tmp_path, read_table):
+    import pandas as pd
+    from rule import Rule, RuleExecutor
+    from incremental import RuleMaintainer
+    data = read_table("tax_100.csv")
+    maintainer = RuleMaintainer.discover(str(tmp_path / "store"), data.iloc[:60], cover=0.05, confidence=0.9, max_levelwise_depth=2)
+    assert any(not r.singleLine() for r in maintainer.rules.values())
+    rows = data.iloc[:60].set_axis(pd.RangeIndex(60), axis=0)
+    def check():
+        rules = list(maintainer.rules.values())
+        exact = [Rule(Xs = r.Xs, y = r.y, sameTable = r.sameTable) for r in rules]
+        RuleExecutor(rows.reset_index(drop=True)).execute(exact, progressBar=False)
+        for r, e in zip(rules, exact):
+            assert (r.xSupp, r.supp, r.rowSize) == (e.xSupp, e.supp, e.rowSize), r
+
+    # T x D, D x T and D x D pairs of an insert
+    ids, _ = maintainer.insert(data.iloc[60:80])
+    rows = pd.concat([rows, data.iloc[60:80].set_axis(pd.Index(ids), axis=0)])
+    check()
+    removed = [3, 17, 61, 70]
+    maintainer.delete(removed)
+    rows = rows.drop(index=removed)
+    check()
+    replaced = [5, 62]
+    ids, _ = maintainer.update(replaced, data.iloc[80:82])
+    rows = pd.concat([rows.drop(index=replaced), data.iloc[80:82].set_axis(pd.Index(ids), axis=0)])
+    check()
+    maintainer.close()
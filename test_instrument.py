@@ -0,0 +1,20 @@
+from rule import Predicate, Rule
+from numpy_executor import NumpyRuleExecutor
+from greedy_rule_find import rule_find
+from instrument import Instrument
+
+def test_level_events(read_table):
+    data = read_table("relation.csv")
+    events = []
+    found = rule_find({"r":data}, cover=0.01, confidence=0.8, engine="numpy", instrument=Instrument(hooks=[lambda e, r:events.append((e, r))]))
+    levels = [r for e, r in events if e == "level"]
+    assert sum(r["found"] for r in levels) == len(found)
+    # the negated found rules are evaluated before every level but the first
+    assert levels[0]["coverage_s"] == 0 and any(r["coverage_s"] > 0 for r in levels[1:])
+
+def test_numpy_plan_is_read_only(read_table):
+    data = read_table("relation.csv")
+    executor = NumpyRuleExecutor(data)
+    rule = Rule(Xs = [Predicate.newStruct("cc"), Predicate.newStruct("zip", "<>")], y = Predicate.newStruct("ac"))
+    assert executor.plan(rule) == "partition, inclusion-exclusion over 1 <> predicates"
+    assert len(executor.cache) == 0 and executor.cache.misses == 0
@@ -0,0 +1,97 @@
+import pytest
+from rule import Predicate, Rule, RuleExecutor
+from numpy_executor import NumpyRuleExecutor
+
+C0, C1, S = Predicate.newConst0, Predicate.newConst1, Predicate.newStruct
+
+@pytest.fixture
+def data(read_table):
+    data = read_table("tax_100.csv").drop(columns=["row_id"])
+    data.loc[0:14, "maritalstatus"] = None
+    data.loc[10:24, "haschild"] = None
+    return data
+
+def single_line(sameTable:bool):
+    return [Rule(Xs = xs, y = y, sameTable = sameTable) for xs, y in [
+        ([C0("gender", "M")], C0("maritalstatus", "M")),
+        ([C0("gender", "M")], C0("haschild", "Y", "<>")),
+        ([C0("state", "OH", "<>"), C0("maritalstatus", "S")], C0("haschild", "N")),
+        ([C0("maritalstatus", "M", "<>")], C0("gender", "F")),
+        ([C0("state", "ZZ")], C0("gender", "F")),
+        ([C0("state", "ZZ", "<>"), C0("haschild", "N", "<>")], C0("gender", "M", "<>")),
+    ]]
+
+def multi_line(sameTable:bool):
+    return [Rule(Xs = xs, y = y, sameTable = sameTable) for xs, y in [
+        ([S("zip")], S("city")),
+        ([S("state")], S("areacode")),
+        ([S("state"), S("gender", "<>")], S("maritalstatus")),
+        ([S("areacode"), S("maritalstatus", "<>"), S("haschild", "<>")], S("state", "<>")),
+        # more <> than inclusion-exclusion takes, the pairs are enumerated
+        ([S("gender"), S("maritalstatus", "<>"), S("haschild", "<>"), S("state", "<>"), S("areacode", "<>"), S("zip", "<>")], S("city", "<>")),
+        ([S("maritalstatus", t1_col="gender")], S("state")),
+        ([C0("gender", "M"), C1("gender", "F")], S("maritalstatus")),
+        ([C0("maritalstatus", "M"), S("state")], C1("haschild", "Y")),
+        ([C1("state", "OH", "<>"), S("zip", "<>")], C0("gender", "F")),
+        ([C0("state", "ZZ"), S("zip")], S("city")),
+        ([C1("haschild", "N"), S("maritalstatus")], C1("gender", "M", "<>")),
+    ]]
+
+def ranges(sameTable:bool):
+    lt = C0("salary", "40000", "<")
+    ge = S("rate", ">=")
+    rules = [
+        ([lt], C0("gender", "M")),
+        ([C0("salary", "40000", "<=")], C0("rate", "3", ">")),
+        ([lt.negate()], C0("maritalstatus", "M")),
+        ([C0("mixed", "5", ">=")], C0("rate", "3", "<=").negate()),
+        ([C0("mixed", "0", "<=")], C0("gender", "F")),
+        ([S("state"), S("salary", "<")], S("gender")),
+        ([S("gender"), ge], S("maritalstatus")),
+        ([S("gender"), ge.negate()], S("haschild")),
+        ([S("areacode"), S("mixed", ">")], S("salary", "<=")),
+        ([S("gender"), S("maritalstatus", "<>"), S("salary", ">")], S("rate", "<").negate()),
+        # two range predicates, the pairs are enumerated
+        ([S("state"), S("salary", "<"), S("rate", ">")], S("mixed", ">=")),
+        ([C1("rate", "2", ">"), S("gender")], S("salary", ">")),
+    ]
+    return [Rule(Xs = xs, y = y, sameTable = sameTable) for xs, y in rules]
+
+@pytest.fixture
+def numbers(data):
+    data = data.copy()
+    data.loc[30:39, "salary"] = None
+    # strings sqlite casts to their leading number or 0.0
+    mixed = data["childexemp"].copy()
+    mixed[40:52] = ["abc", "12abc", " 7", "1e3x", ".5", "-3.", "inf", "", "0x10", None, "+4", "NaN"]
+    data["mixed"] = mixed
+    return data
+
+def test_range_parity(numbers):
+    expected = RuleExecutor(numbers).execute(ranges(True), progressBar=False)
+    assert_parity(expected, NumpyRuleExecutor(numbers).execute(ranges(True), progressBar=False))
+    t0, t1 = numbers.iloc[:60].reset_index(drop=True), numbers.iloc[40:].reset_index(drop=True)
+    expected = RuleExecutor(t0, t1).execute(ranges(False), progressBar=False)
+    assert_parity(expected, NumpyRuleExecutor(t0, t1).execute(ranges(False), progressBar=False))
+
+def assert_parity(expected, found):
+    for e, f in zip(expected, found):
+        assert (f.xSupp, f.supp, f.rowSize) == (e.xSupp, e.supp, e.rowSize), e
+
+@pytest.mark.parametrize("rules", [single_line, multi_line])
+def test_parity_on_one_table(data, rules):
+    expected = RuleExecutor(data).execute(rules(True), progressBar=False)
+    executor = NumpyRuleExecutor(data)
+    assert_parity(expected, executor.execute(rules(True), progressBar=False))
+    # answered from the cached partitions
+    assert_parity(expected, executor.execute(rules(True), progressBar=False))
+
+@pytest.mark.parametrize("rules", [single_line, multi_line])
+def test_parity_across_tables(data, rules):
+    t0, t1 = data.iloc[:60].reset_index(drop=True), data.iloc[40:].reset_index(drop=True)
+    # values of t1 missing from t0
+    t1.loc[0:9, "state"] = "ZZ"
+    expected = RuleExecutor(t0, t1).execute(rules(False), progressBar=False)
+    executor = NumpyRuleExecutor(t0, t1)
+    assert_parity(expected, executor.execute(rules(False), progressBar=False))
+    assert_parity(expected, executor.execute(rules(False), progressBar=False))
@@ -0,0 +1,74 @@
+import sqlite3
+from itertools import combinations
+import numpy as np
+import pandas as pd
+import pytest
+from encoded_table import EncodedTable, NULL_CODE
+from pair_counter import refine, count_pairs, count_range_pairs, NO_GROUP
+
+def table(rng, n:int)->pd.DataFrame:
+    columns = {}
+    for col, values in (("a", "xyz"), ("b", "pq"), ("c", "uvw"), ("d", "klm")):
+        column = pd.Series(rng.choice(list(values), n), dtype=object)
+        column[rng.random(n) < 0.15] = None
+        columns[col] = column
+    columns["v"] = pd.Series(rng.integers(0, 5, n).astype(str), dtype=object)
+    return pd.DataFrame(columns)
+
+@pytest.fixture(params=[True, False], ids=["sameTable", "crossTable"])
+def tables(request):
+    rng = np.random.default_rng(7)
+    t0 = table(rng, 80)
+    t1 = t0 if request.param else table(rng, 60)
+    conn = sqlite3.connect(":memory:")
+    t0.to_sql("t0", conn, index_label="id")
+    t1.to_sql("t1", conn, index_label="id")
+    e0 = EncodedTable.encode(t0)
+    e1 = e0 if request.param else EncodedTable.encode(t1)
+    yield request.param, e0, e1, conn
+    conn.close()
+
+def sql_count(conn, sameTable:bool, where:str)->int:
+    if sameTable:
+        where += " and t0.id <> t1.id"
+    return conn.execute(f"select count(*) from t0, t1 where {where}").fetchone()[0]
+
+def partition(e0:EncodedTable, e1:EncodedTable, cols):
+    g0, g1 = np.zeros(len(e0), dtype=np.int64), np.zeros(len(e1), dtype=np.int64)
+    for col in cols:
+        g0, g1 = refine(g0, g1, e0.codes[col], e0.translate(col, e1, col))
+    return g0, g1
+
+@pytest.mark.parametrize("eqs", [[], ["a"], ["a", "b"], ["b", "c", "d"]])
+def test_count_pairs(tables, eqs):
+    sameTable, e0, e1, conn = tables
+    g0, g1 = partition(e0, e1, eqs)
+    # NULL is equal to nothing
+    for col in eqs:
+        assert np.all(g0[e0.codes[col] == NULL_CODE] == NO_GROUP)
+    m0 = e0.codes["v"] != e0.code_of("v", "0")
+    m1 = np.ones(len(e1), dtype=bool)
+    where = " and ".join([f"t0.{c} = t1.{c}" for c in eqs] + ["t0.v <> '0'"])
+    assert count_pairs(g0, g1, m0, m1, sameTable) == sql_count(conn, sameTable, where)
+
+@pytest.mark.parametrize("neqs", [["c"], ["c", "d"], ["b", "c", "d"]])
+def test_inclusion_exclusion_of_unequal_columns(tables, neqs):
+    sameTable, e0, e1, conn = tables
+    # t0.col <> t1.col is false on NULL, the rows with a NULL leave the masks
+    m0 = np.all([e0.codes[c] != NULL_CODE for c in neqs], axis=0)
+    m1 = np.all([e1.codes[c] != NULL_CODE for c in neqs], axis=0)
+    total = 0
+    for k in range(len(neqs) + 1):
+        for subset in combinations(neqs, k):
+            g0, g1 = partition(e0, e1, ["a", *subset])
+            total += (-1) ** k * count_pairs(g0, g1, m0, m1, sameTable)
+    where = " and ".join(["t0.a = t1.a"] + [f"t0.{c} <> t1.{c}" for c in neqs])
+    assert total == sql_count(conn, sameTable, where)
+
+@pytest.mark.parametrize("operator", ["<", "<=", ">", ">="])
+def test_count_range_pairs(tables, operator):
+    sameTable, e0, e1, conn = tables
+    g0, g1 = partition(e0, e1, ["b"])
+    m0, m1 = np.ones(len(e0), dtype=bool), np.ones(len(e1), dtype=bool)
+    found = count_range_pairs(g0, g1, m0, m1, e0.values("v"), e1.values("v"), operator, sameTable)
+    assert found == sql_count(conn, sameTable, f"t0.b = t1.b and CAST(t0.v AS REAL) {operator} CAST(t1.v AS REAL)")
@@ -0,0 +1,26 @@
+import numpy as np
+from partition_cache import PartitionCache
+
+def test_shared_arrays_stay_charged():
+    cache = PartitionCache(3000)
+    a, b, c, d = (np.zeros(1000, dtype=np.uint8) for _ in range(4))
+    ka, kab, kc, kd = ((1, 1), (1, )), ((2, 2), (1, 2)), ((1, 3), (3, )), ((1, 4), (4, ))
+    cache.put(ka, "a", [a])
+    cache.put(kab, "a b", [a, b]) # extended from ka, shares a
+    assert cache.bytes == 2000
+    cache.put(kc, "c", [c])
+    # evicting ka leaves a charged to kab, which goes next
+    cache.put(kd, "d", [d])
+    assert cache.bytes == 2000
+    assert kab not in cache and ka not in cache
+    cache.put(kd, "d", [d])
+    assert cache.bytes == 2000
+
+def test_hash_collision_is_a_miss():
+    cache = PartitionCache()
+    cache.put(((2, 7), (1, 2)), "1 2", [np.zeros(8)])
+    assert cache.get(((2, 7), (1, 2))) == "1 2"
+    # same hash, other predicates
+    assert ((2, 7), (3, 4)) not in cache
+    assert cache.get(((2, 7), (3, 4))) is None
+    assert cache.collisions == 2
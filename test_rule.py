@@ -0,0 +1,123 @@
+import pytest
+from rule import Predicate, Rule, RuleExecutor
+from numpy_executor import NumpyRuleExecutor
+
+# interned before the tests, as the predicates other test modules hold
+HELD = Predicate.newStruct("test_rule_held")
+
+@pytest.fixture
+def registry():
+    """
+    the interned predicates of the other tests are restored after the test, ids keep growing so none is reused
+    """
+    saved = dict(Predicate._registry), dict(Predicate._ids)
+    yield
+    with Predicate._lock:
+        Predicate._registry.clear()
+        Predicate._registry.update(saved[0])
+        Predicate._ids.clear()
+        Predicate._ids.update(saved[1])
+
+def test_clear_registry(registry):
+    p = Predicate.newConst0("test_clear_a", "1")
+    assert Predicate.newConst0("test_clear_a", "1") is p
+    Predicate.clear()
+    assert len(Predicate._registry) == 0
+    q = Predicate.newConst0("test_clear_a", "1")
+    # a new id, never one of a predicate made before
+    assert q is not p and q != p and q.id > p.id
+    assert Predicate.newConst0("test_clear_a", "1") is q
+    assert q.columnMask == p.columnMask
+    assert q.negate() == Predicate.newConst0("test_clear_a", "1", "<>")
+    assert Predicate.newStruct("test_rule_held") != HELD
+
+def test_registry_is_restored():
+    # runs after test_clear_registry
+    assert Predicate.newStruct("test_rule_held") is HELD
+
+def shared_lhs_rules():
+    gender = [Predicate.newConst0("gender", "M")]
+    state = [Predicate.newStruct("state")]
+    return [
+        Rule(Xs = gender, y = Predicate.newConst0("maritalstatus", "M")),
+        Rule(Xs = gender, y = Predicate.newConst0("maritalstatus", "S")),
+        Rule(Xs = gender, y = Predicate.newConst0("haschild", "Y", "<>")),
+        Rule(Xs = [Predicate.newConst0("state", "OH")], y = Predicate.newConst0("gender", "F")),
+    ] + [Rule(Xs = state, y = Predicate.newStruct(col)) for col in ("zip", "city", "areacode", "gender", "maritalstatus")]
+
+@pytest.mark.parametrize("engine", [RuleExecutor, NumpyRuleExecutor])
+def test_shared_lhs_is_counted_once(read_table, monkeypatch, engine):
+    data = read_table("tax_100.csv")
+    alone = [RuleExecutor(data).execute([rule], progressBar=False)[0] for rule in shared_lhs_rules()]
+    # the 3 rules of t0.gender = 'M' take 2 SQLs, the 5 of t0.state = t1.state 3
+    monkeypatch.setattr(RuleExecutor, "MAX_Y_PER_SQL", 2)
+    executor = engine(data)
+    rules = executor.execute(shared_lhs_rules(), progressBar=False)
+    for rule, expected in zip(rules, alone):
+        assert (rule.xSupp, rule.supp, rule.rowSize) == (expected.xSupp, expected.supp, expected.rowSize), expected
+    if engine is RuleExecutor:
+        assert executor.sql_number == 2 + 1 + 3
+        assert executor.dedup_number == 2 * len(rules) - 6
+    else:
+        # xSupp once per Xs, and the counts of maritalstatus once for both of its values
+        assert executor.dedup_number == (3 - 1) + (5 - 1) + 1
+
+@pytest.mark.parametrize("storage", ["default", "directory", RuleExecutor.MEMORY])
+def test_storage_is_isolated_and_closed(tmp_path, monkeypatch, read_table, storage):
+    import os
+    import sqlite3
+    import tempfile
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "default"))
+    os.makedirs(tmp_path / "default")
+    directory = str(tmp_path / "directory")
+    os.makedirs(directory)
+    option = {"default":None, "directory":directory}.get(storage, storage)
+    data = read_table("tax_100.csv")
+    rule = lambda:Rule(Xs = [Predicate.newStruct("state")], y = Predicate.newStruct("zip"))
+    # two executors of the same storage, on other rows
+    first, second = RuleExecutor(data.iloc[:50], storage=option), RuleExecutor(data.iloc[50:], storage=option)
+    assert first.uri_rw != second.uri_rw
+    for executor, rows in ((first, data.iloc[:50]), (second, data.iloc[50:])):
+        assert executor.execute([rule()], progressBar=False)[0].rowSize == len(rows) * (len(rows) - 1)
+        expected = RuleExecutor(rows, storage=RuleExecutor.MEMORY).execute([rule()], progressBar=False)[0]
+        assert executor.execute([rule()], progressBar=False)[0].supp == expected.supp
+    if storage == RuleExecutor.MEMORY:
+        assert first.in_memory and first.tempdir is None
+    else:
+        # one directory per executor, inside the storage
+        parent = str(tmp_path / storage)
+        assert sorted(os.listdir(parent)) == sorted(os.path.basename(e.tempdir) for e in (first, second))
+    uri = first.uri_rw
+    first.close()
+    if storage == RuleExecutor.MEMORY:
+        conn = sqlite3.connect(uri, uri=True)
+        assert conn.execute("SELECT count(*) FROM sqlite_master").fetchone()[0] == 0
+        conn.close()
+    else:
+        assert len(os.listdir(parent)) == 1
+    # the other one is untouched
+    assert second.execute([rule()], progressBar=False)[0].rowSize == (len(data) - 50) * (len(data) - 51)
+    second.close()
+    if storage != RuleExecutor.MEMORY:
+        assert os.listdir(parent) == []
+
+@pytest.mark.parametrize("storage", [None, RuleExecutor.MEMORY])
+def test_pool_is_kept_across_calls(read_table, monkeypatch, storage):
+    import multiprocessing
+    import multiprocessing.pool
+    created = []
+    for module, name in ((multiprocessing, "Pool"), (multiprocessing.pool, "ThreadPool")):
+        original = getattr(module, name)
+        monkeypatch.setattr(module, name, lambda *args, original=original, **kwargs:created.append(1) or original(*args, **kwargs))
+    data = read_table("tax_100.csv")
+    executor = RuleExecutor(data, storage=storage)
+    expected = [str(r) for r in RuleExecutor(data).execute(shared_lhs_rules(), progressBar=False)]
+    for _ in range(3):
+        assert [str(r) for r in executor.execute_parallel(shared_lhs_rules(), workerNum=2)] == expected
+    pool = executor.pool
+    assert len(created) == 1
+    # another number of workers replaces the pool
+    assert [str(r) for r in executor.execute_parallel(shared_lhs_rules(), workerNum=3)] == expected
+    assert len(created) == 2 and executor.pool is not pool
+    executor.close()
+    assert executor.pool is None
@@ -0,0 +1,32 @@
+import pytest
+from rule import Rule, RuleExecutor
+from sample_screen import SampleScreen
+from greedy_rule_find import all_structual_predicates, all_constant_predicates
+from topk_rule_find import topk_rule_find
+
+@pytest.mark.parametrize("cover,confidence", [(0.01, 0.9), (0.005, 0.5), (0.03, None)])
+def test_passing_rules_are_never_rejected(read_table, cover, confidence):
+    data = read_table("flights.csv").drop(columns=["tuple_id"])
+    cps = [xs[0] for xs in all_constant_predicates(data, singleLine=True, threshold=0.02)]
+    candidates = lambda:[Rule(Xs = [x], y = y) for y in cps for x in cps if y.compatible(x)] + \
+        [Rule(Xs = [x1, x2], y = y) for y in cps[:8] for x1 in cps for x2 in cps if x1.id < x2.id and x1.compatible(x2) and y.compatible(x1, x2)]
+    exact = RuleExecutor(data).execute(candidates(), progressBar=False)
+    screen = SampleScreen(RuleExecutor(data), data, sample_size=300, delta=0.01)
+    screened = screen.execute(candidates(), cover, confidence)
+    assert screen.rejected > 0 and screen.confirmed > 0
+    for e, s in zip(exact, screened):
+        if e.ok(cover, confidence):
+            assert not s.estimated, e
+        if not s.estimated:
+            assert (s.xSupp, s.supp) == (e.xSupp, e.supp), e
+
+@pytest.mark.parametrize("topk", [1, 3])
+def test_best_first_does_not_bound_by_estimates(read_table, topk):
+    data = read_table("flights.csv").drop(columns=["tuple_id"])
+    cps = all_constant_predicates(data, singleLine=True, threshold=0.02)
+    options = dict(multi_line=False, topk=topk, cover=0.01, confidence=0.9, level2=True, sample_size=300)
+    exhaustive = topk_rule_find(data, [], cps, **options)
+    best_first = topk_rule_find(data, [], cps, best_first=True, **options)
+    assert len(exhaustive) > 0
+    assert [str(r) for r in best_first] == [str(r) for r in exhaustive]
+    assert all(not r.estimated for r in best_first)
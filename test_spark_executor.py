@@ -0,0 +1,64 @@
+import os
+import shutil
+import pandas as pd
+import pytest
+from rule import Predicate, Rule, RuleExecutor
+
+pyspark = pytest.importorskip("pyspark")
+if os.environ.get("JAVA_HOME") is None and shutil.which("java") is None:
+    pytest.skip("Spark needs a Java runtime", allow_module_level=True)
+
+def rules():
+    return [
+        Rule(Xs = [Predicate.newConst0("pn", "2222222"), Predicate.newConst0("ac", "908", "<>")], y = Predicate.newConst0("cc", "01")),
+        Rule(Xs = [Predicate.newConst0("ct", "MH")], y = Predicate.newConst0("ac", "908")),
+        Rule(Xs = [Predicate.newStruct("cc")], y = Predicate.newStruct("ac")),
+        Rule(Xs = [Predicate.newStruct("zip"), Predicate.newStruct("ac", operator="<>")], y = Predicate.newStruct("ct")),
+        Rule(Xs = [Predicate.newConst0("pn", "2000000", ">")], y = Predicate.newConst0("ct", "MH")),
+        Rule(Xs = [Predicate.newStruct("cc"), Predicate.newStruct("pn", operator="<")], y = Predicate.newStruct("ac")),
+    ]
+
+@pytest.fixture(scope="module")
+def spark():
+    from pyspark.sql import SparkSession
+    session = SparkSession.builder.master("local[*]").appName("test_spark_executor").getOrCreate()
+    yield session
+    session.stop()
+
+@pytest.mark.parametrize("source", ["dataframe", "path"])
+def test_parity_with_sqlite(spark, source, testdata, read_table):
+    from spark_executor import SparkRuleExecutor
+    data = read_table("relation.csv")
+    expected = RuleExecutor(data).execute(rules(), progressBar=False)
+    found = SparkRuleExecutor(data if source == "dataframe" else testdata("relation.csv"), spark=spark).execute(rules(), progressBar=False)
+    for e, f in zip(expected, found):
+        assert (f.xSupp, f.supp, f.rowSize) == (e.xSupp, e.supp, e.rowSize), e
+
+def test_non_numeric_strings_compare_as_in_sqlite(spark):
+    from spark_executor import SparkRuleExecutor
+    # sqlite casts the leading number of a string, 0.0 without one
+    data = pd.DataFrame({
+        "a":["abc", "12abc", " 7", "1e3x", ".5", "-3.", "inf", "", "0x10", None, "5", "+4"],
+        "b":["x", "3", "7", "1000", None, "zz", "-1", "0", "2e", "4", "5", "4.0"],
+    })
+    rules = lambda:[
+        Rule(Xs = [Predicate.newConst0("a", "0", op)], y = Predicate.newConst0("b", "4", "<=")) for op in ("<", "<=", ">", ">=")
+    ] + [
+        Rule(Xs = [Predicate.newStruct("a", operator=op)], y = Predicate.newStruct("b", operator="<")) for op in ("<", ">=")
+    ] + [
+        Rule(Xs = [Predicate.newConst0("a", "5")], y = Predicate.newStruct("b", operator=">"))
+    ]
+    expected = RuleExecutor(data).execute(rules(), progressBar=False)
+    found = SparkRuleExecutor(data, spark=spark).execute(rules(), progressBar=False)
+    for e, f in zip(expected, found):
+        assert (f.xSupp, f.supp) == (e.xSupp, e.supp), e
+
+def test_session_of_the_caller_is_not_reconfigured(spark, read_table):
+    from spark_executor import SparkRuleExecutor
+    key = "spark.sql.execution.arrow.pyspark.enabled"
+    spark.conf.set(key, "false")
+    try:
+        SparkRuleExecutor(read_table("relation.csv"), spark=spark)
+        assert spark.conf.get(key) == "false"
+    finally:
+        spark.conf.unset(key)
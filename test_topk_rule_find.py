@@ -0,0 +1,27 @@
+import pytest
+from greedy_rule_find import all_structual_predicates, all_constant_predicates
+from topk_rule_find import topk_rule_find
+
+def test_forked_workers_with_sample_screen(read_table):
+    data = read_table("tax_100.csv")
+    sps = all_structual_predicates(data)
+    cps = all_constant_predicates(data, singleLine=True, threshold=0.1)
+    options = dict(multi_line=False, cover=0.05, confidence=0.9, sample_size=50)
+    serial = topk_rule_find(data, sps, cps, **options)
+    forked = topk_rule_find(data, sps, cps, workerNum=2, **options)
+    assert len(serial) > 0
+    assert [str(r) for r in forked] == [str(r) for r in serial]
+
+@pytest.mark.parametrize("single_line", [True, False], ids=["single_line", "multi_line"])
+@pytest.mark.parametrize("topk,cover", [(1, 0.005), (3, 0.01), (5, 0.02), (20, 0.03)])
+def test_best_first_is_the_exhaustive_level2_search(read_table, single_line, topk, cover):
+    data = read_table("tax_100.csv").drop(columns=["row_id"])
+    if single_line:
+        sps, cps = [], all_constant_predicates(data, singleLine=True, threshold=0.1)
+    else:
+        sps = all_structual_predicates(data)
+        cps = all_constant_predicates(data, singleLine=False, threshold=0.3)
+    options = dict(single_line=single_line, multi_line=not single_line, topk=topk, cover=cover, confidence=0.9, level2=True)
+    exhaustive = topk_rule_find(data, sps, cps, **options)
+    assert len(exhaustive) > 0
+    assert [str(r) for r in topk_rule_find(data, sps, cps, best_first=True, **options)] == [str(r) for r in exhaustive]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from rule import Predicate, Rule, RuleExecutor
+from violation import ViolationDetector
+
+C0, C1, S = Predicate.newConst0, Predicate.newConst1, Predicate.newStruct
+
+@pytest.fixture
+def data(read_table):
+    data = read_table("tax_100.csv").drop(columns=["row_id"])
+    data.loc[0:14, "maritalstatus"] = None
+    return data
+
+def rules(sameTable:bool):
+    return [Rule(Xs = xs, y = y, sameTable = sameTable) for xs, y in [
+        ([C0("gender", "M")], C0("maritalstatus", "M")),
+        ([C0("gender", "M")], C0("haschild", "Y", "<>")),
+        ([C0("state", "OH", "<>"), C0("salary", "40000", ">")], C0("haschild", "N")),
+        ([S("zip")], S("city")),
+        ([S("zip")], S("state")),
+        ([S("state")], S("maritalstatus")),
+        ([S("state"), S("gender", "<>")], S("haschild", "<>")),
+        ([S("areacode"), S("salary", "<")], S("rate", ">=")),
+        ([C0("gender", "M"), C1("gender", "F")], S("maritalstatus")),
+        ([C1("haschild", "N"), S("state")], C0("maritalstatus", "M")),
+    ]]
+
+@pytest.mark.parametrize("sameTable", [True, False], ids=["sameTable", "crossTable"])
+def test_violations_are_the_failing_rows(data, sameTable):
+    t0, t1 = (data, None) if sameTable else (data.iloc[:60].reset_index(drop=True), data.iloc[40:].reset_index(drop=True))
+    counted = RuleExecutor(t0, t1).execute(rules(sameTable), progressBar=False)
+    detector = ViolationDetector(t0, t1)
+    found = rules(sameTable)
+    detected = detector.detect(found)
+    assert any(r.singleLine() for r in found) and any(not r.singleLine() for r in found)
+    for rule, expected in zip(found, counted):
+        ids = detected[rule]
+        assert len(ids) == expected.xSupp - expected.supp, expected
+        if not rule.singleLine():
+            assert len(np.unique(ids, axis=0)) == len(ids)
+            if sameTable:
+                assert np.all(ids[:, 0] != ids[:, 1])
+
+    # small chunks give the same pairs, each chunk within its bound
+    chunked = {rule:[] for rule in found}
+    for rule, ids in detector.violations(found, chunk=7):
+        assert 0 < len(ids) <= 7 or not rule.singleLine()
+        chunked[rule].append(ids)
+    for rule in found:
+        ids = detected[rule]
+        parts = chunked[rule]
+        together = np.concatenate(parts) if len(parts) > 0 else ids[:0]
+        if rule.singleLine():
+            assert together.tolist() == ids.tolist()
+        else:
+            assert sorted(map(tuple, together.tolist())) == sorted(map(tuple, ids.tolist()))
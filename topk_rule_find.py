@@ -1,61 +1,95 @@
-from typing import Callable, List, Tuple
-from rule import Predicate, Rule, RuleExecutor, Y
+import time
+import heapq
+import multiprocessing
+from typing import Callable, Dict, FrozenSet, List, Tuple, Union
+from rule import Predicate, Rule, RuleExecutor, Y, new_executor
 import pandas as pd
-from utils import countByValue, foreach, groupByKey, collect
-
-def all_structual_predicates(table:pd.DataFrame, ignore_column:Callable[[str], bool] = lambda c:False)->List[Predicate]:
-    return [Predicate.newStruct(c) for c in table.columns if not ignore_column(c)]
-
-def all_constant_predicates(table:pd.DataFrame, singleLine:bool, threshold:float = 0.1, 
-        ignore_column:Callable[[str], bool] = lambda c:False)->List[Tuple[Predicate]]:
-    cps:List[Tuple[Predicate]] = []
-    threshold = len(table) * threshold
-    for col in table.columns:
-        if ignore_column(col):
-            continue
-        cnt_map = countByValue(table[col])
-        for val, cnt in cnt_map.items():
-            if cnt >= threshold:
-                const = str(val)
-                if singleLine:
-                    cps.append((Predicate.newConst0(col, const), ))
-                else:
-                    cps.append((Predicate.newConst0(col, const), Predicate.newConst1(col, const)))
-    return cps
-
-def topk_rule_find(table:pd.DataFrame, structual_predicates:List[Predicate], constant_predicates:List[Tuple[Predicate]], 
+from utils import foreach, groupByKey, collect
+from greedy_rule_find import all_structual_predicates, all_constant_predicates
+from encoded_table import EncodedTable
+from sample_screen import SampleScreen
+
+# table may be an EncodedTable.cached store, shared by reruns with other cover/confidence/x_column
+def topk_rule_find(table:Union[pd.DataFrame, EncodedTable], structual_predicates:List[Predicate], constant_predicates:List[Tuple[Predicate]], 
         single_line:bool = True, multi_line:bool = True, topk:int = 1, cover:float = 0.01, confidence:float = 0.8,
         x_column:Callable[[str], bool] = lambda c:True, y_column:Callable[[str], bool] = lambda c:True,
-        level2:bool=False) -> List[Rule]:
-    results:List[Rule] = []
-    re = RuleExecutor(table)
+        level2:bool=False, engine:str = "sqlite", sample_size:int = 0, sample_delta:float = 0.01, 
+        workerNum:int = 1, report:List[Tuple[str, int, float]] = None, best_first:bool = False, max_depth:int = None) -> List[Rule]:
+    """
+    Ys are searched independently, by workerNum forked processes sharing the executor when workerNum > 1.
+    Results keep the order of the serial run. (Y, iterations, seconds) of every Y is appended to report when given.
+    best_first searches each Y by upper bounds of cover up to max_depth predicates (2 with level2, 1 otherwise)
+    """
+    re = new_executor(table, engine=engine)
+    screen = SampleScreen(re, table, engine=engine, sample_size=sample_size, delta=sample_delta) if sample_size > 0 else None
+    tasks:List[Tuple[Y, bool]] = []
     if single_line:
-        for Y in (ys[0] for ys in constant_predicates if all(y_column(c) for c in ys[0].columns)):
-            excluding_xs:List[Predicate] = []
-            while True:
-                print(f"single line find y = {Y} excluding_xs {excluding_xs}")
-                rules = find_rules([], constant_predicates, Y, excluding_xs, re, single_line=True, multi_line=False, topk=topk, cover=cover, confidence=confidence, x_column=x_column, level2=level2)
-                if len(rules) == 0:
-                    break
-                results.extend(rules)
-                foreach(rules, lambda r:excluding_xs.extend((x.negate() for x in r.Xs if not x.negative)))
-                excluding_xs = list(set(excluding_xs)) # distinct
+        tasks.extend(((ys[0], True) for ys in constant_predicates if all(y_column(c) for c in ys[0].columns)))
     if multi_line:
-        for Y in (y for y in structual_predicates if all(y_column(c) for c in y.columns)):
-            excluding_xs:List[Predicate] = []
-            while True:
-                print(f"multi_ line find y = {Y} excluding_xs {excluding_xs}")
-                rules = find_rules(structual_predicates, constant_predicates, Y, excluding_xs, re, single_line=False, multi_line=True, topk=topk, cover=cover, confidence=confidence, x_column=x_column, level2=level2)
-                if len(rules) == 0:
-                    break
-                results.extend(rules)
-                foreach(rules, lambda r:excluding_xs.extend((x.negate() for x in r.Xs if not x.negative)))
-                excluding_xs = list(set(excluding_xs)) # distinct
+        tasks.extend(((y, False) for y in structual_predicates if all(y_column(c) for c in y.columns)))
+    # arguments of _search_y shared by all Ys
+    context = dict(structual_predicates=structual_predicates, constant_predicates=constant_predicates, re=re, screen=screen, 
+        topk=topk, cover=cover, confidence=confidence, x_column=x_column, level2=level2, best_first=best_first, max_depth=max_depth)
+    if workerNum > 1 and len(tasks) > 1:
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise Exception("Parallel topk_rule_find needs the fork start method")
+        # initargs are inherited by forked workers with the executor and the encoded table, nothing is pickled but the Ys and the found rules
+        with multiprocessing.get_context("fork").Pool(min(workerNum, len(tasks)), initializer=_init_worker, initargs=(context, )) as pool:
+            searched = pool.map(_search_worker, tasks, chunksize=1)
+    else:
+        searched = [_search_y(task, context) for task in tasks]
+    results:List[Rule] = []
+    for (Y, _), (rules, iterations, seconds) in zip(tasks, searched):
+        print(f"y = {Y} {len(rules)} rules in {iterations} iterations {round(seconds, 3)}s")
+        if report is not None:
+            report.append((str(Y), iterations, seconds))
+        results.extend(rules)
     return results
 
+# context of topk_rule_find in a forked worker
+_worker_context = None
+
+def _init_worker(context:dict):
+    global _worker_context
+    _worker_context = context
+    if context["screen"] is not None:
+        context["screen"].reconnect()
+    elif hasattr(context["re"], "reconnect"):
+        context["re"].reconnect()
+
+def _search_worker(task:Tuple[Y, bool])->Tuple[List[Rule], int, float]:
+    return _search_y(task, _worker_context)
+
+def _search_y(task:Tuple[Y, bool], ctx:dict)->Tuple[List[Rule], int, float]:
+    """
+    rules of one Y, the number of find_rules calls and the wall time
+    """
+    Y, single_line = task
+    start = time.time()
+    structual_predicates = [] if single_line else ctx["structual_predicates"]
+    results:List[Rule] = []
+    excluding_xs:List[Predicate] = []
+    iterations = 0
+    while True:
+        iterations += 1
+        print(f"{'single line' if single_line else 'multi_ line'} find y = {Y} excluding_xs {excluding_xs}")
+        rules = find_rules(structual_predicates, ctx["constant_predicates"], Y, excluding_xs, ctx["re"], single_line=single_line, multi_line=not single_line, 
+            topk=ctx["topk"], cover=ctx["cover"], confidence=ctx["confidence"], x_column=ctx["x_column"], level2=ctx["level2"], screen=ctx["screen"],
+            best_first=ctx["best_first"], max_depth=ctx["max_depth"])
+        if len(rules) == 0:
+            break
+        results.extend(rules)
+        foreach(rules, lambda r:excluding_xs.extend((x.negate() for x in r.Xs if not x.negative)))
+        excluding_xs = list(dict.fromkeys(excluding_xs)) # distinct, in order of appearance
+    return results, iterations, time.time() - start
+
 def find_rules(structual_predicates:List[Predicate], constant_predicates:List[Tuple[Predicate]], 
         Y:Y, excluding_xs:List[Predicate], re:RuleExecutor, single_line:bool, multi_line:bool, topk:int = 1, 
-        cover:float = 0.01, confidence:float = 0.8, x_column:Callable[[str], bool] = lambda c:True, level2:bool=False)->List[Rule]:
+        cover:float = 0.01, confidence:float = 0.8, x_column:Callable[[str], bool] = lambda c:True, level2:bool=False, 
+        screen:SampleScreen = None, best_first:bool = False, max_depth:int = None)->List[Rule]:
+    if best_first:
+        return _best_first_rules(structual_predicates, constant_predicates, Y, excluding_xs, re, single_line, multi_line, topk, 
+            cover, confidence, x_column, (2 if level2 else 1) if max_depth is None else max_depth, screen)
     rules:List[Rule] = []; precursors:List[Rule] = []
 
     def put_precursor(*xs:Predicate):
@@ -65,7 +99,7 @@ def find_rules(structual_predicates:List[Predicate], constant_predicates:List[Tu
         precursors.append(Rule(Xs = excluding_xs + list(xs), y = Y))
     def execute_precursors():
         if len(precursors) > 0:
-            run = re.execute(precursors)
+            run = re.execute(precursors) if screen is None else screen.execute(precursors, cover, confidence)
             foreach(run, lambda r:r.ok(cover, confidence, lambda t:rules.append(t)))
             precursors.clear()
 
@@ -102,6 +136,103 @@ def find_rules(structual_predicates:List[Predicate], constant_predicates:List[Tu
         rules = sorted(rules, key=lambda r:r.cover(), reverse=True)
     return rules[:topk]
     
+def _best_first_rules(structual_predicates:List[Predicate], constant_predicates:List[Tuple[Predicate]], 
+        Y:Y, excluding_xs:List[Predicate], re:RuleExecutor, single_line:bool, multi_line:bool, topk:int, 
+        cover:float, confidence:float, x_column:Callable[[str], bool], max_depth:int, screen:SampleScreen)->List[Rule]:
+    """
+    find_rules visiting the candidates of each level by decreasing upper bound of cover.
+    Support is anti-monotone, so a candidate can not cover more than its parent nor than the level-1 rule of any of its items.
+    Candidates whose bound is below the k-th best cover found so far are not evaluated.
+    The scaled cover of a rule rejected by the sample screen is no bound, such a rule bounds nothing.
+    Level d candidates are the ordered d-tuples of items of one kind that find_rules with level2 enumerates for d = 2,
+    ties are broken by that enumeration order, so the result is the one of the exhaustive search
+    """
+    # an item is one predicate, or the t0/t1 pair of a multi-line constant predicate
+    items:List[Tuple[Predicate]] = []
+    kinds:List[int] = []
+    if single_line:
+        items.extend(((xs[0], ) for xs in constant_predicates))
+        kinds.extend((0 for _ in constant_predicates))
+    if multi_line:
+        items.extend(((x, ) for x in structual_predicates))
+        kinds.extend((1 for _ in structual_predicates))
+        items.extend((tuple(xs) for xs in constant_predicates))
+        kinds.extend((2 for _ in constant_predicates))
+    def usable(item:Tuple[Predicate])->bool:
+        return all(x.compatible(*excluding_xs) and x.compatible(Y) and all((x_column(c) for c in x.columns)) for x in item)
+
+    # (-cover, enumeration key, rule) of the ok rules found
+    found:List[tuple] = []
+    evaluated:Dict[FrozenSet[Predicate], Rule] = {}
+    def evaluate(candidates:List[Tuple[tuple, Rule]]):
+        fresh = {}
+        for _, rule in candidates:
+            xs = frozenset(rule.Xs)
+            if xs not in evaluated and xs not in fresh:
+                fresh[xs] = rule
+        if len(fresh) > 0:
+            if screen is None:
+                re.execute(list(fresh.values()))
+            else:
+                screen.execute(list(fresh.values()), cover, confidence)
+            evaluated.update(fresh)
+        for key, rule in candidates:
+            done = evaluated[frozenset(rule.Xs)]
+            rule.rowSize, rule.xSupp, rule.supp, rule.estimated = done.rowSize, done.xSupp, done.supp, done.estimated
+            if rule.ok(cover, confidence):
+                found.append((-rule.cover(), key, rule))
+    def upper(rule:Rule)->float:
+        return 1. if rule.estimated else rule.cover()
+    def threshold()->float:
+        if len(found) < topk:
+            return cover
+        return max(cover, sorted(found, key=lambda f:f[:2])[topk-1][2].cover())
+
+    # level 1 is evaluated in full, its covers bound every deeper candidate
+    level = [((1, (i, )), Rule(Xs = excluding_xs + list(item), y = Y)) for i, item in enumerate(items) if usable(item)]
+    evaluate(level)
+    itemCover = {key[1][0]:upper(rule) for key, rule in level}
+    depth = 1
+    parents = level
+    while len(found) < topk and depth < max_depth:
+        depth += 1
+        heap:List[tuple] = []
+        bar = threshold()
+        for (_, positions), parent in parents:
+            if upper(parent) < bar:
+                continue
+            last = items[positions[-1]]
+            for i, item in enumerate(items):
+                if i not in itemCover or kinds[i] != kinds[positions[0]]:
+                    continue
+                if depth == 2:
+                    # same pairs as find_rules with level2
+                    if not item[0].compatible(last[0]):
+                        continue
+                elif not all(item[0].compatible(items[j][0]) for j in positions):
+                    continue
+                bound = min(upper(parent), itemCover[i])
+                if bound >= bar:
+                    key = (depth, positions + (i, ))
+                    heapq.heappush(heap, (-bound, key, parent.Xs + list(item)))
+        parents = []
+        while len(heap) > 0:
+            bar = threshold()
+            if -heap[0][0] < bar:
+                break
+            batch:List[Tuple[tuple, Rule]] = []
+            while len(heap) > 0 and -heap[0][0] >= bar and len(batch) < RuleExecutor.MAX_Y_PER_SQL:
+                _, key, xs = heapq.heappop(heap)
+                batch.append((key, Rule(Xs = xs, y = Y)))
+            evaluate(batch)
+            parents.extend(batch)
+        parents.sort(key=lambda p:p[0])
+
+    if depth == 1 and len(found) < topk:
+        # find_rules returns the level-1 rules unsorted when they are fewer than topk
+        return [f[2] for f in sorted(found, key=lambda f:f[1])]
+    return [f[2] for f in sorted(found, key=lambda f:f[:2])[:topk]]
+
 if __name__ == '__main__':
     data = pd.read_csv(r"D:\work\20221104_规则发现查错效果分析\repy\data2\beers\dirty_l.csv", dtype=str)
     print(data)
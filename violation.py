@@ -0,0 +1,126 @@
+"""
+Apply discovered rules to a table: the rows (single-line) or tuple pairs (multi-line) on which Xs hold and y does not.
+Rules sharing their Xs are checked on one enumeration of the pairs satisfying Xs. Pairs are enumerated group by group
+of the partition made by the equality structural predicates of Xs, in chunks of bounded size.
+The number of violations of a rule is rule.xSupp - rule.supp.
+"""
+
+from typing import Dict, Iterator, List, Tuple, Union
+import numpy as np
+import pandas as pd
+from rule import Predicate, Rule, group_by_lhs
+from encoded_table import EncodedTable, NULL_CODE
+from pair_counter import NO_GROUP, COMPARE
+from numpy_executor import NumpyRuleExecutor
+
+class ViolationDetector:
+    # max number of pairs enumerated at once
+    PAIR_CHUNK = 1 << 22
+
+    def __init__(self, t0:Union[pd.DataFrame, EncodedTable], t1:Union[pd.DataFrame, EncodedTable] = None, cache_bytes:int = 1 << 28) -> None:
+        # the executor evaluates and caches the masks and partitions of Xs
+        self.executor = NumpyRuleExecutor(t0, t1, cache_bytes)
+        self.tab0 = self.executor.tab0
+        self.tab1 = self.executor.tab1
+
+    def _row_holds(self, p:Predicate)->np.ndarray:
+        if p.t1_col is None:
+            return self.executor._row_mask(self.tab0, p.t0_col, p)
+        return self.executor._row_mask(self.tab1, p.t1_col, p)
+
+    def _pair_holds(self, p:Predicate, r0:np.ndarray, r1:np.ndarray, rowHolds:Dict[Predicate, np.ndarray])->np.ndarray:
+        if p.isConst():
+            holds = rowHolds.get(p)
+            if holds is None:
+                holds = self._row_holds(p)
+                rowHolds[p] = holds
+            return holds[r0] if p.t1_col is None else holds[r1]
+        if p.isRange():
+            return COMPARE[p.operator](NumpyRuleExecutor._values(self.tab0, p.t0_col)[r0], NumpyRuleExecutor._values(self.tab1, p.t1_col)[r1])
+        a = self.tab0.codes[p.t0_col][r0]
+        b = self.tab0.translate(p.t0_col, self.tab1, p.t1_col)[r1]
+        if p.operator == '=':
+            return (a == b) & (a != NULL_CODE)
+        elif p.operator == '<>':
+            return (a != b) & (a != NULL_CODE) & (b != NULL_CODE)
+        else:
+            raise Exception('NoImpl ' + p.operator)
+
+    def _single_line(self, rules:List[Rule], chunk:int)->Iterator[Tuple[Rule, np.ndarray]]:
+        xMask = self.executor._state(rules[0].Xs).m0
+        for rule in rules:
+            rows = np.flatnonzero(xMask & ~self._row_holds(rule.y))
+            for start in range(0, len(rows), chunk):
+                yield rule, rows[start:start+chunk]
+
+    def _pairs(self, rules:List[Rule], chunk:int)->Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        chunks (r0, r1) of the pairs on which the Xs of rules hold
+        """
+        head = rules[0]
+        state = self.executor._state(head.Xs)
+        rows0 = np.flatnonzero(state.m0 & (state.g0 != NO_GROUP))
+        rows1 = np.flatnonzero(state.m1 & (state.g1 != NO_GROUP))
+        r0 = rows0[np.argsort(state.g0[rows0], kind='stable')]
+        r1 = rows1[np.argsort(state.g1[rows1], kind='stable')]
+        k0, k1 = state.g0[r0], state.g1[r1]
+        # every t0 row is paired with the t1 rows of its group, r1[start1[g]:start1[g]+c1[g]]
+        start1 = np.searchsorted(k1, k0, 'left')
+        per = np.searchsorted(k1, k0, 'right') - start1
+        ends = np.cumsum(per)
+        rowHolds:Dict[Predicate, np.ndarray] = {}
+        a = 0
+        while a < len(r0):
+            # at least one t0 row, then as many as fit in chunk pairs
+            b = max(a + 1, int(np.searchsorted(ends, (ends[a-1] if a > 0 else 0) + chunk, 'right')))
+            n = per[a:b]
+            total = int(n.sum())
+            if total > 0:
+                left = np.repeat(r0[a:b], n)
+                offsets = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+                right = r1[np.repeat(start1[a:b], n) + offsets]
+                ok = np.ones(total, dtype=bool)
+                for p in state.others:
+                    ok &= self._pair_holds(p, left, right, rowHolds)
+                if head.sameTable:
+                    ok &= left != right
+                yield left[ok], right[ok]
+            a = b
+
+    def _multi_line(self, rules:List[Rule], chunk:int)->Iterator[Tuple[Rule, np.ndarray]]:
+        rowHolds:Dict[Predicate, np.ndarray] = {}
+        for left, right in self._pairs(rules, chunk):
+            for rule in rules:
+                violated = ~self._pair_holds(rule.y, left, right, rowHolds)
+                if violated.any():
+                    yield rule, np.stack((left[violated], right[violated]), axis=1)
+
+    def violations(self, rules:List[Rule], chunk:int = None)->Iterator[Tuple[Rule, np.ndarray]]:
+        """
+        yields (rule, row ids) for single-line rules and (rule, k x 2 array of (t0 row id, t1 row id)) for multi-line rules,
+        a rule may come several times with at most chunk ids each. Row ids are positions in the tables, as RuleExecutor's id column
+        """
+        chunk = ViolationDetector.PAIR_CHUNK if chunk is None else chunk
+        for group in group_by_lhs(rules):
+            if group[0].singleLine():
+                yield from self._single_line(group, chunk)
+            else:
+                yield from self._multi_line(group, chunk)
+
+    def detect(self, rules:List[Rule])->Dict[Rule, np.ndarray]:
+        """
+        all violations of every rule in memory, for rule sets whose violations are known to be few
+        """
+        parts:Dict[Rule, List[np.ndarray]] = {rule:[] for rule in rules}
+        for rule, ids in self.violations(rules):
+            parts[rule].append(ids)
+        return {rule:(np.concatenate(ps) if len(ps) > 0 else (np.empty(0, dtype=np.int64) if rule.singleLine() else np.empty((0, 2), dtype=np.int64)))
+            for rule, ps in parts.items()}
+
+if __name__ == '__main__':
+    data = pd.read_csv("testdata/relation.csv", dtype=str)
+    rule1 = Rule(Xs = [Predicate.newConst0("ct", "MH")], y = Predicate.newConst0("ac", "908"))
+    rule2 = Rule(Xs = [Predicate.newStruct("cc")], y = Predicate.newStruct("ac"))
+    for rule, ids in ViolationDetector(data).detect([rule1, rule2]).items():
+        print(rule.__str__(statistics=False))
+        print(ids.tolist())